@@ -12,6 +12,10 @@ class ChainConfig:
     wss_url: str
     explorer: str
     multicall_address: str | None = None
+    multicall_aggregate3: bool = True  # False for Multicall2-only deployments
+    rpc_max_in_flight: int = 8  # concurrent multicall batches (1 = sequential)
+    rpc_target_latency: float = 1.0  # seconds per batch the adaptive sizer aims for
+    finality_depth: int = 32  # blocks kept in the reorg journal before they count as final
 
 
 @dataclass
@@ -25,6 +29,51 @@ class PoolConfig:
     token1_decimals: int
     pool_id: str | None = None  # for Uniswap V4
     tick_lens_address: str | None = None
+    tick_spacing: int | None = None  # required for Uniswap V4 pools with non-standard fees
+    quote_is_token0: bool = True  # depth is measured in the quote token (USDT)
+    name: str | None = None  # label shown in the UI (defaults to token1/token0)
+
+
+@dataclass
+class SnapshotConfig:
+    bitmap_batch_size: int = 200  # tickBitmap words per multicall
+    tick_batch_size: int = 100  # ticks() reads per multicall
+    lens_batch_size: int = 20  # TickLens words per multicall (each word returns up to 256 ticks)
+    cache_dir: str | None = ".snapshot_cache"  # binary snapshot cache for warm starts (None disables)
+    save_interval: float = 60.0  # seconds between cache writes while running
+    max_catch_up_blocks: int = 100_000  # older caches are discarded in favour of a full snapshot
+    pool_concurrency: int = 4  # pools snapshotted at once in multi-pool mode (they share the multicall window)
+
+
+@dataclass
+class RuntimeConfig:
+    mode: str = "asyncio"  # asyncio (single event loop) or threads
+    ingest_queue_size: int = 10_000  # raw logs buffered before the socket reader waits
+    display_queue_size: int = 500  # display feed keeps only the newest events beyond this
+    spool_size: int = 100_000  # raw logs held in memory between socket and apply loop; the rest spills to disk
+    spool_dir: str | None = None  # directory for spilled logs (system temp dir by default)
+    record_path: str | None = None  # record start snapshots and applied logs here for offline replay (.gz compresses)
+
+
+@dataclass
+class UIConfig:
+    layout: str = "single"  # single (one pool, switchable) or grid (all pools side by side)
+    frame_budget: float = 0.1  # minimum seconds between redraws; idle pools are not redrawn at all
+
+
+@dataclass
+class OutputConfig:
+    mode: str = "console"  # console (rich UI) or headless (machine-readable stream, no rich)
+    format: str = "json"  # json (newline-delimited) or msgpack
+    target: str = "-"  # - for stdout, unix:<path> for a Unix socket, else a file path (appended)
+    interval: float = 0.1  # seconds over which updates are coalesced into one frame
+
+
+@dataclass
+class MetricsConfig:
+    host: str = "127.0.0.1"
+    port: int = 0  # Prometheus-text endpoint at /metrics (0 disables)
+    summary_interval: float = 60.0  # seconds between metric summaries in monitor.log (0 disables)
 
 
 @dataclass
@@ -32,6 +81,12 @@ class AppConfig:
     chain: ChainConfig
     pool: PoolConfig
     tokens: List[str] = field(default_factory=list)
+    snapshot: SnapshotConfig = field(default_factory=SnapshotConfig)
+    pools: List[PoolConfig] = field(default_factory=list)  # every monitored pool; pools[0] is ``pool``
+    ui: UIConfig = field(default_factory=UIConfig)
+    runtime: RuntimeConfig = field(default_factory=RuntimeConfig)
+    output: OutputConfig = field(default_factory=OutputConfig)
+    metrics: MetricsConfig = field(default_factory=MetricsConfig)
 
 
 def _load_config_from_file(path: Path) -> dict:
@@ -52,6 +107,30 @@ _CONFIG_DATA = _load_config_from_file(_CONFIG_PATH)
 chain_data = _CONFIG_DATA.get("chain", {})
 pool_data = _CONFIG_DATA.get("pool", {})
 tokens_data = _CONFIG_DATA.get("tokens", [])
+snapshot_data = _CONFIG_DATA.get("snapshot", {})
+pools_data = _CONFIG_DATA.get("pools", [])
+ui_data = _CONFIG_DATA.get("ui", {})
+runtime_data = _CONFIG_DATA.get("runtime", {})
+output_data = _CONFIG_DATA.get("output", {})
+metrics_data = _CONFIG_DATA.get("metrics", {})
+
+
+def _pool_from_dict(data: dict) -> PoolConfig:
+    """PoolConfig for one entry of the ``pools`` list in config.json (no env overrides)."""
+    return PoolConfig(
+        pool_address=data["pool_address"],
+        protocol=data.get("protocol", "pancake_v3"),
+        token0=data.get("token0", "USDT"),
+        token1=data.get("token1", "TOKEN"),
+        fee=int(data.get("fee", 500)),
+        pool_id=data.get("pool_id"),
+        token0_decimals=int(data.get("token0_decimals", 18)),
+        token1_decimals=int(data.get("token1_decimals", 18)),
+        tick_lens_address=data.get("tick_lens_address"),
+        quote_is_token0=str(data.get("quote_is_token0", True)).lower() not in ("0", "false", "no"),
+        tick_spacing=int(data.get("tick_spacing", 0)) or None,
+        name=data.get("name"),
+    )
 
 
 DEFAULT_CONFIG = AppConfig(
@@ -61,6 +140,10 @@ DEFAULT_CONFIG = AppConfig(
         rpc_url=_get_env_or_default("RPC_URL", chain_data.get("rpc_url", "https://bsc-dataseed.binance.org")),
         wss_url=_get_env_or_default("WSS_URL", chain_data.get("wss_url", "wss://bsc-ws-node.nariox.org:443")),
         explorer=_get_env_or_default("EXPLORER_URL", chain_data.get("explorer", "https://bscscan.com/tx/")),
+        multicall_aggregate3=_get_env_or_default("MULTICALL_AGGREGATE3", str(chain_data.get("multicall_aggregate3", True))).lower() not in ("0", "false", "no"),
+        rpc_max_in_flight=int(_get_env_or_default("RPC_MAX_IN_FLIGHT", str(chain_data.get("rpc_max_in_flight", 8)))),
+        rpc_target_latency=float(_get_env_or_default("RPC_TARGET_LATENCY", str(chain_data.get("rpc_target_latency", 1.0)))),
+        finality_depth=int(_get_env_or_default("FINALITY_DEPTH", str(chain_data.get("finality_depth", 32)))),
     ),
     pool=PoolConfig(
         pool_address=_get_env_or_default("POOL_ADDRESS", pool_data.get("pool_address")),
@@ -69,7 +152,14 @@ DEFAULT_CONFIG = AppConfig(
         token1=_get_env_or_default("TOKEN1_SYMBOL", pool_data.get("token1", "TOKEN")),
         fee=int(_get_env_or_default("POOL_FEE", str(pool_data.get("fee", 500)))) if _get_env_or_default("POOL_FEE", None) or pool_data.get("fee") is not None else 500,
         pool_id=_get_env_or_default("POOL_ID", pool_data.get("pool_id")),
+        token0_decimals=int(_get_env_or_default("TOKEN0_DECIMALS", str(pool_data.get("token0_decimals", 18)))),
+        token1_decimals=int(_get_env_or_default("TOKEN1_DECIMALS", str(pool_data.get("token1_decimals", 18)))),
+        tick_lens_address=_get_env_or_default("TICK_LENS_ADDRESS", pool_data.get("tick_lens_address")),
+        quote_is_token0=_get_env_or_default("QUOTE_IS_TOKEN0", str(pool_data.get("quote_is_token0", True))).lower() not in ("0", "false", "no"),
+        tick_spacing=int(_get_env_or_default("POOL_TICK_SPACING", str(pool_data.get("tick_spacing", 0)))) or None,
+        name=_get_env_or_default("POOL_NAME", pool_data.get("name")),
     ),
+    pools=[_pool_from_dict(data) for data in pools_data],
     tokens=(
         _get_env_or_default("TOKENS", None).split(",")
         if _get_env_or_default("TOKENS", None)
@@ -77,8 +167,43 @@ DEFAULT_CONFIG = AppConfig(
         if tokens_data
         else ["USDT", "TOKEN"]
     ),
+    snapshot=SnapshotConfig(
+        bitmap_batch_size=int(_get_env_or_default("SNAPSHOT_BITMAP_BATCH_SIZE", str(snapshot_data.get("bitmap_batch_size", 200)))),
+        tick_batch_size=int(_get_env_or_default("SNAPSHOT_TICK_BATCH_SIZE", str(snapshot_data.get("tick_batch_size", 100)))),
+        lens_batch_size=int(_get_env_or_default("SNAPSHOT_LENS_BATCH_SIZE", str(snapshot_data.get("lens_batch_size", 20)))),
+        cache_dir=_get_env_or_default("SNAPSHOT_CACHE_DIR", snapshot_data.get("cache_dir", ".snapshot_cache")) or None,
+        save_interval=float(_get_env_or_default("SNAPSHOT_SAVE_INTERVAL", str(snapshot_data.get("save_interval", 60.0)))),
+        max_catch_up_blocks=int(_get_env_or_default("SNAPSHOT_MAX_CATCH_UP_BLOCKS", str(snapshot_data.get("max_catch_up_blocks", 100_000)))),
+        pool_concurrency=int(_get_env_or_default("SNAPSHOT_POOL_CONCURRENCY", str(snapshot_data.get("pool_concurrency", 4)))),
+    ),
+    ui=UIConfig(
+        layout=_get_env_or_default("UI_LAYOUT", ui_data.get("layout", "single")),
+        frame_budget=float(_get_env_or_default("UI_FRAME_BUDGET", str(ui_data.get("frame_budget", 0.1)))),
+    ),
+    runtime=RuntimeConfig(
+        mode=_get_env_or_default("RUNTIME_MODE", runtime_data.get("mode", "asyncio")),
+        ingest_queue_size=int(_get_env_or_default("RUNTIME_INGEST_QUEUE_SIZE", str(runtime_data.get("ingest_queue_size", 10_000)))),
+        display_queue_size=int(_get_env_or_default("RUNTIME_DISPLAY_QUEUE_SIZE", str(runtime_data.get("display_queue_size", 500)))),
+        spool_size=int(_get_env_or_default("RUNTIME_SPOOL_SIZE", str(runtime_data.get("spool_size", 100_000)))),
+        spool_dir=_get_env_or_default("RUNTIME_SPOOL_DIR", runtime_data.get("spool_dir")) or None,
+        record_path=_get_env_or_default("RECORD_PATH", runtime_data.get("record_path")) or None,
+    ),
+    output=OutputConfig(
+        mode=_get_env_or_default("OUTPUT_MODE", output_data.get("mode", "console")),
+        format=_get_env_or_default("OUTPUT_FORMAT", output_data.get("format", "json")),
+        target=_get_env_or_default("OUTPUT_TARGET", output_data.get("target", "-")),
+        interval=float(_get_env_or_default("OUTPUT_INTERVAL", str(output_data.get("interval", 0.1)))),
+    ),
+    metrics=MetricsConfig(
+        host=_get_env_or_default("METRICS_HOST", metrics_data.get("host", "127.0.0.1")),
+        port=int(_get_env_or_default("METRICS_PORT", str(metrics_data.get("port", 0)))),
+        summary_interval=float(_get_env_or_default("METRICS_SUMMARY_INTERVAL", str(metrics_data.get("summary_interval", 60.0)))),
+    ),
 )
 
 
-if not DEFAULT_CONFIG.pool.pool_address:
-    raise ValueError("POOL_ADDRESS must be provided via environment variables or config.json")
+# 配置了多池列表 (pools) 时以列表为准，pools[0] 同时作为默认 pool；否则使用单池配置
+if DEFAULT_CONFIG.pools:
+    DEFAULT_CONFIG.pool = DEFAULT_CONFIG.pools[0]
+elif DEFAULT_CONFIG.pool.pool_address:
+    DEFAULT_CONFIG.pools = [DEFAULT_CONFIG.pool]
@@ -0,0 +1,110 @@
+"""Fixed-offset decoding of pool event payloads.
+
+Event data is a sequence of 32-byte ABI words, so individual fields can be
+sliced out of a memoryview directly instead of going through eth_abi.decode.
+Indexed fields (V3 / PancakeSwap ticks) are read from the topics.
+"""
+
+from typing import Callable, Dict, Sequence
+
+from eth_utils import keccak
+
+WORD_SIZE = 32
+_INT24_SIGN_BIT = 1 << 23
+_INT24_RANGE = 1 << 24
+
+
+def log_data(raw_log: dict) -> memoryview:
+    data = raw_log.get("data", "0x")
+    return memoryview(bytes.fromhex(data[2:]) if isinstance(data, str) else bytes(data))
+
+
+def log_block_number(raw_log: dict) -> int:
+    block_number = raw_log.get("blockNumber", 0)
+    return int(block_number, 16) if isinstance(block_number, str) else block_number
+
+
+def log_index(raw_log: dict) -> int:
+    index = raw_log.get("logIndex", 0)
+    return int(index, 16) if isinstance(index, str) else index
+
+
+def read_uint(data: bytes | memoryview, word: int) -> int:
+    offset = word * WORD_SIZE
+    return int.from_bytes(data[offset : offset + WORD_SIZE], "big")
+
+
+def read_int(data: bytes | memoryview, word: int) -> int:
+    # int24/int128/int256 are all sign-extended to the full word
+    offset = word * WORD_SIZE
+    return int.from_bytes(data[offset : offset + WORD_SIZE], "big", signed=True)
+
+
+def read_uint128(data: bytes | memoryview, word: int) -> int:
+    # 高 16 字节恒为 0，只读低 16 字节
+    offset = word * WORD_SIZE + 16
+    return int.from_bytes(data[offset : offset + 16], "big")
+
+
+def read_int24(data: bytes | memoryview, word: int) -> int:
+    # 符号扩展到整个 word，低 3 字节已经包含完整的值和符号
+    offset = word * WORD_SIZE + 29
+    return int.from_bytes(data[offset : offset + 3], "big", signed=True)
+
+
+def topic_int24(topic: str | bytes) -> int:
+    """Signed int24 stored in an indexed topic (hex string or raw bytes)."""
+    value = int(topic[-6:], 16) if isinstance(topic, str) else int.from_bytes(topic[-3:], "big")
+    return value - _INT24_RANGE if value & _INT24_SIGN_BIT else value
+
+
+def decode_swap(data: bytes) -> tuple[int, int, int]:
+    """(sqrtPriceX96, liquidity, tick) of a V3 / PancakeSwap V3 / V4 Swap payload.
+
+    All three layouts start with amount0, amount1, sqrtPriceX96, liquidity, tick;
+    PancakeSwap appends protocol fees and V4 appends the swap fee.
+    """
+    return read_uint(data, 2), read_uint(data, 3), read_int(data, 4)
+
+
+def event_topic(signature: str) -> str:
+    return "0x" + keccak(text=signature).hex()
+
+
+# (lower_tick, upper_tick, liquidity_delta) from a liquidity log's topics and data
+LiquidityDecoder = Callable[[Sequence[str], memoryview], tuple[int, int, int]]
+
+
+def decode_v3_mint(topics: Sequence[str], data: memoryview) -> tuple[int, int, int]:
+    # Mint(address sender, address indexed owner, int24 indexed tickLower, int24 indexed tickUpper,
+    #      uint128 amount, uint256 amount0, uint256 amount1)
+    return topic_int24(topics[2]), topic_int24(topics[3]), read_uint128(data, 1)
+
+
+def decode_v3_burn(topics: Sequence[str], data: memoryview) -> tuple[int, int, int]:
+    # Burn(address indexed owner, int24 indexed tickLower, int24 indexed tickUpper,
+    #      uint128 amount, uint256 amount0, uint256 amount1)
+    return topic_int24(topics[2]), topic_int24(topics[3]), -read_uint128(data, 0)
+
+
+def decode_v4_modify_liquidity(topics: Sequence[str], data: memoryview) -> tuple[int, int, int]:
+    # ModifyLiquidity(bytes32 indexed id, address indexed sender, int24 tickLower, int24 tickUpper,
+    #                 int256 liquidityDelta, bytes32 salt)
+    return read_int24(data, 0), read_int24(data, 1), read_int(data, 2)
+
+
+V3_MINT_TOPIC = event_topic("Mint(address,address,int24,int24,uint128,uint256,uint256)")
+V3_BURN_TOPIC = event_topic("Burn(address,int24,int24,uint128,uint256,uint256)")
+V3_SWAP_TOPIC = event_topic("Swap(address,address,int256,int256,uint160,uint128,int24)")
+PANCAKE_SWAP_TOPIC = event_topic("Swap(address,address,int256,int256,uint160,uint128,int24,uint128,uint128)")
+V4_MODIFY_LIQUIDITY_TOPIC = event_topic("ModifyLiquidity(bytes32,address,int24,int24,int256,bytes32)")
+V4_SWAP_TOPIC = event_topic("Swap(bytes32,address,int128,int128,uint160,uint128,int24,uint24)")
+
+# topic0 -> (event_type, decoder)，V3 与 PancakeSwap V3 的 Mint/Burn 布局相同
+V3_LIQUIDITY_DECODERS: Dict[str, tuple[str, LiquidityDecoder]] = {
+    V3_MINT_TOPIC: ("Mint", decode_v3_mint),
+    V3_BURN_TOPIC: ("Burn", decode_v3_burn),
+}
+V4_LIQUIDITY_DECODERS: Dict[str, tuple[str, LiquidityDecoder]] = {
+    V4_MODIFY_LIQUIDITY_TOPIC: ("ModifyLiquidity", decode_v4_modify_liquidity),
+}
@@ -0,0 +1,187 @@
+import math
+from functools import lru_cache
+from typing import Iterable
+
+import numpy as np
+
+from app.protocols.bitmap import MAX_TICK, MIN_TICK
+from app.types import AdaptiveScale
+
+
+class SqrtPriceTable:
+    """sqrt(1.0001^tick) for every usable tick of one spacing, plus decimal scaling factors."""
+
+    def __init__(self, tick_spacing: int, token0_decimals: int, token1_decimals: int):
+        self.tick_spacing = tick_spacing
+        self.min_tick = -(-MIN_TICK // tick_spacing) * tick_spacing
+        max_tick = (MAX_TICK // tick_spacing) * tick_spacing
+        ticks = np.arange(self.min_tick, max_tick + 1, tick_spacing, dtype=np.float64)
+        self.sqrt_prices = np.power(1.0001, ticks / 2)
+        self.token0_unit = 10.0 ** token0_decimals
+        self.token1_unit = 10.0 ** token1_decimals
+        self.decimal_correction = 10.0 ** (token0_decimals - token1_decimals)
+
+    def lookup(self, ticks: np.ndarray) -> np.ndarray:
+        index = (ticks - self.min_tick) // self.tick_spacing
+        return self.sqrt_prices[np.clip(index, 0, len(self.sqrt_prices) - 1)]
+
+
+@lru_cache(maxsize=16)
+def sqrt_price_table(tick_spacing: int, token0_decimals: int, token1_decimals: int) -> SqrtPriceTable:
+    return SqrtPriceTable(tick_spacing, token0_decimals, token1_decimals)
+
+
+class DepthEngine:
+    """Exact quote-token depth from active liquidity ranges, computed over NumPy arrays.
+
+    Prices are expressed as the base token priced in the quote token. With
+    ``quote_is_token0`` the quote sits in ranges above the current tick (amount0),
+    otherwise in ranges below it (amount1).
+    """
+
+    def __init__(self, tick_spacing: int, token0_decimals: int, token1_decimals: int, quote_is_token0: bool):
+        self.tick_spacing = tick_spacing
+        self.quote_is_token0 = quote_is_token0
+        self.table = sqrt_price_table(tick_spacing, token0_decimals, token1_decimals)
+
+    def price(self, tick: int) -> float:
+        """Base token price in quote units at ``tick``."""
+        token1_per_token0 = math.pow(1.0001, tick) * self.table.decimal_correction
+        return 1 / token1_per_token0 if self.quote_is_token0 else token1_per_token0
+
+    def tick_for_price(self, price: float) -> int:
+        """Spacing-aligned tick whose price is closest to ``price`` (clamped to the usable range)."""
+        token1_per_token0 = 1 / price if self.quote_is_token0 else price
+        tick = math.log(token1_per_token0 / self.table.decimal_correction) / math.log(1.0001)
+        aligned = round(tick / self.tick_spacing) * self.tick_spacing
+        max_tick = self.table.min_tick + (len(self.table.sqrt_prices) - 1) * self.tick_spacing
+        return min(max(aligned, self.table.min_tick), max_tick)
+
+    def visible_tick_range(self, current_tick: int | None, min_price: float, max_price: float) -> tuple[int, int]:
+        """Tick range [lower, upper) holding quote liquidity between ``min_price`` and the current price."""
+        if self.quote_is_token0:
+            far_tick = self.tick_for_price(min_price) + self.tick_spacing
+            if current_tick is None:
+                return self.tick_for_price(max_price), far_tick
+            return (current_tick // self.tick_spacing) * self.tick_spacing, far_tick
+        far_tick = self.tick_for_price(min_price)
+        if current_tick is None:
+            return far_tick, self.tick_for_price(max_price)
+        return far_tick, (current_tick // self.tick_spacing + 1) * self.tick_spacing
+
+    def quote_amounts(
+        self,
+        lower_ticks: np.ndarray,
+        upper_ticks: np.ndarray,
+        liquidity: np.ndarray,
+        sqrt_price: float | None,
+    ) -> np.ndarray:
+        """Quote-token amount (human units) held by each liquidity range at ``sqrt_price``.
+
+        ``sqrt_price`` is sqrt(token1/token0) in raw units; ``None`` (no price yet)
+        counts every range as entirely on the quote side.
+        """
+        sqrt_lower = self.table.lookup(lower_ticks)
+        sqrt_upper = self.table.lookup(upper_ticks)
+        if self.quote_is_token0:
+            sqrt_current = sqrt_lower if sqrt_price is None else np.maximum(sqrt_lower, sqrt_price)
+            raw = liquidity * np.clip(1 / sqrt_current - 1 / sqrt_upper, 0, None)
+            return raw / self.table.token0_unit
+        sqrt_current = sqrt_upper if sqrt_price is None else np.minimum(sqrt_upper, sqrt_price)
+        raw = liquidity * np.clip(sqrt_current - sqrt_lower, 0, None)
+        return raw / self.table.token1_unit
+
+    def edge_ticks(self, scale: AdaptiveScale) -> np.ndarray:
+        """Ticks of the bucket price edges of ``scale``, ascending; compute once per scale and pass to ``bucket_depth``."""
+        edge_count = self.bucket_count(scale)
+        edges = np.fromiter(
+            (self.tick_for_price(scale.min_price + i * scale.step) for i in range(edge_count)),
+            dtype=np.int64,
+            count=edge_count,
+        )
+        return np.sort(edges)
+
+    def bucket_depth(
+        self,
+        segments: Iterable[tuple[int, int, int]],
+        sqrt_price: float | None,
+        edge_ticks: np.ndarray,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Split active-liquidity segments at bucket edges and sum quote amounts per bucket.
+
+        ``edge_ticks`` comes from ``edge_ticks(scale)``. Returns (bucket_indices,
+        depths) sorted by bucket index.
+        """
+        seg_lower, seg_upper, seg_liquidity = [], [], []
+        for lower, upper, liquidity in segments:
+            seg_lower.append(lower)
+            seg_upper.append(upper)
+            seg_liquidity.append(float(liquidity))
+        if not seg_lower:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        starts = np.asarray(seg_lower, dtype=np.int64)
+        ends = np.asarray(seg_upper, dtype=np.int64)
+        liquidity = np.asarray(seg_liquidity, dtype=np.float64)
+
+        # 每个分段按落在其内部的 bucket 边界切开：第 k 块从第 first+k-1 条边界开始
+        first = np.searchsorted(edge_ticks, starts, side="right")
+        pieces = np.maximum(np.searchsorted(edge_ticks, ends, side="left") - first, 0) + 1
+        owner = np.repeat(np.arange(len(starts)), pieces)
+        offset = np.arange(len(owner)) - np.repeat(np.cumsum(pieces) - pieces, pieces)
+        edge_position = first[owner] + offset - 1
+        last_edge = len(edge_ticks) - 1
+        piece_lower = np.where(offset == 0, starts[owner], edge_ticks[np.clip(edge_position, 0, last_edge)])
+        piece_upper = np.where(
+            offset == pieces[owner] - 1, ends[owner], edge_ticks[np.clip(edge_position + 1, 0, last_edge)]
+        )
+
+        amounts = self.quote_amounts(piece_lower, piece_upper, liquidity[owner], sqrt_price)
+        # 每个小区间都落在两条 bucket 边界之间，按位置而不是价格归属，切分方式不影响结果
+        if self.quote_is_token0:
+            # tick 越高价格越低，边界在 tick 轴上是倒序的
+            bucket_index = len(edge_ticks) - 2 - edge_position
+        else:
+            bucket_index = edge_position
+        indices, inverse = np.unique(bucket_index, return_inverse=True)
+        depths = np.bincount(inverse, weights=amounts, minlength=len(indices))
+        return indices, depths
+
+    def add_segment_depth(
+        self,
+        buckets: np.ndarray,
+        segments: Iterable[tuple[int, int, int]],
+        sqrt_price: float | None,
+        edge_ticks: np.ndarray,
+    ) -> bool:
+        """Add the quote amounts of a few segments to ``buckets`` in place; True if a bucket changed.
+
+        Same split and attribution as ``bucket_depth`` without its per-call array
+        setup, for the handful of segments an incremental Mint / Burn produces.
+        """
+        sqrt_prices = self.table.sqrt_prices
+        min_tick, spacing, last_index = self.table.min_tick, self.tick_spacing, len(sqrt_prices) - 1
+        edge_count = len(edge_ticks)
+        changed = False
+        for lower, upper, liquidity in segments:
+            first = int(edge_ticks.searchsorted(lower, side="right"))
+            last = int(edge_ticks.searchsorted(upper, side="left"))
+            cuts = [lower, *edge_ticks[first:last].tolist(), upper]
+            for k in range(len(cuts) - 1):
+                position = first + k - 1
+                bucket = edge_count - 2 - position if self.quote_is_token0 else position
+                if not 0 <= bucket < len(buckets):
+                    continue
+                sqrt_lower = float(sqrt_prices[min(max((cuts[k] - min_tick) // spacing, 0), last_index)])
+                sqrt_upper = float(sqrt_prices[min(max((cuts[k + 1] - min_tick) // spacing, 0), last_index)])
+                if self.quote_is_token0:
+                    sqrt_current = sqrt_lower if sqrt_price is None else max(sqrt_lower, sqrt_price)
+                    amount = liquidity * max(1 / sqrt_current - 1 / sqrt_upper, 0.0) / self.table.token0_unit
+                else:
+                    sqrt_current = sqrt_upper if sqrt_price is None else min(sqrt_upper, sqrt_price)
+                    amount = liquidity * max(sqrt_current - sqrt_lower, 0.0) / self.table.token1_unit
+                buckets[bucket] += amount
+                changed = True
+        return changed
+
+    def bucket_count(self, scale: AdaptiveScale) -> int:
+        return int(math.ceil((scale.max_price - scale.min_price) / scale.step)) + 1
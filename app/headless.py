@@ -0,0 +1,226 @@
+import json
+import logging
+import queue
+import socket
+import sys
+import threading
+import time
+from typing import BinaryIO, Callable, Dict, List
+
+from app.config import OutputConfig
+from app.metrics import RENDER_SECONDS
+from app.registry import PoolRegistry
+from app.types import DepthView, LiquidityDeltaEvent
+
+
+def encode_json(message: dict) -> bytes:
+    return json.dumps(message, separators=(",", ":")).encode() + b"\n"
+
+
+def _msgpack_encoder() -> Callable[[dict], bytes]:
+    try:
+        import msgpack
+    except ImportError as e:
+        raise ValueError("OUTPUT_FORMAT=msgpack requires the msgpack package (pip install msgpack)") from e
+    # msgpack 消息自带长度，直接首尾相接写入流
+    return msgpack.Packer().pack
+
+
+def make_encoder(fmt: str) -> Callable[[dict], bytes]:
+    if fmt == "json":
+        return encode_json
+    if fmt == "msgpack":
+        return _msgpack_encoder()
+    raise ValueError(f"Unknown OUTPUT_FORMAT {fmt!r}, expected json or msgpack")
+
+
+class StreamSink:
+    """Writes encoded frames to stdout or a file (appended)."""
+
+    def __init__(self, stream: BinaryIO):
+        self.stream = stream
+
+    def write(self, data: bytes) -> bool:
+        self.stream.write(data)
+        self.stream.flush()
+        return True
+
+    def close(self) -> None:
+        if self.stream is not sys.stdout.buffer:
+            self.stream.close()
+
+
+class UnixSocketSink:
+    """Writes encoded frames to a listening Unix stream socket, reconnecting after the reader goes away.
+
+    Frames produced while disconnected are dropped and ``write`` returns False,
+    so the caller can send full state once the reader is back.
+    """
+
+    def __init__(self, path: str, retry_interval: float = 1.0):
+        self.path = path
+        self.retry_interval = retry_interval
+        self._socket: socket.socket | None = None
+        self._next_attempt = 0.0
+
+    def _connect(self) -> bool:
+        now = time.monotonic()
+        if now < self._next_attempt:
+            return False
+        self._next_attempt = now + self.retry_interval
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.path)
+        except OSError as e:
+            sock.close()
+            logging.warning(f"Output socket {self.path} unavailable: {e}")
+            return False
+        self._socket = sock
+        logging.info(f"Connected to output socket {self.path}")
+        return True
+
+    def write(self, data: bytes) -> bool:
+        if self._socket is None and not self._connect():
+            return False
+        try:
+            self._socket.sendall(data)
+            return True
+        except OSError as e:
+            logging.warning(f"Output socket {self.path} closed: {e}")
+            self._socket.close()
+            self._socket = None
+            return False
+
+    def close(self) -> None:
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+
+def open_sink(target: str) -> StreamSink | UnixSocketSink:
+    """``-`` for stdout, ``unix:<path>`` for a Unix socket, anything else is a file path."""
+    if target == "-":
+        return StreamSink(sys.stdout.buffer)
+    if target.startswith("unix:"):
+        return UnixSocketSink(target[len("unix:"):])
+    return StreamSink(open(target, "ab"))
+
+
+def _liquidity_message(pool: str, event: LiquidityDeltaEvent) -> dict:
+    return {
+        "type": "liquidity",
+        "pool": pool,
+        "event": event.event_type,
+        "tx": event.tx_hash,
+        "block": event.block_number,
+        "log_index": event.log_index,
+        "timestamp": event.timestamp,
+        "lower_tick": event.lower_tick,
+        "upper_tick": event.upper_tick,
+        # int128，超出 msgpack / 大多数 JSON 解析器的 64 位整数范围
+        "liquidity_delta": str(event.liquidity_delta),
+        "removed": event.removed,
+    }
+
+
+class DepthDeltaEncoder:
+    """Turns published depth views into delta messages against the last one emitted per pool.
+
+    A message carries only buckets whose depth changed (``set``) or emptied
+    (``removed``). When the price scale moves, bucket labels change, so the
+    message is a full ``reset`` of the pool's rows instead.
+    """
+
+    def __init__(self):
+        self._versions: Dict[str, int] = {}
+        self._scales: Dict[str, tuple] = {}
+        self._rows: Dict[str, Dict[str, float]] = {}
+
+    def reset(self) -> None:
+        """Forget everything emitted, so the next frame carries full state for every pool."""
+        self._versions.clear()
+        self._scales.clear()
+        self._rows.clear()
+
+    def encode(self, pool: str, view: DepthView) -> dict | None:
+        if self._versions.get(pool) == view.version:
+            return None
+        self._versions[pool] = view.version
+        scale = view.scale
+        rows = {depth.bucket_label: depth.usdt_depth for depth in view.rows}
+        scale_key = (scale.step, scale.min_price)
+        previous = self._rows.get(pool)
+        message = {
+            "type": "depth",
+            "pool": pool,
+            "version": view.version,
+            "price": scale.current_price,
+            "step": scale.step,
+        }
+        if previous is None or self._scales.get(pool) != scale_key:
+            message["reset"] = True
+            message["set"] = rows
+        else:
+            message["set"] = {label: depth for label, depth in rows.items() if previous.get(label) != depth}
+            removed = [label for label in previous if label not in rows]
+            if removed:
+                message["removed"] = removed
+        self._scales[pool] = scale_key
+        self._rows[pool] = rows
+        return message
+
+
+class HeadlessPublisher:
+    """Coalesces state changes into frames of messages for downstream systems; no ``rich`` involved.
+
+    Each frame carries the liquidity events applied since the previous frame
+    and one depth delta per pool whose depth view changed.
+    """
+
+    def __init__(self, registry: PoolRegistry, event_queue: queue.Queue, config: OutputConfig):
+        self.registry = registry
+        self.event_queue = event_queue
+        self.config = config
+        self.encode = make_encoder(config.format)
+        self.sink = open_sink(config.target)
+        self.depth = DepthDeltaEncoder()
+
+    def frame(self) -> List[dict]:
+        messages: List[dict] = []
+        while True:
+            try:
+                pool, event = self.event_queue.get_nowait()
+            except queue.Empty:
+                break
+            messages.append(_liquidity_message(pool, event))
+        for label, machine in self.registry.machines.items():
+            message = self.depth.encode(label, machine.depth_view())
+            if message is not None:
+                messages.append(message)
+        return messages
+
+    def publish(self) -> None:
+        messages = self.frame()
+        if messages and not self.sink.write(b"".join(self.encode(message) for message in messages)):
+            # 下游不在线：下一帧重新发送每个池子的完整深度
+            self.depth.reset()
+
+    def close(self) -> None:
+        self.sink.close()
+
+
+def start_headless(registry: PoolRegistry, event_queue: queue.Queue, config: OutputConfig, changed: threading.Event) -> None:
+    """Emit a frame when ``changed`` is set, merging everything that arrives within ``config.interval``."""
+    publisher = HeadlessPublisher(registry, event_queue, config)
+    render_seconds = RENDER_SECONDS.labels(mode="headless")
+    try:
+        publisher.publish()
+        while True:
+            changed.wait()
+            changed.clear()
+            start = time.perf_counter()
+            publisher.publish()
+            render_seconds.observe(time.perf_counter() - start)
+            time.sleep(config.interval)
+    finally:
+        publisher.close()
@@ -0,0 +1,141 @@
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, List
+
+from app.types import LiquidityDeltaEvent, PriceState
+
+
+@dataclass(slots=True)
+class JournalEntry:
+    block_hash: str | None
+    log_index: int
+    lower_tick: int
+    upper_tick: int
+    liquidity_delta: int
+
+
+@dataclass(slots=True)
+class _JournalBlock:
+    block_number: int
+    block_hash: str | None
+    # logIndex -> entry，按应用顺序插入
+    entries: Dict[int, JournalEntry] = field(default_factory=dict)
+    # 本区块第一笔 Swap 之前的价格；区块被撤销时据此恢复
+    price_before: PriceState | None = None
+
+
+class ReorgJournal:
+    """Bounded log of applied liquidity deltas, grouped per block, so recent blocks can be undone.
+
+    Entries are keyed by (blockHash, logIndex). A block with swaps also keeps the
+    price from before its first swap. Blocks more than ``finality_depth`` behind
+    the newest recorded block are compacted away, so memory stays bounded by the
+    deltas of the last ``finality_depth`` blocks.
+    """
+
+    def __init__(self, finality_depth: int = 32):
+        self.finality_depth = finality_depth
+        self._blocks: Deque[_JournalBlock] = deque()
+        # (blockHash, logIndex) -> 所在区块，removed 日志据此 O(1) 找到并删除条目
+        self._by_key: Dict[tuple[str | None, int], _JournalBlock] = {}
+
+    def record(self, event: LiquidityDeltaEvent) -> None:
+        block = self._block_for(event.block_number, event.block_hash)
+        entry = JournalEntry(
+            block_hash=event.block_hash,
+            log_index=event.log_index,
+            lower_tick=event.lower_tick,
+            upper_tick=event.upper_tick,
+            liquidity_delta=event.liquidity_delta,
+        )
+        block.entries[event.log_index] = entry
+        self._by_key[(event.block_hash, event.log_index)] = block
+        self._compact(self._blocks[-1].block_number)
+
+    def record_swap(self, block_number: int, block_hash: str | None, price_before: PriceState) -> None:
+        """Note a swap applied in this block; only the price before the block's first swap is kept."""
+        block = self._block_for(block_number, block_hash)
+        if block.price_before is None:
+            block.price_before = price_before
+        self._compact(self._blocks[-1].block_number)
+
+    def unwind_swaps(self, block_number: int, block_hash: str | None = None) -> PriceState | None:
+        """Price before the swaps of every block >= ``block_number``, or None if they had none; forgets those swaps.
+
+        With ``block_hash`` (a ``removed`` Swap log) nothing is unwound unless
+        ``block_number`` was journaled under that hash.
+        """
+        if block_hash is not None and not any(
+            block.block_number == block_number and block.block_hash == block_hash for block in self._blocks
+        ):
+            return None
+        price_before = None
+        for block in reversed(self._blocks):
+            if block.block_number < block_number:
+                break
+            if block.price_before is not None:
+                # 从新到旧遍历，最后取到的是最早区块的 Swap 前价格
+                price_before, block.price_before = block.price_before, None
+        return price_before
+
+    def is_fork(self, block_number: int, block_hash: str | None) -> bool:
+        """True if ``block_number`` was journaled under a different block hash."""
+        if block_hash is None:
+            return False
+        for block in reversed(self._blocks):
+            if block.block_number < block_number:
+                return False
+            if block.block_number == block_number and block.block_hash not in (None, block_hash):
+                return True
+        return False
+
+    def pop(self, block_hash: str | None, log_index: int) -> JournalEntry | None:
+        """Forget one applied log (e.g. a ``removed: true`` delivery) and return it for undo."""
+        block = self._by_key.pop((block_hash, log_index), None)
+        if block is None:
+            return None
+        return block.entries.pop(log_index)
+
+    def rollback_from(self, block_number: int) -> List[JournalEntry]:
+        """Drop every block >= ``block_number``; returns their entries newest first for undo."""
+        undone: List[JournalEntry] = []
+        while self._blocks and self._blocks[-1].block_number >= block_number:
+            block = self._blocks.pop()
+            for entry in reversed(block.entries.values()):
+                self._by_key.pop((entry.block_hash, entry.log_index), None)
+                undone.append(entry)
+        return undone
+
+    def block_hashes(self) -> List[tuple[int, str]]:
+        """(block number, block hash) of every journaled block with a known hash, oldest first."""
+        return [(block.block_number, block.block_hash) for block in self._blocks if block.block_hash is not None]
+
+    def __len__(self) -> int:
+        return len(self._by_key)
+
+    def _block_for(self, block_number: int, block_hash: str | None) -> _JournalBlock:
+        if self._blocks:
+            last = self._blocks[-1]
+            if last.block_number == block_number and last.block_hash == block_hash:
+                return last
+            if last.block_number > block_number:
+                # 迟到的日志 (例如补齐) 归入已有区块，或按区块号插入，保持有序
+                position = len(self._blocks)
+                for i in range(len(self._blocks) - 1, -1, -1):
+                    block = self._blocks[i]
+                    if block.block_number == block_number and block.block_hash == block_hash:
+                        return block
+                    if block.block_number <= block_number:
+                        break
+                    position = i
+                block = _JournalBlock(block_number=block_number, block_hash=block_hash)
+                self._blocks.insert(position, block)
+                return block
+        block = _JournalBlock(block_number=block_number, block_hash=block_hash)
+        self._blocks.append(block)
+        return block
+
+    def _compact(self, head: int) -> None:
+        while self._blocks and self._blocks[0].block_number <= head - self.finality_depth:
+            for entry in self._blocks.popleft().entries.values():
+                self._by_key.pop((entry.block_hash, entry.log_index), None)
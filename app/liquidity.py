@@ -0,0 +1,82 @@
+from typing import Iterator, Mapping
+
+from app.protocols.bitmap import MAX_TICK, MIN_TICK
+from app.tick_store import TickStore
+from app.types import TickLiquidity
+
+
+class LiquidityProfile:
+    """Active-liquidity curve of a pool, kept as liquidityNet per initialized tick.
+
+    ``ticks`` is a paged :class:`TickStore`. A Fenwick tree over
+    the per-page liquidityNet sums gives the active liquidity at any tick as the
+    prefix of the pages below it plus the ticks <= it on its own page. A Mint or
+    Burn touches its two boundary ticks (a memmove inside one page each) and two
+    Fenwick paths, so both updates and queries cost O(log n) plus one page.
+    """
+
+    def __init__(self, ticks: Mapping[int, TickLiquidity], tick_spacing: int):
+        self.ticks = ticks if isinstance(ticks, TickStore) else TickStore.from_mapping(tick_spacing, ticks)
+        self.tick_spacing = self.ticks.tick_spacing
+        # 1 起始的 Fenwick 树，叶子是每页 liquidityNet 之和；线性时间建树
+        size = self.ticks.page_count
+        tree = [0] * (size + 1)
+        for index, total in self.ticks.page_net_sums():
+            tree[index + 1] = total
+        for i in range(1, size + 1):
+            parent = i + (i & -i)
+            if parent <= size:
+                tree[parent] += tree[i]
+        self._tree = tree
+
+    def apply(self, lower_tick: int, upper_tick: int, liquidity_delta: int) -> None:
+        """Apply a position change: +delta at the lower boundary, -delta at the upper one."""
+        self._update_tick(lower_tick, liquidity_delta, liquidity_delta)
+        self._update_tick(upper_tick, liquidity_delta, -liquidity_delta)
+
+    def _update_tick(self, tick: int, gross_delta: int, net_delta: int) -> None:
+        page, net_change = self.ticks.add(tick, gross_delta, net_delta)
+        if not net_change:
+            return
+        tree = self._tree
+        i = page + 1
+        while i < len(tree):
+            tree[i] += net_change
+            i += i & -i
+
+    def _pages_below(self, page: int) -> int:
+        """Sum of liquidityNet over pages ``< page``."""
+        tree = self._tree
+        total = 0
+        i = page
+        while i > 0:
+            total += tree[i]
+            i -= i & -i
+        return total
+
+    def active_liquidity(self, tick: int) -> int:
+        """Liquidity active at ``tick`` (sum of liquidityNet of all initialized ticks <= tick)."""
+        if tick < MIN_TICK:
+            return 0
+        tick = min(tick, MAX_TICK)
+        return self._pages_below(self.ticks.page_index(tick)) + self.ticks.page_net_through(tick)
+
+    def segments(self, lower_tick: int, upper_tick: int) -> Iterator[tuple[int, int, int]]:
+        """Yield (tick_lower, tick_upper, active_liquidity) ranges covering [lower_tick, upper_tick).
+
+        Costs O(log n + k) where k is the number of initialized ticks inside the range.
+        """
+        if lower_tick >= upper_tick:
+            return
+        liquidity = self.active_liquidity(lower_tick)
+        start = lower_tick
+        for tick, net in self.ticks.net_between(lower_tick, upper_tick):
+            if liquidity > 0 and tick > start:
+                yield start, tick, liquidity
+            start = tick
+            liquidity += net
+        if liquidity > 0:
+            yield start, upper_tick, liquidity
+
+    def __len__(self) -> int:
+        return len(self.ticks)
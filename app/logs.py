@@ -0,0 +1,74 @@
+import logging
+from typing import AsyncIterator, Iterable, List
+
+from web3 import AsyncWeb3, Web3
+from web3.types import RPCEndpoint
+
+
+def _get_logs_params(address: str | List[str], topics: List[str], start: int, end: int) -> dict:
+    return {
+        "address": address,
+        "topics": [topics],
+        "fromBlock": hex(start),
+        "toBlock": hex(end),
+    }
+
+
+def get_logs_chunked(
+    web3: Web3,
+    address: str | List[str],
+    topics: List[str],
+    from_block: int,
+    to_block: int,
+    chunk_size: int = 2000,
+) -> Iterable[dict]:
+    """Yield raw logs for [from_block, to_block] via eth_getLogs, ``chunk_size`` blocks at a time.
+
+    Logs are returned exactly as the node sends them (hex strings), the same shape
+    as eth_subscribe payloads, so adapters decode both paths identically. A chunk the
+    node rejects (range / result-size limits) is retried with half the range.
+    """
+    start = from_block
+    while start <= to_block:
+        end = min(start + chunk_size - 1, to_block)
+        params = _get_logs_params(address, topics, start, end)
+        try:
+            response = web3.provider.make_request(RPCEndpoint("eth_getLogs"), [params])
+            if "error" in response:
+                raise RuntimeError(response["error"])
+        except Exception as e:
+            if end == start:
+                raise
+            chunk_size = max(1, (end - start + 1) // 2)
+            logging.warning(f"eth_getLogs {start}-{end} failed ({e}), retrying with {chunk_size} blocks")
+            continue
+        yield from response["result"]
+        start = end + 1
+
+
+async def async_get_logs_chunked(
+    web3: AsyncWeb3,
+    address: str | List[str],
+    topics: List[str],
+    from_block: int,
+    to_block: int,
+    chunk_size: int = 2000,
+) -> AsyncIterator[dict]:
+    """Async twin of :func:`get_logs_chunked` over an AsyncWeb3 provider."""
+    start = from_block
+    while start <= to_block:
+        end = min(start + chunk_size - 1, to_block)
+        params = _get_logs_params(address, topics, start, end)
+        try:
+            response = await web3.provider.make_request(RPCEndpoint("eth_getLogs"), [params])
+            if "error" in response:
+                raise RuntimeError(response["error"])
+        except Exception as e:
+            if end == start:
+                raise
+            chunk_size = max(1, (end - start + 1) // 2)
+            logging.warning(f"eth_getLogs {start}-{end} failed ({e}), retrying with {chunk_size} blocks")
+            continue
+        for raw_log in response["result"]:
+            yield raw_log
+        start = end + 1
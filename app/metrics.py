@@ -0,0 +1,374 @@
+"""In-process metrics for the hot paths, served as Prometheus text and summarised into ``monitor.log``.
+
+Counters, gauges and fixed-bucket histograms with labels, no third-party client.
+An observation is a bisect plus two additions under an uncontended lock (about
+a microsecond), so they are always on. Queue depths are read only when
+scraped or summarised. ``METRICS_PORT`` enables the HTTP endpoint
+(``/metrics``); ``METRICS_SUMMARY_INTERVAL`` controls the periodic log line.
+"""
+
+import bisect
+import logging
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterable, List, Sequence
+
+from app.config import MetricsConfig
+
+# 秒级延迟的默认桶：100µs 到 30s
+LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+# 区块时间戳到收到日志的滞后 (区块时间戳精度为秒)
+LAG_BUCKETS = (0.5, 1.0, 2.0, 3.0, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+
+def _label_text(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    value = float(value)
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if math.isnan(value):
+        return "NaN"
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+class _Metric(ABC):
+    """Named metric with optional labels; each label combination is a child created on first use."""
+
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), registry: "MetricsRegistry | None" = None):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._children: Dict[tuple, object] = {}
+        self._lock = threading.Lock()
+        if not self.label_names:
+            # 无标签的指标只有一个子项，建好后直接取用 (从启动起就以 0 暴露)
+            self._children[()] = self._new_child()
+        (REGISTRY if registry is None else registry).register(self)
+
+    def labels(self, **values: str):
+        key = tuple(str(values[name]) for name in self.label_names)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _default(self):
+        # 无标签的指标直接在自身上 observe / inc / set
+        return self._children[()]
+
+    def children(self) -> List[tuple]:
+        return list(self._children.items())
+
+    @abstractmethod
+    def _new_child(self):
+        """A fresh child holding one label combination's value(s)."""
+
+    def expose(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.kind}"
+
+
+class _CounterChild:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._default().inc(amount)
+
+    def expose(self) -> Iterable[str]:
+        yield from super().expose()
+        for key, child in self.children():
+            yield f"{self.name}{_label_text(self.label_names, key)} {_format_value(child.value)}"
+
+
+class _GaugeChild:
+    def __init__(self):
+        self.value = 0.0
+        self._function: Callable[[], float] | None = None
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """Read the value from ``function`` at scrape time instead of on every change."""
+        self._function = function
+
+    def get(self) -> float:
+        if self._function is not None:
+            try:
+                return float(self._function())
+            except Exception:
+                return math.nan
+        return self.value
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self) -> _GaugeChild:
+        return _GaugeChild()
+
+    def set(self, value: float) -> None:
+        self._default().set(value)
+
+    def expose(self) -> Iterable[str]:
+        yield from super().expose()
+        for key, child in self.children():
+            yield f"{self.name}{_label_text(self.label_names, key)} {_format_value(child.get())}"
+
+
+class _HistogramChild:
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds = bounds
+        # 最后一格是 +Inf
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def snapshot(self) -> tuple[List[int], float]:
+        with self._lock:
+            return list(self.counts), self.sum
+
+
+def quantile(bounds: Sequence[float], counts: Sequence[int], q: float) -> float:
+    """Estimate the ``q`` quantile from bucket counts (linear within the bucket, like histogram_quantile)."""
+    total = sum(counts)
+    if total == 0:
+        return math.nan
+    rank = q * total
+    seen = 0
+    for index, count in enumerate(counts):
+        if count and seen + count >= rank:
+            if index == len(bounds):
+                return bounds[-1]
+            lower = bounds[index - 1] if index > 0 else 0.0
+            return lower + (bounds[index] - lower) * (rank - seen) / count
+        seen += count
+    return bounds[-1]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+        registry: "MetricsRegistry | None" = None,
+    ):
+        self.buckets = tuple(buckets)
+        super().__init__(name, help, labels, registry)
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self._default().observe(value)
+
+    def expose(self) -> Iterable[str]:
+        yield from super().expose()
+        for key, child in self.children():
+            counts, total = child.snapshot()
+            cumulative = 0
+            for bound, count in zip((*self.buckets, math.inf), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_label_text(self.label_names, key, le)} {cumulative}"
+            yield f"{self.name}_sum{_label_text(self.label_names, key)} {_format_value(total)}"
+            yield f"{self.name}_count{_label_text(self.label_names, key)} {cumulative}"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> None:
+        self.metrics.append(metric)
+
+    def expose(self) -> str:
+        """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+        lines: List[str] = []
+        for metric in self.metrics:
+            lines.extend(metric.expose())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+SNAPSHOT_PHASE_SECONDS = Histogram(
+    "snapshot_phase_seconds", "Wall time of snapshot phases (slot0, bitmap scan, tick fetch, decode).", ["phase"]
+)
+RPC_ROUND_TRIP_SECONDS = Histogram("rpc_round_trip_seconds", "Multicall eth_call round trips.", ["method"])
+RPC_ERRORS = Counter("rpc_errors_total", "Multicall eth_calls that raised.", ["method"])
+MULTICALL_DECODE_SECONDS = Histogram("multicall_decode_seconds", "Output decoding per multicall batch.")
+RECEIVE_TO_APPLY_SECONDS = Histogram(
+    "log_receive_to_apply_seconds", "From a log leaving the WebSocket reader to its batch being applied."
+)
+BLOCK_TO_RECEIVE_SECONDS = Histogram(
+    "log_block_to_receive_seconds",
+    "From the block timestamp to receiving its log (only for nodes that send blockTimestamp).",
+    buckets=LAG_BUCKETS,
+)
+LOGS_RECEIVED = Counter("logs_received_total", "Raw logs received from the subscription (including backfills).")
+APPLY_BATCH_SECONDS = Histogram("apply_batch_seconds", "Routing, decoding and applying one batch of raw logs.")
+QUEUE_DEPTH = Gauge("queue_depth", "Items waiting in the ingestion / display queues.", ["queue"])
+STATE_LOCK_HOLD_SECONDS = Histogram("state_lock_hold_seconds", "How long LiquidityStateMachine holds its lock.")
+RENDER_SECONDS = Histogram("render_seconds", "Time to build and write one output frame.", ["mode"])
+
+
+# 每条日志都会经过的子项，预先取出省去查找
+_logs_received = LOGS_RECEIVED._default()
+_block_to_receive = BLOCK_TO_RECEIVE_SECONDS._default()
+_receive_to_apply = RECEIVE_TO_APPLY_SECONDS._default()
+
+
+class TimedLock:
+    """``threading.Lock`` stand-in for ``with`` blocks that records each hold time in a histogram."""
+
+    def __init__(self, histogram: Histogram):
+        self._lock = threading.Lock()
+        self._histogram = histogram._default()
+        self._acquired = 0.0
+
+    def __enter__(self) -> "TimedLock":
+        self._lock.acquire()
+        self._acquired = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        held = time.perf_counter() - self._acquired
+        self._lock.release()
+        self._histogram.observe(held)
+
+
+def log_received(raw_log: dict) -> float:
+    """Stamp a raw log as it leaves the socket reader; returns the wall-clock receive time.
+
+    Nodes that include ``blockTimestamp`` in logs (recent geth / reth) also feed
+    the block-to-receive lag.
+    """
+    now = time.time()
+    _logs_received.inc()
+    block_timestamp = raw_log.get("blockTimestamp")
+    if block_timestamp is not None:
+        timestamp = int(block_timestamp, 16) if isinstance(block_timestamp, str) else block_timestamp
+        _block_to_receive.observe(max(0.0, now - timestamp))
+    return now
+
+
+def logs_applied(received: Iterable[float], started: float) -> None:
+    """Record receive-to-apply latency for a batch received at ``received`` and applied since ``started``."""
+    now = time.time()
+    APPLY_BATCH_SECONDS.observe(now - started)
+    for received_at in received:
+        _receive_to_apply.observe(now - received_at)
+
+
+def _format_seconds(value: float) -> str:
+    if math.isnan(value):
+        return "-"
+    if value < 1.0:
+        return f"{value * 1000:.1f}ms"
+    return f"{value:.2f}s"
+
+
+class SummaryLogger:
+    """Logs one line per interval: count / p50 / p99 of every histogram over the interval, and queue depths."""
+
+    def __init__(self, registry: MetricsRegistry = REGISTRY):
+        self.registry = registry
+        self._previous: Dict[tuple, List[int]] = {}
+
+    def summary(self) -> str:
+        parts = []
+        for metric in self.registry.metrics:
+            for key, child in metric.children():
+                label = ",".join(key)
+                name = f"{metric.name}[{label}]" if label else metric.name
+                if isinstance(metric, Histogram):
+                    counts, _ = child.snapshot()
+                    previous = self._previous.get((metric.name, key), [0] * len(counts))
+                    self._previous[(metric.name, key)] = counts
+                    window = [now - before for now, before in zip(counts, previous)]
+                    if sum(window):
+                        p50 = _format_seconds(quantile(metric.buckets, window, 0.5))
+                        p99 = _format_seconds(quantile(metric.buckets, window, 0.99))
+                        parts.append(f"{name} n={sum(window)} p50={p50} p99={p99}")
+                elif isinstance(metric, Gauge):
+                    parts.append(f"{name}={_format_value(child.get())}")
+        return " | ".join(parts)
+
+    def run(self, interval: float) -> None:
+        while True:
+            time.sleep(interval)
+            line = self.summary()
+            if line:
+                logging.info(f"Metrics ({interval:.0f}s): {line}")
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry: MetricsRegistry
+
+    def do_GET(self) -> None:
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        payload = self.registry.expose().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+def start_metrics(config: MetricsConfig, registry: MetricsRegistry = REGISTRY) -> ThreadingHTTPServer | None:
+    """Start the periodic summary and, when ``config.port`` is set, the ``/metrics`` endpoint."""
+    if config.summary_interval > 0:
+        summary = SummaryLogger(registry)
+        threading.Thread(target=summary.run, args=(config.summary_interval,), daemon=True, name="metrics-summary").start()
+    if not config.port:
+        return None
+    handler = type("MetricsHandler", (_MetricsHandler,), {"registry": registry})
+    server = ThreadingHTTPServer((config.host, config.port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True, name="metrics-http").start()
+    logging.info(f"Metrics on http://{config.host}:{server.server_address[1]}/metrics")
+    return server
@@ -1,10 +1,21 @@
 from __future__ import annotations
 
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from dataclasses import dataclass
-from typing import Iterable, List, Sequence
+from typing import Deque, Dict, Iterable, List, Sequence
 
+import requests
+from eth_utils.abi import get_abi_output_types
+from requests.adapters import HTTPAdapter
 from web3 import Web3
 from web3.contract.contract import ContractFunction
+from web3.exceptions import ContractLogicError
+from web3.types import BlockIdentifier
+
+from app.metrics import MULTICALL_DECODE_SECONDS, RPC_ERRORS, RPC_ROUND_TRIP_SECONDS
 
 
 MULTICALL2_ABI = [
@@ -30,6 +41,77 @@ MULTICALL2_ABI = [
     }
 ]
 
+MULTICALL3_ABI = MULTICALL2_ABI + [
+    {
+        "inputs": [
+            {
+                "components": [
+                    {"internalType": "address", "name": "target", "type": "address"},
+                    {"internalType": "bool", "name": "allowFailure", "type": "bool"},
+                    {"internalType": "bytes", "name": "callData", "type": "bytes"},
+                ],
+                "internalType": "struct Multicall3.Call3[]",
+                "name": "calls",
+                "type": "tuple[]",
+            }
+        ],
+        "name": "aggregate3",
+        "outputs": [
+            {
+                "components": [
+                    {"internalType": "bool", "name": "success", "type": "bool"},
+                    {"internalType": "bytes", "name": "returnData", "type": "bytes"},
+                ],
+                "internalType": "struct Multicall3.Result[]",
+                "name": "returnData",
+                "type": "tuple[]",
+            }
+        ],
+        "stateMutability": "payable",
+        "type": "function",
+    }
+]
+
+
+# 节点对过大批次返回的典型错误 (gas 上限 / 响应体过大 / 超时)，缩小批次后可重试
+_CAPACITY_ERROR_MARKERS = (
+    "gas",
+    "too large",
+    "size exceeded",
+    "response size",
+    "limit exceeded",
+    "timeout",
+    "timed out",
+    "413",
+)
+
+
+def make_http_provider(rpc_url: str, pool_size: int) -> Web3.HTTPProvider:
+    """HTTPProvider backed by one pooled session, sized for ``pool_size`` concurrent requests."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return Web3.HTTPProvider(rpc_url, session=session)
+
+
+def _decode_output(fn: ContractFunction, raw: bytes) -> tuple:
+    """Decode one call's return data with the function's own ABI outputs."""
+    return tuple(fn.w3.codec.decode(get_abi_output_types(fn.abi), raw))
+
+
+def _is_capacity_error(error: Exception) -> bool:
+    message = str(error).lower()
+    return any(marker in message for marker in _CAPACITY_ERROR_MARKERS)
+
+
+class MulticallError(RuntimeError):
+    """Raised when sub-calls keep failing after retries, so results would be incomplete."""
+
+    def __init__(self, message: str, failed_indices: Sequence[int] = ()):
+        super().__init__(message)
+        self.failed_indices = list(failed_indices)
+
 
 @dataclass
 class MulticallResult:
@@ -37,37 +119,215 @@ class MulticallResult:
     return_data: List[bytes]
 
 
+class AdaptiveBatchSizer:
+    """Grow the batch while round trips stay under the latency target, shrink on slow or failed ones."""
+
+    def __init__(self, initial: int, target_latency: float, min_size: int = 1, max_size: int | None = None):
+        self.size = max(initial, min_size)
+        self.target_latency = target_latency
+        self.min_size = min_size
+        self.max_size = max_size or initial * 8
+
+    def observe(self, batch_size: int, latency: float) -> None:
+        if latency > self.target_latency:
+            self.size = max(self.min_size, int(batch_size * 0.7))
+        elif latency < self.target_latency / 2 and batch_size >= self.size:
+            self.size = min(self.max_size, int(self.size * 1.25) + 1)
+
+    def on_error(self, batch_size: int) -> None:
+        self.size = max(self.min_size, batch_size // 2)
+
+
 class MulticallClient:
-    def __init__(self, web3: Web3, address: str):
+    def __init__(
+        self,
+        web3: Web3,
+        address: str,
+        max_in_flight: int = 1,
+        target_latency: float = 1.0,
+        use_aggregate3: bool = True,
+        max_retries: int = 2,
+        retry_backoff: float = 0.5,
+    ):
         self.web3 = web3
+        self.use_aggregate3 = use_aggregate3
         self.contract = web3.eth.contract(
-            address=Web3.to_checksum_address(address), abi=MULTICALL2_ABI
+            address=Web3.to_checksum_address(address),
+            abi=MULTICALL3_ABI if use_aggregate3 else MULTICALL2_ABI,
+        )
+        self.max_retries = max_retries
+        # 传输错误重试前的等待，第 n 次重试等待 retry_backoff * 2**(n-1) 秒
+        self.retry_backoff = retry_backoff
+        self.max_in_flight = max(1, max_in_flight)
+        self.target_latency = target_latency
+        self.round_trips = 0
+        self._counter_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_in_flight, thread_name_prefix="multicall"
         )
 
     def _encode_call(self, fn: ContractFunction) -> tuple[str, bytes]:
         return fn.address, bytes.fromhex(fn._encode_transaction_data()[2:])
 
-    def aggregate(self, functions: Sequence[ContractFunction]) -> MulticallResult:
+    def aggregate(
+        self, functions: Sequence[ContractFunction], block_identifier: BlockIdentifier | None = None
+    ) -> MulticallResult:
         if not functions:
             return MulticallResult(block_number=0, return_data=[])
         calls = [self._encode_call(fn) for fn in functions]
-        block_number, return_data = self.contract.functions.aggregate(calls).call()
+        with self._counter_lock:
+            self.round_trips += 1
+        block_number, return_data = self._eth_call(
+            "aggregate", self.contract.functions.aggregate(calls), block_identifier
+        )
         return MulticallResult(block_number=block_number, return_data=return_data)
 
-    def call_functions(self, functions: Sequence[ContractFunction]) -> List[tuple]:
-        """Execute multiple view calls via Multicall2 and decode outputs.
+    def aggregate3(
+        self, functions: Sequence[ContractFunction], block_identifier: BlockIdentifier | None = None
+    ) -> List[tuple[bool, bytes]]:
+        """Multicall3 aggregate3 with allowFailure, returning (success, returnData) per call."""
+        if not functions:
+            return []
+        calls = [(target, True, call_data) for target, call_data in map(self._encode_call, functions)]
+        with self._counter_lock:
+            self.round_trips += 1
+        return self._eth_call("aggregate3", self.contract.functions.aggregate3(calls), block_identifier)
+
+    def _eth_call(self, method: str, call: ContractFunction, block_identifier: BlockIdentifier | None):
+        start = time.perf_counter()
+        try:
+            return call.call(block_identifier=block_identifier)
+        except Exception:
+            RPC_ERRORS.labels(method=method).inc()
+            raise
+        finally:
+            RPC_ROUND_TRIP_SECONDS.labels(method=method).observe(time.perf_counter() - start)
+
+    def call_functions(
+        self, functions: Sequence[ContractFunction], block_identifier: BlockIdentifier | None = None
+    ) -> List[tuple]:
+        """Execute multiple view calls in one multicall and decode outputs.
 
         Returns a list of tuples, matching the decoded outputs of each function.
+        Pass ``block_identifier`` to pin every call to the same block. With aggregate3,
+        only the sub-calls that failed are re-sent (up to ``max_retries`` times);
+        :class:`MulticallError` is raised if any of them still fail.
         """
 
-        result = self.aggregate(functions)
-        decoded: List[tuple] = []
-        for fn, raw in zip(functions, result.return_data):
-            decoded.append(fn.contract.decode_function_output(fn.fn_name, raw))
-        return decoded
+        if not self.use_aggregate3:
+            result = self.aggregate(functions, block_identifier)
+            start = time.perf_counter()
+            outputs = [_decode_output(fn, raw) for fn, raw in zip(functions, result.return_data)]
+            MULTICALL_DECODE_SECONDS.observe(time.perf_counter() - start)
+            return outputs
+
+        decoded: List[tuple | None] = [None] * len(functions)
+        pending = list(range(len(functions)))
+        for _ in range(self.max_retries + 1):
+            if not pending:
+                break
+            outcomes = self.aggregate3([functions[i] for i in pending], block_identifier)
+            start = time.perf_counter()
+            failed: List[int] = []
+            for index, (success, raw) in zip(pending, outcomes):
+                if success:
+                    decoded[index] = _decode_output(functions[index], raw)
+                else:
+                    failed.append(index)
+            MULTICALL_DECODE_SECONDS.observe(time.perf_counter() - start)
+            pending = failed
+        if pending:
+            raise MulticallError(
+                f"{len(pending)} of {len(functions)} calls failed after {self.max_retries} retries",
+                pending,
+            )
+        return decoded  # type: ignore[return-value]
 
-    def batched_call(self, function_batches: Iterable[Sequence[ContractFunction]]) -> List[tuple]:
+    def batched_call(
+        self,
+        function_batches: Iterable[Sequence[ContractFunction]],
+        block_identifier: BlockIdentifier | None = None,
+    ) -> List[tuple]:
+        """Run pre-built batches with up to ``max_in_flight`` in flight, preserving order."""
         outputs: List[tuple] = []
-        for batch in function_batches:
-            outputs.extend(self.call_functions(batch))
+        results = self._executor.map(
+            lambda batch: self.call_functions(batch, block_identifier), function_batches
+        )
+        for decoded in results:
+            outputs.extend(decoded)
         return outputs
+
+    def call_all(
+        self,
+        functions: Sequence[ContractFunction],
+        batch_size: int,
+        block_identifier: BlockIdentifier | None = None,
+    ) -> List[tuple]:
+        """Execute ``functions`` in adaptively sized batches, keeping a window of batches in flight.
+
+        The batch size starts at ``batch_size`` and follows observed latency. A batch
+        rejected as too large, or reverted as a whole, is bisected and both halves are
+        retried, so one oversized or bad request never voids its neighbours; a single
+        call that reverts is raised. Other errors (timeouts, dropped connections, rate
+        limits) retry the same range with exponential backoff, up to ``max_retries`` times.
+        """
+
+        results: List[tuple | None] = [None] * len(functions)
+        sizer = AdaptiveBatchSizer(batch_size, self.target_latency)
+        # (start, end, 已重试次数)
+        retries: Deque[tuple[int, int, int]] = deque()
+        in_flight: Dict[Future, tuple[int, int, int]] = {}
+        cursor = 0
+        try:
+            while True:
+                while len(in_flight) < self.max_in_flight and (retries or cursor < len(functions)):
+                    if retries:
+                        start, end, attempt = retries.popleft()
+                    else:
+                        start, end, attempt = cursor, min(len(functions), cursor + sizer.size), 0
+                        cursor = end
+                    delay = self.retry_backoff * 2 ** (attempt - 1) if attempt else 0.0
+                    future = self._executor.submit(
+                        self._timed_call, functions[start:end], block_identifier, delay
+                    )
+                    in_flight[future] = (start, end, attempt)
+                if not in_flight:
+                    break
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    start, end, attempt = in_flight.pop(future)
+                    try:
+                        decoded, latency = future.result()
+                    except MulticallError:
+                        raise
+                    except Exception as e:
+                        capacity = _is_capacity_error(e)
+                        if capacity:
+                            sizer.on_error(end - start)
+                        if capacity or isinstance(e, ContractLogicError):
+                            if end - start > 1:
+                                mid = (start + end) // 2
+                                retries.extend([(start, mid, 0), (mid, end, 0)])
+                                continue
+                            if not capacity:
+                                # 单个调用 revert，重试也不会成功
+                                raise
+                        if attempt >= self.max_retries:
+                            raise
+                        retries.append((start, end, attempt + 1))
+                        continue
+                    sizer.observe(end - start, latency)
+                    results[start:end] = decoded
+        finally:
+            for future in in_flight:
+                future.cancel()
+        return results  # type: ignore[return-value]
+
+    def _timed_call(
+        self, functions: Sequence[ContractFunction], block_identifier: BlockIdentifier | None, delay: float = 0.0
+    ) -> tuple[List[tuple], float]:
+        if delay:
+            time.sleep(delay)
+        start = time.perf_counter()
+        decoded = self.call_functions(functions, block_identifier)
+        return decoded, time.perf_counter() - start
@@ -1,11 +1,42 @@
+import logging
+import time
 from abc import ABC, abstractmethod
-from typing import Iterable
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List
 from web3 import Web3
 
-from app.types import LiquidityDeltaEvent, Snapshot
+from app.decoding import LiquidityDecoder, decode_swap, log_block_number, log_data, log_index
+from app.logs import get_logs_chunked
+from app.metrics import SNAPSHOT_PHASE_SECONDS
+from app.multicall import MulticallClient
+from app.types import LiquidityDeltaEvent, Snapshot, SnapshotPhase, SwapEvent
+from app.wss import WebsocketLogStream
+
+
+@contextmanager
+def snapshot_phase(name: str, phases: List[SnapshotPhase], multicall: MulticallClient) -> Iterator[None]:
+    """Record round trips and wall time of one snapshot phase into ``phases``."""
+    start_trips = multicall.round_trips
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        phase = SnapshotPhase(
+            name=name,
+            round_trips=multicall.round_trips - start_trips,
+            wall_time=time.perf_counter() - start,
+        )
+        phases.append(phase)
+        SNAPSHOT_PHASE_SECONDS.labels(phase=name).observe(phase.wall_time)
+        logging.info(f"Snapshot phase {phase.name}: {phase.round_trips} round trips in {phase.wall_time:.3f}s")
 
 
 class ProtocolAdapter(ABC):
+    stream: WebsocketLogStream
+    # 子类设置：Swap 的 topic0，以及流动性事件 topic0 -> (event_type, decoder)
+    swap_topic: str
+    liquidity_decoders: Dict[str, tuple[str, LiquidityDecoder]]
+
     def __init__(self, web3: Web3, pool_address: str):
         self.web3 = web3
         self.pool_address = Web3.to_checksum_address(pool_address)
@@ -14,6 +45,65 @@ class ProtocolAdapter(ABC):
     def fetch_snapshot(self) -> Snapshot:
         ...
 
-    @abstractmethod
-    def stream_events(self) -> Iterable[LiquidityDeltaEvent]:
-        ...
+    def _event_to_delta(self, raw_log) -> LiquidityDeltaEvent | SwapEvent | None:
+        """Dispatch on topic0 to a fixed-layout decoder; None for logs this adapter does not handle."""
+        topics = raw_log.get("topics")
+        if not topics:
+            return None
+        topic0 = topics[0]
+        if topic0 == self.swap_topic:
+            return self._swap_to_event(raw_log)
+        decoder = self.liquidity_decoders.get(topic0)
+        if decoder is None:
+            return None
+        event_type, decode = decoder
+        lower_tick, upper_tick, liquidity_delta = decode(topics, log_data(raw_log))
+        return LiquidityDeltaEvent(
+            tx_hash=raw_log.get("transactionHash", "0x"),
+            lower_tick=lower_tick,
+            upper_tick=upper_tick,
+            liquidity_delta=liquidity_delta,
+            block_number=log_block_number(raw_log),
+            timestamp=int(time.time()),
+            event_type=event_type,
+            block_hash=raw_log.get("blockHash"),
+            log_index=log_index(raw_log),
+            removed=bool(raw_log.get("removed", False)),
+        )
+
+    def _swap_to_event(self, raw_log) -> SwapEvent:
+        sqrt_price_x96, liquidity, tick = decode_swap(log_data(raw_log))
+        return SwapEvent(
+            tx_hash=raw_log.get("transactionHash", "0x"),
+            sqrt_price_x96=sqrt_price_x96,
+            tick=tick,
+            liquidity=liquidity,
+            block_number=log_block_number(raw_log),
+            timestamp=int(time.time()),
+            block_hash=raw_log.get("blockHash"),
+            log_index=log_index(raw_log),
+            removed=bool(raw_log.get("removed", False)),
+        )
+
+    def stream_events(self) -> Iterable[LiquidityDeltaEvent | SwapEvent]:
+        for raw_log in self.stream.stream():
+            event = self.decode_log(raw_log)
+            if event is not None:
+                yield event
+
+    def decode_log(self, raw_log) -> LiquidityDeltaEvent | SwapEvent | None:
+        """Decode one raw log (subscription or eth_getLogs); None if it is not a pool event."""
+        try:
+            return self._event_to_delta(raw_log)
+        except (ValueError, IndexError):
+            # 截断的 data / 缺少 indexed topic
+            return None
+
+    def replay_events(self, from_block: int, to_block: int) -> Iterable[LiquidityDeltaEvent | SwapEvent]:
+        """Decoded pool events for [from_block, to_block] via eth_getLogs, in log order."""
+        for raw_log in get_logs_chunked(
+            self.web3, self.stream.address, self.stream.topics, from_block, to_block, self.stream.backfill_chunk_size
+        ):
+            event = self.decode_log(raw_log)
+            if event is not None:
+                yield event
@@ -0,0 +1,46 @@
+from typing import Callable, Iterable, List, Sequence
+
+from web3.contract.contract import ContractFunction
+
+from app.multicall import MulticallClient
+
+MIN_TICK = -887272
+MAX_TICK = 887272
+WORD_SIZE = 256
+
+
+def word_range(tick_spacing: int, min_tick: int = MIN_TICK, max_tick: int = MAX_TICK) -> range:
+    """All tickBitmap word positions that can hold a tick for ``tick_spacing``."""
+    min_word = (min_tick // tick_spacing) >> 8
+    max_word = (max_tick // tick_spacing) >> 8
+    return range(min_word, max_word + 1)
+
+
+def ticks_in_word(word_index: int, bitmap: int, tick_spacing: int) -> Iterable[int]:
+    """Expand the set bits of a bitmap word into tick indices."""
+    base = word_index * WORD_SIZE
+    while bitmap:
+        low_bit = bitmap & -bitmap
+        bit_pos = low_bit.bit_length() - 1
+        yield (base + bit_pos) * tick_spacing
+        bitmap ^= low_bit
+
+
+def fetch_populated_words(
+    multicall: MulticallClient,
+    bitmap_fn: Callable[[int], ContractFunction],
+    word_indices: Sequence[int],
+    batch_size: int,
+    block_identifier: int | None = None,
+) -> List[tuple[int, int]]:
+    """Read tickBitmap words in batches and return the non-empty ones as (word, bitmap)."""
+    populated: List[tuple[int, int]] = []
+    calls = [bitmap_fn(word_index) for word_index in word_indices]
+    bitmaps = multicall.call_all(calls, batch_size, block_identifier=block_identifier)
+    for word_index, (bitmap,) in zip(word_indices, bitmaps):
+        if isinstance(bitmap, bytes):
+            # extsload 返回 bytes32
+            bitmap = int.from_bytes(bitmap, "big")
+        if bitmap:
+            populated.append((word_index, bitmap))
+    return populated
@@ -1,13 +1,12 @@
-import time
-from typing import Iterable, List, Sequence
-from eth_abi import decode
-from eth_utils import keccak
+from typing import List
 from web3 import Web3
 
+from app.decoding import PANCAKE_SWAP_TOPIC, V3_LIQUIDITY_DECODERS
 from app.multicall import MulticallClient
-from app.pricing import tick_to_price
-from app.protocols.base import ProtocolAdapter
-from app.types import LiquidityDeltaEvent, PriceState, Snapshot, TickLiquidity
+from app.protocols.base import ProtocolAdapter, snapshot_phase
+from app.protocols.bitmap import fetch_populated_words, word_range
+from app.tick_store import TickStore
+from app.types import PriceState, Snapshot, SnapshotPhase
 from app.wss import WebsocketLogStream
 
 
@@ -23,94 +22,76 @@ class PancakeV3Adapter(ProtocolAdapter):
         multicall: MulticallClient,
         token0_decimals: int,
         token1_decimals: int,
+        bitmap_batch_size: int = 200,
+        lens_batch_size: int = 20,
     ):
         super().__init__(web3, pool_address)
         self.pool_contract = web3.eth.contract(address=self.pool_address, abi=pool_abi)
         self.tick_lens = web3.eth.contract(address=Web3.to_checksum_address(tick_lens_address), abi=tick_lens_abi)
+        self.swap_topic = PANCAKE_SWAP_TOPIC
+        self.liquidity_decoders = V3_LIQUIDITY_DECODERS
         self.stream = WebsocketLogStream(
             wss_url,
             self.pool_address,
-            [
-                keccak(text="Mint(address,address,int24,int24,uint128,uint256,uint256)").hex(),
-                keccak(text="Burn(address,int24,int24,uint128,uint256,uint256)").hex(),
-            ],
+            [*self.liquidity_decoders, self.swap_topic],
+            web3=web3,
         )
         self.multicall = multicall
         self.token0_decimals = token0_decimals
         self.token1_decimals = token1_decimals
+        self.bitmap_batch_size = bitmap_batch_size
+        self.lens_batch_size = lens_batch_size
 
     def fetch_snapshot(self) -> Snapshot:
-        slot0_fn = self.pool_contract.functions.slot0()
-        tick_spacing_fn = self.pool_contract.functions.tickSpacing()
-        slot0_result, tick_spacing_result = self.multicall.call_functions([slot0_fn, tick_spacing_fn])
+        # 所有读取固定在同一个区块，保证 Snapshot 一致
+        block_number = self.web3.eth.block_number
+        phases: List[SnapshotPhase] = []
+        with snapshot_phase("slot0", phases, self.multicall):
+            slot0_fn = self.pool_contract.functions.slot0()
+            tick_spacing_fn = self.pool_contract.functions.tickSpacing()
+            slot0_result, tick_spacing_result = self.multicall.call_functions(
+                [slot0_fn, tick_spacing_fn], block_identifier=block_number
+            )
         current_tick = slot0_result[1]
         sqrt_price_x96 = slot0_result[0]
         tick_spacing = tick_spacing_result[0]
-        ticks: dict[int, TickLiquidity] = {}
-        word_indices = list(range(-887272 // tick_spacing, 887272 // tick_spacing + 1))
-        word_functions = [
-            self.tick_lens.functions.getPopulatedTicksInWord(
-                self.pool_address, int(word_index)
+        # 1. 先扫描 tickBitmap，找出真正有流动性的 word
+        with snapshot_phase("bitmap", phases, self.multicall):
+            populated_words = fetch_populated_words(
+                self.multicall,
+                self.pool_contract.functions.tickBitmap,
+                word_range(tick_spacing),
+                self.bitmap_batch_size,
+                block_number,
+            )
+        # 2. 只对非空 word 调用 TickLens
+        with snapshot_phase("tick_lens", phases, self.multicall):
+            word_functions = [
+                self.tick_lens.functions.getPopulatedTicksInWord(
+                    self.pool_address, int(word_index)
+                )
+                for word_index, _ in populated_words
+            ]
+            responses = self.multicall.call_all(
+                word_functions,
+                self.lens_batch_size,
+                block_identifier=block_number,
             )
-            for word_index in word_indices
-        ]
-        for batch in self._batched_functions(word_functions):
-            response_batch = self.multicall.call_functions(batch)
-            for response in response_batch:
-                for tick_info in response[0]:
-                    tick_index = tick_info[0]
-                    liquidity_net = tick_info[1]
-                    liquidity_gross = tick_info[2]
-                    if liquidity_gross == 0:
-                        continue
-                    price_lower = tick_to_price(
-                        tick_index, self.token0_decimals, self.token1_decimals
-                    )
-                    price_upper = tick_to_price(
-                        tick_index + tick_spacing, self.token0_decimals, self.token1_decimals
-                    )
-                    ticks[tick_index] = TickLiquidity(
-                        lower_tick=tick_index,
-                        upper_tick=tick_index + tick_spacing,
-                        liquidity=liquidity_gross,
-                        token0_reserves=price_lower,
-                        token1_reserves=price_upper,
-                        liquidity_net=liquidity_net,
-                    )
+        # TickLens 返回 (tick, liquidityNet, liquidityGross)，word 内按 tick 降序
+        with snapshot_phase("decode", phases, self.multicall):
+            rows = [
+                (tick_info[0], tick_info[2], tick_info[1])
+                for response in responses
+                for tick_info in response[0]
+                if tick_info[2] != 0
+            ]
+            ticks = TickStore.from_columns(tick_spacing, *zip(*rows)) if rows else TickStore(tick_spacing)
         return Snapshot(
             ticks=ticks,
             price_state=PriceState(sqrt_price_x96=sqrt_price_x96, tick=current_tick),
             protocol="pancake_v3",
             pool_address=self.pool_address,
+            block_number=block_number,
+            tick_spacing=tick_spacing,
+            phases=phases,
         )
-
-    def _event_to_delta(self, raw_log) -> LiquidityDeltaEvent:
-        topics = raw_log.get("topics", [])
-        data = raw_log.get("data", "0x")
-        if topics[0] == self.stream.topics[0]:
-            decoded = decode(["address", "address", "int24", "int24", "uint128", "uint256", "uint256"], bytes.fromhex(data[2:]))
-            lower_tick, upper_tick, liquidity = int(decoded[2]), int(decoded[3]), int(decoded[4])
-            event_type = "Mint"
-        else:
-            decoded = decode(["address", "int24", "int24", "uint128", "uint256", "uint256"], bytes.fromhex(data[2:]))
-            lower_tick, upper_tick, liquidity = int(decoded[1]), int(decoded[2]), -int(decoded[3])
-            event_type = "Burn"
-        return LiquidityDeltaEvent(
-            tx_hash=raw_log.get("transactionHash", "0x"),
-            lower_tick=lower_tick,
-            upper_tick=upper_tick,
-            liquidity_delta=liquidity,
-            block_number=int(raw_log.get("blockNumber", 0), 16) if isinstance(raw_log.get("blockNumber"), str) else raw_log.get("blockNumber", 0),
-            timestamp=int(time.time()),
-            event_type=event_type,
-        )
-
-    def stream_events(self) -> Iterable[LiquidityDeltaEvent]:
-        for raw in self.stream.stream():
-            yield self._event_to_delta(raw)
-
-    def _batched_functions(
-        self, functions: Sequence, batch_size: int = 80
-    ) -> Iterable[Sequence]:
-        for i in range(0, len(functions), batch_size):
-            yield functions[i : i + batch_size]
@@ -0,0 +1,145 @@
+import dataclasses
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List
+
+from app.config import PoolConfig
+from app.decoding import (
+    PANCAKE_SWAP_TOPIC,
+    V3_LIQUIDITY_DECODERS,
+    V3_SWAP_TOPIC,
+    V4_LIQUIDITY_DECODERS,
+    V4_SWAP_TOPIC,
+    LiquidityDecoder,
+    log_block_number,
+)
+from app.protocols.base import ProtocolAdapter
+from app.recording import pool_config_from_dict, read_recording, snapshot_from_dict
+from app.types import LiquidityDeltaEvent, PriceState, Snapshot, SwapEvent
+
+# protocol -> (Swap topic0, 流动性事件 topic0 -> (event_type, decoder))，与各协议适配器一致
+PROTOCOL_TOPICS: Dict[str, tuple[str, Dict[str, tuple[str, LiquidityDecoder]]]] = {
+    "uniswap_v3": (V3_SWAP_TOPIC, V3_LIQUIDITY_DECODERS),
+    "pancake_v3": (PANCAKE_SWAP_TOPIC, V3_LIQUIDITY_DECODERS),
+    "uniswap_v4": (V4_SWAP_TOPIC, V4_LIQUIDITY_DECODERS),
+}
+
+
+def paced(records: Iterable[dict], speed: float) -> Iterator[dict]:
+    """Yield log records no faster than ``speed`` x their recorded pace; ``speed <= 0`` means as fast as possible."""
+    if speed <= 0:
+        yield from records
+        return
+    start = None
+    wall_start = time.monotonic()
+    for record in records:
+        if start is None:
+            start = record["t"]
+        delay = (record["t"] - start) / speed - (time.monotonic() - wall_start)
+        if delay > 0:
+            time.sleep(delay)
+        yield record
+
+
+def log_records(path: str) -> Iterator[dict]:
+    """The ``log`` records of a recording, in order."""
+    for record in read_recording(path):
+        if record["type"] == "log":
+            yield record
+
+
+class RecordedLogStream:
+    """Stands in for WebsocketLogStream: yields one pool's recorded raw logs, paced by ``speed``."""
+
+    def __init__(self, path: str, address: str, topics: List[str], pool_id: str | None = None, speed: float = 0.0):
+        self.path = path
+        self.address = address
+        self.topics = topics
+        self.pool_id = pool_id.lower() if pool_id else None
+        self.speed = speed
+        self.backfill_chunk_size = 0
+        self.last_complete_block: int | None = None
+        self.subscribed = threading.Event()
+        self.subscribed.set()
+
+    def _matches(self, raw_log: dict) -> bool:
+        if str(raw_log.get("address", "")).lower() != self.address.lower():
+            return False
+        if self.pool_id is None:
+            return True
+        topics = raw_log.get("topics", [])
+        return len(topics) > 1 and topics[1].lower() == self.pool_id
+
+    def records(self) -> Iterator[dict]:
+        """This pool's log records (``t`` and ``log``), unpaced."""
+        for record in log_records(self.path):
+            if self._matches(record["log"]):
+                yield record
+
+    def stream(self, from_block: int | None = None) -> Iterator[dict]:
+        for record in paced(self.records(), self.speed):
+            if from_block is None or log_block_number(record["log"]) >= from_block:
+                yield record["log"]
+
+
+class ReplayAdapter(ProtocolAdapter):
+    """Serves one pool from a recording: the recorded start snapshot, then its raw logs.
+
+    Decoding uses the same fixed-layout decoders as the live adapter for the
+    pool's protocol, and needs no RPC connection.
+    """
+
+    def __init__(self, path: str, pool: PoolConfig, snapshot: Snapshot, speed: float = 0.0):
+        super().__init__(None, pool.pool_address)
+        if pool.protocol not in PROTOCOL_TOPICS:
+            raise ValueError(f"Cannot replay unknown protocol {pool.protocol!r}")
+        self.swap_topic, self.liquidity_decoders = PROTOCOL_TOPICS[pool.protocol]
+        self.pool_id = pool.pool_id if pool.protocol == "uniswap_v4" else None
+        self.snapshot = snapshot
+        self.stream = RecordedLogStream(
+            path, self.pool_address, [*self.liquidity_decoders, self.swap_topic], self.pool_id, speed
+        )
+
+    @classmethod
+    def from_recording(cls, path: str, label: str | None = None, speed: float = 0.0) -> "ReplayAdapter":
+        """Adapter for the pool recorded under ``label`` (the first pool if None)."""
+        for record in read_recording(path):
+            if record["type"] != "pool":
+                break
+            if label is None or record["label"] == label:
+                return cls(path, pool_config_from_dict(record["pool"]), snapshot_from_dict(record["snapshot"]), speed)
+        raise ValueError(f"No pool {label!r} in recording {path}")
+
+    def fetch_snapshot(self) -> Snapshot:
+        # 状态机会原地修改 tick 表，每次返回一份副本
+        price_state = self.snapshot.price_state
+        return dataclasses.replace(
+            self.snapshot,
+            ticks=self.snapshot.ticks.copy(),
+            price_state=PriceState(sqrt_price_x96=price_state.sqrt_price_x96, tick=price_state.tick),
+            phases=[],
+        )
+
+    def _event_to_delta(self, raw_log) -> LiquidityDeltaEvent | SwapEvent | None:
+        if self.pool_id is not None:
+            topics = raw_log.get("topics")
+            if not topics or len(topics) < 2 or topics[1].lower() != self.pool_id.lower():
+                return None
+        return super()._event_to_delta(raw_log)
+
+    def stream_events(self) -> Iterable[LiquidityDeltaEvent | SwapEvent]:
+        for record in paced(self.stream.records(), self.stream.speed):
+            event = self.decode_log(record["log"])
+            if event is not None:
+                event.timestamp = int(record["t"])
+                yield event
+
+    def replay_events(self, from_block: int, to_block: int) -> Iterable[LiquidityDeltaEvent | SwapEvent]:
+        for record in self.stream.records():
+            block_number = log_block_number(record["log"])
+            if block_number > to_block:
+                break
+            if block_number >= from_block:
+                event = self.decode_log(record["log"])
+                if event is not None:
+                    yield event
@@ -1,14 +1,13 @@
-import time
-from typing import Iterable, List, Sequence
-from eth_abi import decode
-from eth_utils import keccak
+from typing import Iterable, List
 from web3 import Web3
 from web3.contract.contract import ContractEvent, ContractFunction
 
+from app.decoding import V3_LIQUIDITY_DECODERS, V3_SWAP_TOPIC
 from app.multicall import MulticallClient
-from app.pricing import tick_to_price
-from app.types import LiquidityDeltaEvent, PriceState, Snapshot, TickLiquidity
-from app.protocols.base import ProtocolAdapter
+from app.tick_store import TickStore
+from app.types import PriceState, Snapshot, SnapshotPhase
+from app.protocols.base import ProtocolAdapter, snapshot_phase
+from app.protocols.bitmap import MAX_TICK, MIN_TICK, fetch_populated_words, ticks_in_word, word_range
 from app.wss import WebsocketLogStream
 
 
@@ -22,151 +21,83 @@ class UniswapV3Adapter(ProtocolAdapter):
         multicall: MulticallClient,
         token0_decimals: int,
         token1_decimals: int,
+        bitmap_batch_size: int = 200,
+        tick_batch_size: int = 100,
     ):
         super().__init__(web3, pool_address)
         self.pool_contract = web3.eth.contract(address=self.pool_address, abi=abi)
         self._mint_event: ContractEvent = self.pool_contract.events.Mint
         self._burn_event: ContractEvent = self.pool_contract.events.Burn
         self._swap_event: ContractEvent = self.pool_contract.events.Swap
+        self.swap_topic = V3_SWAP_TOPIC
+        self.liquidity_decoders = V3_LIQUIDITY_DECODERS
         self.stream = WebsocketLogStream(
             wss_url,
             self.pool_address,
-            [
-                keccak(text="Mint(address,address,int24,int24,uint128,uint256,uint256)").hex(),
-                keccak(text="Burn(address,int24,int24,uint128,uint256,uint256)").hex(),
-            ],
+            [*self.liquidity_decoders, self.swap_topic],
+            web3=web3,
         )
         self.multicall = multicall
         self.token0_decimals = token0_decimals
         self.token1_decimals = token1_decimals
+        self.bitmap_batch_size = bitmap_batch_size
+        self.tick_batch_size = tick_batch_size
 
     def fetch_snapshot(self) -> Snapshot:
-        slot0_fn = self.pool_contract.functions.slot0()
-        tick_spacing_fn = self.pool_contract.functions.tickSpacing()
-        slot0_result, tick_spacing_result = self.multicall.call_functions(
-            [slot0_fn, tick_spacing_fn]
-        )
+        # 所有读取固定在同一个区块，保证 Snapshot 一致
+        block_number = self.web3.eth.block_number
+        phases: List[SnapshotPhase] = []
+        with snapshot_phase("slot0", phases, self.multicall):
+            slot0_fn = self.pool_contract.functions.slot0()
+            tick_spacing_fn = self.pool_contract.functions.tickSpacing()
+            slot0_result, tick_spacing_result = self.multicall.call_functions(
+                [slot0_fn, tick_spacing_fn], block_identifier=block_number
+            )
         tick_spacing = tick_spacing_result[0]
         current_tick = slot0_result[1]
         sqrt_price_x96 = slot0_result[0]
-        ticks: dict[int, TickLiquidity] = {}
-        min_tick = -887272
-        max_tick = 887272
-        for tick_index in self._collect_initialized_ticks(min_tick, max_tick, tick_spacing):
-            liquidity_gross, liquidity_net, *_ = self.pool_contract.functions.ticks(tick_index).call()
-            if liquidity_gross == 0:
-                continue
-            price_lower = tick_to_price(tick_index, self.token0_decimals, self.token1_decimals)
-            price_upper = tick_to_price(
-                tick_index + tick_spacing, self.token0_decimals, self.token1_decimals
+        with snapshot_phase("bitmap", phases, self.multicall):
+            tick_indices = list(
+                self._collect_initialized_ticks(MIN_TICK, MAX_TICK, tick_spacing, block_number)
             )
-            ticks[tick_index] = TickLiquidity(
-                lower_tick=tick_index,
-                upper_tick=tick_index + tick_spacing,
-                liquidity=liquidity_gross,
-                token0_reserves=price_lower,
-                token1_reserves=price_upper,
-                liquidity_net=liquidity_net,
+        with snapshot_phase("ticks", phases, self.multicall):
+            tick_functions = [self.pool_contract.functions.ticks(tick_index) for tick_index in tick_indices]
+            tick_results = self.multicall.call_all(
+                tick_functions,
+                self.tick_batch_size,
+                block_identifier=block_number,
             )
+        with snapshot_phase("decode", phases, self.multicall):
+            rows = [
+                (tick_index, liquidity_gross, liquidity_net)
+                for tick_index, (liquidity_gross, liquidity_net, *_) in zip(tick_indices, tick_results)
+                if liquidity_gross != 0
+            ]
+            ticks = TickStore.from_columns(tick_spacing, *zip(*rows)) if rows else TickStore(tick_spacing)
         return Snapshot(
             ticks=ticks,
             price_state=PriceState(sqrt_price_x96=sqrt_price_x96, tick=current_tick),
             protocol="uniswap_v3",
             pool_address=self.pool_address,
+            block_number=block_number,
+            tick_spacing=tick_spacing,
+            phases=phases,
         )
 
-    def _event_to_delta(self, raw_log) -> LiquidityDeltaEvent:
-        topics = raw_log.get("topics", [])
-        data = raw_log.get("data", "0x")
-        if not topics:
-            raise ValueError("Missing topics in log")
-        if topics[0] == self.stream.topics[0]:
-            decoded = self._decode_mint_event(data)
-            if decoded is None:
-                raise ValueError("Unable to decode Mint event payload")
-            lower_tick, upper_tick, liquidity = int(decoded["tickLower"]), int(decoded["tickUpper"]), int(decoded["amount"])
-            event_type = "Mint"
-        else:
-            decoded = self._decode_burn_event(data)
-            if decoded is None:
-                raise ValueError("Unable to decode Burn event payload")
-            lower_tick, upper_tick, liquidity = int(decoded["tickLower"]), int(decoded["tickUpper"]), -int(decoded["amount"])
-            event_type = "Burn"
-        return LiquidityDeltaEvent(
-            tx_hash=raw_log.get("transactionHash", "0x"),
-            lower_tick=lower_tick,
-            upper_tick=upper_tick,
-            liquidity_delta=liquidity,
-            block_number=int(raw_log.get("blockNumber", 0), 16) if isinstance(raw_log.get("blockNumber"), str) else raw_log.get("blockNumber", 0),
-            timestamp=int(time.time()),
-            event_type=event_type,
-        )
-
-    def stream_events(self) -> Iterable[LiquidityDeltaEvent]:
-        for raw in self.stream.stream():
-            try:
-                yield self._event_to_delta(raw)
-            except ValueError:
-                continue
-
-    def _collect_initialized_ticks(self, min_tick: int, max_tick: int, tick_spacing: int) -> Iterable[int]:
+    def _collect_initialized_ticks(
+        self, min_tick: int, max_tick: int, tick_spacing: int, block_number: int | None = None
+    ) -> Iterable[int]:
         """
         [Refactored] Use Multicall to batch fetch tick bitmaps.
         """
-        word_size = 256
-        min_word = math.floor(min_tick / tick_spacing / word_size)
-        max_word = math.ceil(max_tick / tick_spacing / word_size)
-        
-        word_indices = list(range(min_word, max_word + 1))
-        
-        # 将请求分批，每批查询 200 个 Bitmap Word (约 500ms)
-        batch_size = 200
-        for i in range(0, len(word_indices), batch_size):
-            chunk = word_indices[i : i + batch_size]
-            
-            # 1. 构造 Multicall 请求
-            calls = [self.pool_contract.functions.tickBitmap(w) for w in chunk]
-            
-            try:
-                # 2. 批量执行
-                bitmaps = self.multicall.call_functions(calls)
-            except Exception as e:
-                print(f"Bitmap batch fetch failed: {e}")
-                continue
-            
-            # 3. 本地解析
-            for word_index, (bitmap,) in zip(chunk, bitmaps):
-                if bitmap == 0:
-                    continue
-                for bit_pos in range(word_size):
-                    if (bitmap >> bit_pos) & 1:
-                        normalized_tick = (word_index * word_size) + bit_pos
-                        tick_index = normalized_tick * tick_spacing
-                        if min_tick <= tick_index <= max_tick:
-                            yield tick_index
-
-    def _decode_mint_event(self, data: str) -> dict | None:
-        field_names = ["sender", "owner", "tickLower", "tickUpper", "amount", "amount0", "amount1"]
-        try:
-            decoded = decode(
-                ["address", "address", "int24", "int24", "uint128", "uint256", "uint256"],
-                bytes.fromhex(data[2:]),
-            )
-        except Exception:
-            return None
-        if len(decoded) != len(field_names):
-            return None
-        return dict(zip(field_names, decoded))
-
-    def _decode_burn_event(self, data: str) -> dict | None:
-        field_names = ["owner", "tickLower", "tickUpper", "amount", "amount0", "amount1"]
-        try:
-            decoded = decode(
-                ["address", "int24", "int24", "uint128", "uint256", "uint256"],
-                bytes.fromhex(data[2:]),
-            )
-        except Exception:
-            return None
-        if len(decoded) != len(field_names):
-            return None
-        return dict(zip(field_names, decoded))
+        populated_words = fetch_populated_words(
+            self.multicall,
+            self.pool_contract.functions.tickBitmap,
+            word_range(tick_spacing, min_tick, max_tick),
+            self.bitmap_batch_size,
+            block_number,
+        )
+        for word_index, bitmap in populated_words:
+            for tick_index in ticks_in_word(word_index, bitmap, tick_spacing):
+                if min_tick <= tick_index <= max_tick:
+                    yield tick_index
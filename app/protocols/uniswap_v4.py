@@ -1,15 +1,36 @@
-import time
-from typing import Iterable, List, Sequence
-from eth_abi import decode
+from typing import List
 from eth_utils import keccak
 from web3 import Web3
 
+from app.decoding import V4_LIQUIDITY_DECODERS, V4_SWAP_TOPIC
 from app.multicall import MulticallClient
-from app.pricing import tick_to_price
-from app.protocols.base import ProtocolAdapter
-from app.types import LiquidityDeltaEvent, PriceState, Snapshot, TickLiquidity
+from app.protocols.base import ProtocolAdapter, snapshot_phase
+from app.protocols.bitmap import fetch_populated_words, ticks_in_word, word_range
+from app.tick_store import TickStore
+from app.types import LiquidityDeltaEvent, PriceState, Snapshot, SnapshotPhase, SwapEvent
 from app.wss import WebsocketLogStream
 
+# v4-core StateLibrary 存储布局
+POOLS_SLOT = 6
+TICKS_OFFSET = 4
+TICK_BITMAP_OFFSET = 5
+
+# 常见 fee 档位对应的 tickSpacing (动态费率池需显式配置)
+DEFAULT_TICK_SPACINGS = {100: 1, 500: 10, 3000: 60, 10000: 200}
+
+
+def _slot_bytes(slot: int) -> bytes:
+    return slot.to_bytes(32, "big")
+
+
+def _mapping_slot(key: int, mapping_slot: int) -> bytes:
+    # keccak256(abi.encodePacked(int256(key), mappingSlot))
+    return keccak(key.to_bytes(32, "big", signed=True) + _slot_bytes(mapping_slot))
+
+
+def _to_signed(value: int, bits: int) -> int:
+    return value - (1 << bits) if value >> (bits - 1) else value
+
 
 class UniswapV4Adapter(ProtocolAdapter):
     def __init__(
@@ -22,105 +43,97 @@ class UniswapV4Adapter(ProtocolAdapter):
         multicall: MulticallClient,
         token0_decimals: int,
         token1_decimals: int,
+        tick_spacing: int,
+        bitmap_batch_size: int = 200,
+        tick_batch_size: int = 120,
     ):
         super().__init__(web3, pool_manager_address)
         self.pool_id = pool_id
         self.pool_manager = web3.eth.contract(address=self.pool_address, abi=abi)
+        self.swap_topic = V4_SWAP_TOPIC
+        self.liquidity_decoders = V4_LIQUIDITY_DECODERS
         self.stream = WebsocketLogStream(
             wss_url,
             self.pool_address,
-            [
-                keccak(text="ModifyLiquidity((bytes32,address,int24,int24,int256,int256))").hex(),
-                keccak(text="Mint(address,bytes32,int24,int24,int128)").hex(),
-            ],
+            [*self.liquidity_decoders, self.swap_topic],
+            web3=web3,
         )
         self.multicall = multicall
         self.token0_decimals = token0_decimals
         self.token1_decimals = token1_decimals
+        self.tick_spacing = tick_spacing
+        self.bitmap_batch_size = bitmap_batch_size
+        self.tick_batch_size = tick_batch_size
 
     def fetch_snapshot(self) -> Snapshot:
-        # PoolManager exposes concentrated liquidity via poolId.
-        ticks: dict[int, TickLiquidity] = {}
-        fn_tick_spacing = self.pool_manager.functions.tickSpacing(self.pool_id)
-        fn_current_tick = self.pool_manager.functions.getCurrentTick(self.pool_id)
-        fn_sqrt_price = self.pool_manager.functions.getCurrentSqrtPrice(self.pool_id)
-        tick_spacing_result, current_tick_result, sqrt_price_result = self.multicall.call_functions(
-            [fn_tick_spacing, fn_current_tick, fn_sqrt_price]
-        )
-        tick_spacing = tick_spacing_result[0]
-        current_tick = current_tick_result[0]
-        sqrt_price_x96 = sqrt_price_result[0]
-        min_tick = -887272
-        max_tick = 887272
-        tick_indices = list(range(min_tick, max_tick, tick_spacing))
-        tick_functions = [
-            self.pool_manager.functions.getTickLiquidity(self.pool_id, tick_index)
-            for tick_index in tick_indices
+        # PoolManager 不暴露 tick 视图函数，按 StateLibrary 的存储布局用 extsload 直接读槽位
+        block_number = self.web3.eth.block_number
+        phases: List[SnapshotPhase] = []
+        tick_spacing = self.tick_spacing
+        state_slot = self._pool_state_slot()
+        with snapshot_phase("slot0", phases, self.multicall):
+            ((slot0_word,),) = self.multicall.call_functions(
+                [self.pool_manager.functions.extsload(_slot_bytes(state_slot))],
+                block_identifier=block_number,
+            )
+        slot0 = int.from_bytes(slot0_word, "big")
+        sqrt_price_x96 = slot0 & ((1 << 160) - 1)
+        current_tick = _to_signed((slot0 >> 160) & ((1 << 24) - 1), 24)
+        # 1. 扫描 tickBitmap 槽位，只保留非空 word
+        with snapshot_phase("bitmap", phases, self.multicall):
+            populated_words = fetch_populated_words(
+                self.multicall,
+                lambda word_index: self.pool_manager.functions.extsload(
+                    _mapping_slot(word_index, state_slot + TICK_BITMAP_OFFSET)
+                ),
+                word_range(tick_spacing),
+                self.bitmap_batch_size,
+                block_number,
+            )
+        # 2. 只读取已初始化的 tick (liquidityGross | liquidityNet 打包在第一个槽位)
+        tick_indices = [
+            tick_index
+            for word_index, bitmap in populated_words
+            for tick_index in ticks_in_word(word_index, bitmap, tick_spacing)
         ]
-        for batch, tick_batch in zip(self._batched_functions(tick_functions), self._batched_ticks(tick_indices)):
-            liquidity_results = self.multicall.call_functions(batch)
-            for tick_index, (liquidity,) in zip(tick_batch, liquidity_results):
-                if liquidity == 0:
+        with snapshot_phase("ticks", phases, self.multicall):
+            tick_functions = [
+                self.pool_manager.functions.extsload(_mapping_slot(tick_index, state_slot + TICKS_OFFSET))
+                for tick_index in tick_indices
+            ]
+            tick_results = self.multicall.call_all(
+                tick_functions,
+                self.tick_batch_size,
+                block_identifier=block_number,
+            )
+        with snapshot_phase("decode", phases, self.multicall):
+            ticks = TickStore(tick_spacing)
+            for tick_index, (tick_word,) in zip(tick_indices, tick_results):
+                tick_info = int.from_bytes(tick_word, "big")
+                liquidity_gross = tick_info & ((1 << 128) - 1)
+                liquidity_net = _to_signed(tick_info >> 128, 128)
+                if liquidity_gross == 0:
                     continue
-                price_lower = tick_to_price(
-                    tick_index, self.token0_decimals, self.token1_decimals
-                )
-                price_upper = tick_to_price(
-                    tick_index + tick_spacing, self.token0_decimals, self.token1_decimals
-                )
-                ticks[tick_index] = TickLiquidity(
-                    lower_tick=tick_index,
-                    upper_tick=tick_index + tick_spacing,
-                    liquidity=liquidity,
-                    token0_reserves=price_lower,
-                    token1_reserves=price_upper,
-                )
+                # bitmap 按 tick 升序返回，add 总是追加到列尾
+                ticks.add(tick_index, liquidity_gross, liquidity_net)
         return Snapshot(
             ticks=ticks,
             price_state=PriceState(sqrt_price_x96=sqrt_price_x96, tick=current_tick),
             protocol="uniswap_v4",
             pool_address=self.pool_address,
+            block_number=block_number,
+            tick_spacing=tick_spacing,
+            phases=phases,
         )
 
-    def _event_to_delta(self, raw_log) -> LiquidityDeltaEvent:
-        topics = raw_log.get("topics", [])
-        data = raw_log.get("data", "0x")
-        if topics[0] == self.stream.topics[0]:
-            decoded = decode(["bytes32", "address", "int24", "int24", "int256", "int256"], bytes.fromhex(data[2:]))
-            pool_id, lower_tick, upper_tick, _, delta, _ = decoded
-            liquidity = int(delta)
-            event_type = "ModifyLiquidity"
-            if pool_id.hex() != self.pool_id[2:]:
-                return None  # Ignore unrelated pools in PoolManager singleton.
-        else:
-            decoded = decode(["address", "bytes32", "int24", "int24", "int128"], bytes.fromhex(data[2:]))
-            pool_id, lower_tick, upper_tick, delta = decoded[1], decoded[2], decoded[3], decoded[4]
-            if pool_id.hex() != self.pool_id[2:]:
-                return None
-            liquidity = int(delta)
-            event_type = "Mint"
-        return LiquidityDeltaEvent(
-            tx_hash=raw_log.get("transactionHash", "0x"),
-            lower_tick=int(lower_tick),
-            upper_tick=int(upper_tick),
-            liquidity_delta=int(liquidity),
-            block_number=int(raw_log.get("blockNumber", 0), 16) if isinstance(raw_log.get("blockNumber"), str) else raw_log.get("blockNumber", 0),
-            timestamp=int(time.time()),
-            event_type=event_type,
-        )
-
-    def stream_events(self) -> Iterable[LiquidityDeltaEvent]:
-        for raw in self.stream.stream():
-            event = self._event_to_delta(raw)
-            if event:
-                yield event
-
-    def _batched_functions(
-        self, functions: Sequence, batch_size: int = 120
-    ) -> Iterable[Sequence]:
-        for i in range(0, len(functions), batch_size):
-            yield functions[i : i + batch_size]
+    def _pool_state_slot(self) -> int:
+        # StateLibrary._getPoolStateSlot: keccak256(abi.encodePacked(poolId, POOLS_SLOT))
+        pool_id = bytes.fromhex(self.pool_id[2:] if self.pool_id.startswith("0x") else self.pool_id)
+        return int.from_bytes(keccak(pool_id + POOLS_SLOT.to_bytes(32, "big")), "big")
 
-    def _batched_ticks(self, ticks: Sequence[int], batch_size: int = 120) -> Iterable[Sequence[int]]:
-        for i in range(0, len(ticks), batch_size):
-            yield ticks[i : i + batch_size]
+    def _event_to_delta(self, raw_log) -> LiquidityDeltaEvent | SwapEvent | None:
+        # PoolManager 是单例合约：Swap 和 ModifyLiquidity 的 poolId 都是 indexed 参数 (topics[1])
+        topics = raw_log.get("topics")
+        if not topics or len(topics) < 2 or topics[1].lower() != self.pool_id.lower():
+            return None
+        return super()._event_to_delta(raw_log)
@@ -0,0 +1,100 @@
+"""Recorded pool activity: per-pool start snapshots followed by the raw logs as they were applied.
+
+One JSON object per line, gzip-compressed when the path ends in ``.gz``::
+
+    {"type": "pool", "label": ..., "pool": {PoolConfig fields}, "snapshot": {...}}
+    {"type": "log", "t": <unix time applied>, "log": {raw log as sent by the node}}
+
+Pool records come first. Raw logs keep the node's hex-string shape, so they
+decode exactly like live subscription payloads. Liquidity values are written as
+JSON integers (128-bit values round-trip through Python's json).
+"""
+
+import dataclasses
+import gzip
+import json
+import logging
+import time
+from typing import IO, Iterable, Iterator
+
+from app.config import PoolConfig
+from app.tick_store import TickStore
+from app.types import PriceState, Snapshot
+
+
+def _open(path: str, mode: str) -> IO[str]:
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def snapshot_to_dict(snapshot: Snapshot, block_number: int) -> dict:
+    tick_column, gross, net = TickStore.from_mapping(snapshot.tick_spacing or 1, snapshot.ticks).columns()
+    return {
+        "protocol": snapshot.protocol,
+        "pool_address": snapshot.pool_address,
+        "block_number": block_number,
+        "tick_spacing": snapshot.tick_spacing,
+        "sqrt_price_x96": snapshot.price_state.sqrt_price_x96,
+        "tick": snapshot.price_state.tick,
+        "ticks": tick_column.tolist(),
+        "gross": gross,
+        "net": net,
+    }
+
+
+def snapshot_from_dict(data: dict) -> Snapshot:
+    tick_spacing = data.get("tick_spacing")
+    return Snapshot(
+        ticks=TickStore.from_columns(tick_spacing or 1, data["ticks"], data["gross"], data["net"]),
+        price_state=PriceState(sqrt_price_x96=data.get("sqrt_price_x96"), tick=data.get("tick")),
+        protocol=data["protocol"],
+        pool_address=data["pool_address"],
+        block_number=data["block_number"],
+        tick_spacing=tick_spacing,
+    )
+
+
+class RecordingWriter:
+    """Appends pool snapshots and applied raw logs to a recording file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = _open(path, "w")
+        self.logs = 0
+
+    def write_pool(self, label: str, pool: PoolConfig, snapshot: Snapshot, block_number: int) -> None:
+        record = {
+            "type": "pool",
+            "label": label,
+            "pool": dataclasses.asdict(pool),
+            "snapshot": snapshot_to_dict(snapshot, block_number),
+        }
+        self._file.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+    def write_logs(self, raw_logs: Iterable[dict]) -> None:
+        now = time.time()
+        for raw_log in raw_logs:
+            self._file.write(json.dumps({"type": "log", "t": now, "log": raw_log}, separators=(",", ":")) + "\n")
+            self.logs += 1
+
+    def close(self) -> None:
+        self._file.close()
+        logging.info(f"Recorded {self.logs} logs to {self.path}")
+
+
+def read_recording(path: str) -> Iterator[dict]:
+    """Records in file order; a recording cut off by a crash ends at its last complete line."""
+    with _open(path, "r") as f:
+        try:
+            for line in f:
+                if line.endswith("\n"):
+                    yield json.loads(line)
+        except EOFError:
+            # gzip 文件没有正常关闭 (进程被杀)，读到的部分仍然有效
+            logging.warning(f"Recording {path} is truncated")
+
+
+def pool_config_from_dict(data: dict) -> PoolConfig:
+    fields = {field.name for field in dataclasses.fields(PoolConfig)}
+    return PoolConfig(**{key: value for key, value in data.items() if key in fields})
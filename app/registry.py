@@ -0,0 +1,233 @@
+import dataclasses
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List
+
+from web3 import Web3
+from web3.exceptions import BlockNotFound
+
+from app.config import AppConfig, PoolConfig
+from app.metrics import log_received
+from app.recording import RecordingWriter
+from app.spool import LogSpool
+from app.state_machine import LiquidityStateMachine, build_adapter
+from app.types import LiquidityDeltaEvent, SwapEvent
+from app.wss import WebsocketLogStream
+
+# 等待启动订阅确认的最长时间；超时后仍拉取快照，由连上后的 eth_getLogs 补齐
+_SUBSCRIBE_TIMEOUT = 30.0
+
+
+def pool_label(pool: PoolConfig) -> str:
+    if pool.name:
+        return pool.name
+    return f"{pool.token1}/{pool.token0} {(pool.pool_id or pool.pool_address)[:10]}"
+
+
+class PoolRouter:
+    """Routes raw logs to per-pool state machines and applies them in batches.
+
+    Logs are routed by emitting address, and Uniswap V4 PoolManager logs
+    additionally by poolId (topics[1]). Logs from blocks at or before a machine's
+    start block are already part of its state and are dropped.
+    """
+
+    def __init__(self, machines: Dict[str, LiquidityStateMachine]):
+        self.machines = machines
+        # address -> {poolId (V4) 或 None -> 状态机}
+        self._routes: Dict[str, Dict[str | None, LiquidityStateMachine]] = {}
+        for machine in machines.values():
+            address = machine.adapter.pool_address.lower()
+            pool_id = machine.config.pool.pool_id if machine.config.pool.protocol == "uniswap_v4" else None
+            self._routes.setdefault(address, {})[pool_id.lower() if pool_id else None] = machine
+        self._labels = {id(machine): label for label, machine in machines.items()}
+        self._start_blocks = {id(machine): machine.start_block for machine in machines.values()}
+
+    def route(self, raw_log: dict) -> LiquidityStateMachine | None:
+        pools = self._routes.get(str(raw_log.get("address", "")).lower())
+        if not pools:
+            return None
+        if None in pools:
+            return pools[None]
+        topics = raw_log.get("topics", [])
+        return pools.get(topics[1].lower()) if len(topics) > 1 else None
+
+    def process_batch(self, raw_logs: Iterable[dict]) -> List[tuple[str, LiquidityDeltaEvent]]:
+        """Route and decode a frame of raw logs, then apply them with one ``apply_events`` per pool.
+
+        Returns (label, event) for the liquidity changes actually applied (duplicates
+        dropped by the state machine are left out), in log order per pool.
+        """
+        batches: Dict[int, tuple[LiquidityStateMachine, List[LiquidityDeltaEvent | SwapEvent]]] = {}
+        for raw_log in raw_logs:
+            machine = self.route(raw_log)
+            if machine is None:
+                continue
+            event = machine.adapter.decode_log(raw_log)
+            # 快照 / 缓存补齐已包含的区块 (启动时 spool 中的早期日志)
+            if event is not None and event.block_number > self._start_blocks[id(machine)]:
+                batches.setdefault(id(machine), (machine, []))[1].append(event)
+        applied: List[tuple[str, LiquidityDeltaEvent]] = []
+        for machine, events in batches.values():
+            label = self._labels[id(machine)]
+            applied.extend((label, event) for event in machine.apply_events(events))
+        return applied
+
+    def __len__(self) -> int:
+        return len(self.machines)
+
+
+class PoolRegistry(PoolRouter):
+    """Per-pool state machines fed from one shared ``eth_subscribe`` over every pool address.
+
+    The subscription is opened before any snapshot is taken and spools raw logs
+    (memory, spilling to disk) while the snapshots run. Each pool then applies only
+    spooled logs from blocks after its snapshot (or cache catch-up) block, so a
+    cold start has no gap between the snapshot and the live stream.
+
+    All machines share the caller's Web3 client and MulticallClient, so their
+    snapshot sweeps run through the same concurrent multicall window. With
+    ``RECORD_PATH`` set, start snapshots and every applied raw log are written to
+    a recording for offline replay.
+    """
+
+    def __init__(self, web3: Web3, config: AppConfig, abis: dict):
+        self.web3 = web3
+        self.config = config
+        adapters = {}
+        for pool in config.pools:
+            label = pool_label(pool)
+            if label in adapters:
+                raise ValueError(f"Duplicate pool label {label!r}, set a unique name per pool")
+            pool_config = dataclasses.replace(config, pool=pool)
+            adapters[label] = (pool_config, build_adapter(web3, pool_config, abis))
+
+        addresses: List[str] = []
+        topics: List[str] = []
+        for _, adapter in adapters.values():
+            if adapter.pool_address not in addresses:
+                addresses.append(adapter.pool_address)
+            topics.extend(topic for topic in adapter.stream.topics if topic not in topics)
+        self.stream = WebsocketLogStream(
+            config.chain.wss_url, addresses, topics, web3=web3, dedupe_depth=config.chain.finality_depth
+        )
+
+        # 先订阅再拉取快照：快照期间到达的日志进入 spool，快照完成后只应用晚于各自快照区块的部分
+        self.spool = LogSpool(config.runtime.spool_size, config.runtime.spool_dir)
+        self._spooling = threading.Event()
+        self._spooling.set()
+        # 写入 spool / 已交给 process_batch 的日志数；线程模式的重组检查等两者追平后才执行
+        self._progress = threading.Condition()
+        self._spooled = 0
+        self._processed = 0
+        # 订阅前记下链头：快照区块不早于它，首次连接就从它之后补齐，订阅生效前的日志不会漏掉
+        spool_from = web3.eth.block_number + 1
+        threading.Thread(target=self._spool_logs, args=(spool_from,), daemon=True).start()
+        if not self.stream.subscribed.wait(_SUBSCRIBE_TIMEOUT):
+            logging.warning(f"Log subscription not confirmed after {_SUBSCRIBE_TIMEOUT:.0f}s, snapshotting anyway")
+
+        machines: Dict[str, LiquidityStateMachine] = {}
+        with ThreadPoolExecutor(max_workers=max(1, config.snapshot.pool_concurrency)) as executor:
+            futures = [
+                (label, executor.submit(LiquidityStateMachine, web3, pool_config, abis, adapter))
+                for label, (pool_config, adapter) in adapters.items()
+            ]
+            for label, future in futures:
+                machines[label] = future.result()
+                logging.info(f"Pool {label} ready")
+
+        super().__init__(machines)
+        self.stream.reorg_check = self._check_reorgs_when_applied
+        self.recorder: RecordingWriter | None = None
+        if config.runtime.record_path:
+            self._start_recording(config.runtime.record_path)
+        logging.info(f"{len(self.spool)} logs spooled during snapshots ({self.spool.total_spilled} spilled to disk)")
+
+    def _spool_logs(self, from_block: int) -> None:
+        for raw_log in self.stream.stream(from_block=from_block):
+            if not self._spooling.is_set():
+                break
+            self.spool.put((log_received(raw_log), raw_log))
+            with self._progress:
+                self._spooled += 1
+
+    def _check_reorgs_when_applied(self) -> int | None:
+        # 订阅线程在这里暂停：等应用线程处理完它此前写入 spool 的全部日志再核对，
+        # 否则回滚之后仍在 spool 里的旧日志会把水位推过回滚点
+        with self._progress:
+            self._progress.wait_for(lambda: self._processed >= self._spooled or not self._spooling.is_set())
+        if not self._spooling.is_set():
+            # 已交给异步运行时，由它的订阅负责重组检查
+            return None
+        return self.check_reorgs()
+
+    def check_reorgs(self) -> int | None:
+        """Roll back journaled blocks that left the canonical chain in every pool; returns the lowest fork block.
+
+        Called before each reconnect backfill, once every log delivered before the
+        disconnect has been applied; the backfill then starts no later than the
+        returned block.
+        """
+        hashes: Dict[int, str | None] = {}
+
+        def canonical_hash(block_number: int) -> str | None:
+            # 多个池子常在同一区块有日志，每个区块只查一次
+            if block_number not in hashes:
+                try:
+                    hashes[block_number] = Web3.to_hex(self.web3.eth.get_block(block_number)["hash"])
+                except BlockNotFound:
+                    hashes[block_number] = None
+            return hashes[block_number]
+
+        forks = [
+            fork
+            for fork in (machine.check_canonical(canonical_hash) for machine in self.machines.values())
+            if fork is not None
+        ]
+        return min(forks, default=None)
+
+    def stop_spooling(self) -> int:
+        """Stop feeding the spool from the startup subscription; returns the block to resume from.
+
+        Logs after the returned watermark may be missing from the spool, so a new
+        subscription has to backfill from the block after it.
+        """
+        self._spooling.clear()
+        with self._progress:
+            self._progress.notify_all()
+        return self.stream.last_complete_block
+
+    def save_snapshots(self) -> None:
+        for label, machine in self.machines.items():
+            try:
+                machine.save_snapshot()
+            except OSError as e:
+                logging.warning(f"Failed to write snapshot cache for {label}: {e}")
+
+    def _start_recording(self, path: str) -> None:
+        # 此时还没有应用任何 spool 中的日志，状态就是各池子的起始快照
+        self.recorder = RecordingWriter(path)
+        for label, machine in self.machines.items():
+            with machine.lock:
+                snapshot = dataclasses.replace(machine.snapshot, ticks=machine.profile.ticks)
+                self.recorder.write_pool(label, machine.config.pool, snapshot, machine.start_block)
+        logging.info(f"Recording applied logs to {path}")
+
+    def process_batch(self, raw_logs: Iterable[dict]) -> List[tuple[str, LiquidityDeltaEvent]]:
+        raw_logs = list(raw_logs)
+        if self.recorder is not None:
+            self.recorder.write_logs(raw_logs)
+        applied = super().process_batch(raw_logs)
+        with self._progress:
+            self._processed += len(raw_logs)
+            self._progress.notify_all()
+        return applied
+
+    def close(self) -> None:
+        """Finish the recording (if any) and remove spilled spool files."""
+        self.stop_spooling()
+        recorder, self.recorder = self.recorder, None
+        if recorder is not None:
+            recorder.close()
+        self.spool.close()
@@ -0,0 +1,128 @@
+"""Offline replay of a recording (``RECORD_PATH``) through LiquidityStateMachine.
+
+Usage: python -m app.replay recording.jsonl.gz [--speed 0] [--batch 1024]
+
+``--speed 0`` replays as fast as possible; ``--speed 10`` replays at ten times
+the recorded pace. Prints a JSON summary (throughput and final depth per pool).
+"""
+
+import argparse
+import dataclasses
+import json
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List
+
+from app.config import AppConfig, ChainConfig
+from app.protocols.replay import ReplayAdapter, log_records, paced
+from app.recording import pool_config_from_dict, read_recording, snapshot_from_dict
+from app.registry import PoolRouter
+from app.state_machine import LiquidityStateMachine
+from app.types import LiquidityDeltaEvent
+
+# 回放批次上限；录制时同一批应用的日志时间戳相同，回放时按原批次切分
+_REPLAY_BATCH_LIMIT = 1024
+
+
+@dataclass
+class ReplayStats:
+    logs: int
+    liquidity_events: int
+    wall_time: float
+
+    @property
+    def logs_per_second(self) -> float:
+        return self.logs / self.wall_time if self.wall_time > 0 else 0.0
+
+
+def _offline_chain() -> ChainConfig:
+    return ChainConfig(name="replay", rpc_url="", wss_url="", explorer="")
+
+
+class Replayer:
+    """Rebuilds every recorded pool from its start snapshot and applies the recorded logs in their original batches.
+
+    ``config`` supplies the non-pool settings (finality depth, bucket sizing
+    code paths); pool settings always come from the recording. No RPC or
+    snapshot cache is touched.
+    """
+
+    def __init__(self, path: str, config: AppConfig | None = None, speed: float = 0.0, batch_size: int = _REPLAY_BATCH_LIMIT):
+        self.path = path
+        self.speed = speed
+        self.batch_size = batch_size
+        machines: Dict[str, LiquidityStateMachine] = {}
+        for record in read_recording(path):
+            if record["type"] != "pool":
+                break
+            pool = pool_config_from_dict(record["pool"])
+            base = config or AppConfig(chain=_offline_chain(), pool=pool)
+            machine_config = dataclasses.replace(
+                base, pool=pool, pools=[pool], snapshot=dataclasses.replace(base.snapshot, cache_dir=None)
+            )
+            adapter = ReplayAdapter(path, pool, snapshot_from_dict(record["snapshot"]), speed)
+            machines[record["label"]] = LiquidityStateMachine(None, machine_config, {}, adapter)
+        if not machines:
+            raise ValueError(f"Recording {path} has no pool snapshots")
+        self.router = PoolRouter(machines)
+
+    @property
+    def machines(self) -> Dict[str, LiquidityStateMachine]:
+        return self.router.machines
+
+    def run(self, on_batch: Callable[[List[tuple[str, LiquidityDeltaEvent]]], None] | None = None) -> ReplayStats:
+        """Replay every recorded log; ``on_batch`` receives the liquidity events applied by each batch."""
+        logs = events = 0
+        batch: List[dict] = []
+        batch_time = None
+        start = time.perf_counter()
+        for record in paced(log_records(self.path), self.speed):
+            if batch and (record["t"] != batch_time or len(batch) >= self.batch_size):
+                events += self._apply(batch, batch_time, on_batch)
+                logs += len(batch)
+                batch = []
+            batch.append(record["log"])
+            batch_time = record["t"]
+        if batch:
+            events += self._apply(batch, batch_time, on_batch)
+            logs += len(batch)
+        return ReplayStats(logs=logs, liquidity_events=events, wall_time=time.perf_counter() - start)
+
+    def _apply(self, batch: List[dict], batch_time: float, on_batch) -> int:
+        applied = self.router.process_batch(batch)
+        for _, event in applied:
+            # 事件时间取录制时的应用时间，而不是回放时刻
+            event.timestamp = int(batch_time)
+        if on_batch is not None:
+            on_batch(applied)
+        return len(applied)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path")
+    parser.add_argument("--speed", type=float, default=0.0, help="multiple of recorded pace, 0 = as fast as possible")
+    parser.add_argument("--batch", type=int, default=_REPLAY_BATCH_LIMIT)
+    args = parser.parse_args()
+
+    replayer = Replayer(args.path, speed=args.speed, batch_size=args.batch)
+    stats = replayer.run()
+    summary = {
+        "logs": stats.logs,
+        "liquidity_events": stats.liquidity_events,
+        "wall_time": round(stats.wall_time, 3),
+        "logs_per_second": round(stats.logs_per_second),
+        "pools": {
+            label: {
+                "version": machine.version,
+                "price": machine.latest_price(),
+                "buckets": {depth.bucket_label: depth.usdt_depth for depth in machine.buy_wall_depth()},
+            }
+            for label, machine in replayer.machines.items()
+        },
+    }
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+import asyncio
+import logging
+import sys
+import time
+from collections import deque
+from typing import Deque, Generic, TypeVar
+
+from rich.live import Live
+from web3 import AsyncWeb3
+
+from app.config import RuntimeConfig, UIConfig
+from app.metrics import QUEUE_DEPTH, RENDER_SECONDS, log_received, logs_applied
+from app.registry import PoolRegistry
+from app.types import LiquidityDeltaEvent
+from app.ui import MAX_EVENTS, FrameRenderer, PoolSwitcher, format_event
+from app.wss import AsyncWebsocketLogStream
+
+T = TypeVar("T")
+
+# 每批最多应用的日志数；批与批之间让出事件循环，突发流量下渲染也能按时进行
+_APPLY_BATCH_LIMIT = 1024
+
+
+class DropOldestQueue(Generic[T]):
+    """Bounded asyncio queue for display feeds: when full, the oldest item is discarded instead of blocking."""
+
+    def __init__(self, maxsize: int):
+        self._queue: asyncio.Queue[T] = asyncio.Queue(maxsize)
+        self.dropped = 0
+
+    def put_nowait(self, item: T) -> None:
+        while True:
+            try:
+                self._queue.put_nowait(item)
+                return
+            except asyncio.QueueFull:
+                self._queue.get_nowait()
+                self.dropped += 1
+
+    async def get(self) -> T:
+        return await self._queue.get()
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+
+class AsyncRuntime:
+    """Ingestion, state updates, the event feed and rendering as tasks of one asyncio loop.
+
+    Raw logs pass through a bounded queue: when applying falls behind, the socket
+    reader waits (backpressure) instead of buffering without limit. Applied
+    liquidity events go to a drop-oldest display feed, so a slow UI only loses
+    old feed lines, never state updates. The renderer sleeps until an applied
+    batch, a feed line or a pool switch wakes it.
+    """
+
+    def __init__(
+        self,
+        registry: PoolRegistry,
+        web3: AsyncWeb3,
+        config: RuntimeConfig,
+        ui: UIConfig,
+        save_interval: float = 60.0,
+    ):
+        self.registry = registry
+        self.config = config
+        self.ui = ui
+        self.save_interval = save_interval
+        self.stream = AsyncWebsocketLogStream.from_stream(registry.stream, web3)
+        self.stream.reorg_check = self._check_reorgs
+        # (接收时间, 原始日志)
+        self.logs: asyncio.Queue[tuple[float, dict]] = asyncio.Queue(config.ingest_queue_size)
+        self.display: DropOldestQueue[tuple[str, LiquidityDeltaEvent]] = DropOldestQueue(config.display_queue_size)
+        self.event_buffer: Deque[str] = deque(maxlen=MAX_EVENTS)
+        self.changed = asyncio.Event()
+        self.switcher = PoolSwitcher(len(registry), ui.layout, on_change=self.changed.set)
+        self.renderer = FrameRenderer(registry, self.switcher, self.event_buffer)
+        QUEUE_DEPTH.labels(queue="ingest").set_function(self.logs.qsize)
+        QUEUE_DEPTH.labels(queue="display").set_function(self.display.qsize)
+
+    async def _ingest(self) -> None:
+        # 接管启动订阅：先停止写入 spool，取走快照期间积压的日志，再由异步订阅从其水位补齐并继续
+        self.stream.last_complete_block = self.registry.stop_spooling()
+        while (item := self.registry.spool.get_nowait()) is not None:
+            await self.logs.put(item)
+        async for raw_log in self.stream.stream():
+            await self.logs.put((log_received(raw_log), raw_log))
+
+    async def _apply(self) -> None:
+        while True:
+            # 等到第一条日志后取走队列里已到达的全部日志，按网络帧整批应用
+            batch = [await self.logs.get()]
+            while len(batch) < _APPLY_BATCH_LIMIT and not self.logs.empty():
+                batch.append(self.logs.get_nowait())
+            started = time.time()
+            received, raw_logs = zip(*batch)
+            applied = self.registry.process_batch(raw_logs)
+            for _ in batch:
+                self.logs.task_done()
+            logs_applied(received, started)
+            for item in applied:
+                self.display.put_nowait(item)
+            self.changed.set()
+            await asyncio.sleep(0)
+
+    async def _check_reorgs(self) -> int | None:
+        # 重连补齐前订阅暂停：先等 _apply 应用完队列里旧连接的日志，再核对主链并回滚。
+        # 回滚与应用由此串行，返回的就是各池子实际的回滚点，之后不会再有旧日志越过它被应用
+        await self.logs.join()
+        # 核对走同步 HTTP，放到线程里避免阻塞事件循环；此时队列为空，_apply 不会并发执行
+        return await asyncio.to_thread(self.registry.check_reorgs)
+
+    async def _record(self) -> None:
+        while True:
+            pool, event = await self.display.get()
+            formatted = format_event(pool, event)
+            logging.info(formatted)
+            self.event_buffer.append(formatted)
+            self.changed.set()
+
+    async def _render(self) -> None:
+        # auto_refresh=False：不启用 rich 的刷新线程，由事件循环按帧刷新
+        render_seconds = RENDER_SECONDS.labels(mode="console")
+        with Live(self.renderer.render(), auto_refresh=False, screen=False) as live:
+            live.refresh()
+            while True:
+                await self.changed.wait()
+                self.changed.clear()
+                start = time.perf_counter()
+                frame = self.renderer.render()
+                if frame is not None:
+                    live.update(frame, refresh=True)
+                    render_seconds.observe(time.perf_counter() - start)
+                # 帧预算内到达的更新合并到下一帧
+                await asyncio.sleep(self.ui.frame_budget)
+
+    async def _save(self) -> None:
+        while True:
+            await asyncio.sleep(self.save_interval)
+            await asyncio.to_thread(self.registry.save_snapshots)
+
+    def _watch_stdin(self, loop: asyncio.AbstractEventLoop) -> bool:
+        try:
+            loop.add_reader(sys.stdin.fileno(), lambda: self.switcher.handle(sys.stdin.readline()))
+        except (NotImplementedError, ValueError, OSError):
+            # 不支持 add_reader 的平台 (Windows) 退回到读取 stdin 的线程
+            self.switcher.start()
+            return False
+        return True
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        watching = self._watch_stdin(loop)
+        try:
+            await asyncio.gather(self._ingest(), self._apply(), self._record(), self._render(), self._save())
+        finally:
+            if watching:
+                loop.remove_reader(sys.stdin.fileno())
@@ -0,0 +1,137 @@
+import logging
+import os
+import struct
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List
+
+from app.tick_store import TickStore
+from app.types import PriceState, Snapshot
+
+_MAGIC = b"PTGS"
+_VERSION = 1
+# magic, version, block, tick_spacing, has_tick, tick, sqrtPriceX96 (uint160 in 32 bytes),
+# tick count, head log index count, protocol length, pool key length
+_HEADER = struct.Struct("<4sHQi?i32sIIHH")
+# tick, liquidityGross (uint128), liquidityNet (int128)
+_TICK = struct.Struct("<i16s16s")
+_LOG_INDEX = struct.Struct("<I")
+
+
+@dataclass
+class CachedSnapshot:
+    snapshot: Snapshot
+    # logIndex 已应用的日志 (snapshot.block_number 所在区块)，回放时跳过
+    head_log_indices: List[int] = field(default_factory=list)
+
+
+class SnapshotStore:
+    """Packed binary snapshot file: header, fixed-size tick records, then head-block log indices."""
+
+    def __init__(self, path: Path):
+        self.path = path
+
+    def save(self, snapshot: Snapshot, pool_key: str, head_log_indices: List[int]) -> None:
+        """Atomically write ``snapshot``; ``pool_key`` identifies the pool (address, or manager/poolId for V4)."""
+        protocol = snapshot.protocol.encode()
+        pool_key_bytes = pool_key.encode()
+        price_state = snapshot.price_state
+        buffer = bytearray(
+            _HEADER.size
+            + len(protocol)
+            + len(pool_key_bytes)
+            + _TICK.size * len(snapshot.ticks)
+            + _LOG_INDEX.size * len(head_log_indices)
+        )
+        _HEADER.pack_into(
+            buffer,
+            0,
+            _MAGIC,
+            _VERSION,
+            snapshot.block_number or 0,
+            snapshot.tick_spacing or 0,
+            price_state.tick is not None,
+            price_state.tick or 0,
+            (price_state.sqrt_price_x96 or 0).to_bytes(32, "little"),
+            len(snapshot.ticks),
+            len(head_log_indices),
+            len(protocol),
+            len(pool_key_bytes),
+        )
+        offset = _HEADER.size
+        buffer[offset : offset + len(protocol)] = protocol
+        offset += len(protocol)
+        buffer[offset : offset + len(pool_key_bytes)] = pool_key_bytes
+        offset += len(pool_key_bytes)
+        ticks = TickStore.from_mapping(snapshot.tick_spacing or 1, snapshot.ticks)
+        for tick, gross, net in zip(*ticks.columns()):
+            _TICK.pack_into(buffer, offset, tick, gross.to_bytes(16, "little"), net.to_bytes(16, "little", signed=True))
+            offset += _TICK.size
+        for log_index in head_log_indices:
+            _LOG_INDEX.pack_into(buffer, offset, log_index)
+            offset += _LOG_INDEX.size
+
+        # 先写临时文件再原子替换，崩溃时不会留下半个文件
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        with tmp_path.open("wb") as f:
+            f.write(buffer)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def load(self, protocol: str, pool_address: str, pool_key: str) -> CachedSnapshot | None:
+        """Read the cached snapshot, or None if missing, corrupt or written for a different pool."""
+        if not self.path.exists():
+            return None
+        data = self.path.read_bytes()
+        try:
+            (
+                magic,
+                version,
+                block_number,
+                tick_spacing,
+                has_tick,
+                tick,
+                sqrt_price,
+                tick_count,
+                index_count,
+                protocol_length,
+                key_length,
+            ) = _HEADER.unpack_from(data, 0)
+            if magic != _MAGIC or version != _VERSION:
+                raise ValueError(f"unsupported snapshot file {magic!r} v{version}")
+            offset = _HEADER.size
+            stored_protocol = data[offset : offset + protocol_length].decode()
+            offset += protocol_length
+            stored_key = data[offset : offset + key_length].decode()
+            offset += key_length
+            if (stored_protocol, stored_key.lower()) != (protocol, pool_key.lower()):
+                logging.info(f"Snapshot cache {self.path} belongs to {stored_protocol} {stored_key}, ignoring")
+                return None
+            tick_column, gross_column, net_column = [], [], []
+            for tick_index, gross, net in _TICK.iter_unpack(data[offset : offset + _TICK.size * tick_count]):
+                tick_column.append(tick_index)
+                gross_column.append(int.from_bytes(gross, "little"))
+                net_column.append(int.from_bytes(net, "little", signed=True))
+            ticks = TickStore.from_columns(tick_spacing or 1, tick_column, gross_column, net_column)
+            offset += _TICK.size * tick_count
+            head_log_indices = [
+                index for (index,) in _LOG_INDEX.iter_unpack(data[offset : offset + _LOG_INDEX.size * index_count])
+            ]
+        except (struct.error, ValueError, UnicodeDecodeError) as e:
+            logging.warning(f"Ignoring unreadable snapshot cache {self.path}: {e}")
+            return None
+        sqrt_price_x96 = int.from_bytes(sqrt_price, "little")
+        snapshot = Snapshot(
+            ticks=ticks,
+            price_state=PriceState(
+                sqrt_price_x96=sqrt_price_x96 or None,
+                tick=tick if has_tick else None,
+            ),
+            protocol=protocol,
+            pool_address=pool_address,
+            block_number=block_number,
+            tick_spacing=tick_spacing or None,
+        )
+        return CachedSnapshot(snapshot=snapshot, head_log_indices=head_log_indices)
@@ -0,0 +1,88 @@
+import json
+import os
+import tempfile
+import threading
+from collections import deque
+from typing import Deque
+
+
+class LogSpool:
+    """Thread-safe FIFO of ``(receive time, raw log)`` pairs, held in memory up to ``memory_limit`` and spilled to disk beyond it.
+
+    The startup subscription writes here while the snapshots run, and the apply
+    loop reads from it afterwards. Once anything is spilled, newer logs also go to
+    the spill file until it is drained, so FIFO order is kept. The file is a
+    temporary JSONL file under ``spill_dir`` (system temp dir by default) and is
+    deleted once drained. Spilled pairs come back as two-element lists, which
+    unpack the same way.
+    """
+
+    def __init__(self, memory_limit: int = 100_000, spill_dir: str | None = None):
+        self.memory_limit = memory_limit
+        self.spill_dir = spill_dir
+        self._memory: Deque[tuple[float, dict]] = deque()
+        self._cond = threading.Condition()
+        self._spill_path: str | None = None
+        self._writer = None
+        self._reader = None
+        self._spilled = 0  # 文件中尚未读出的日志数
+        self.total_spilled = 0
+
+    def put(self, item: tuple[float, dict]) -> None:
+        with self._cond:
+            if self._spilled or len(self._memory) >= self.memory_limit:
+                self._spill(item)
+            else:
+                self._memory.append(item)
+            self._cond.notify()
+
+    def _spill(self, item: tuple[float, dict]) -> None:
+        if self._writer is None:
+            fd, self._spill_path = tempfile.mkstemp(prefix="log-spool-", suffix=".jsonl", dir=self.spill_dir)
+            self._writer = os.fdopen(fd, "w", encoding="utf-8")
+            self._reader = open(self._spill_path, "r", encoding="utf-8")
+        self._writer.write(json.dumps(item, separators=(",", ":")) + "\n")
+        self._spilled += 1
+        self.total_spilled += 1
+
+    def _unspill(self) -> tuple[float, dict]:
+        self._writer.flush()
+        item = json.loads(self._reader.readline())
+        self._spilled -= 1
+        if not self._spilled:
+            # 文件已读完：删除，之后重新回到内存
+            self._writer.close()
+            self._reader.close()
+            os.unlink(self._spill_path)
+            self._writer = self._reader = self._spill_path = None
+        return item
+
+    def _pop(self) -> tuple[float, dict]:
+        if self._memory:
+            return self._memory.popleft()
+        return self._unspill()
+
+    def get(self, timeout: float | None = None) -> tuple[float, dict]:
+        """Oldest log, waiting for one to arrive; raises TimeoutError after ``timeout`` seconds."""
+        with self._cond:
+            if not self._cond.wait_for(self.__len__, timeout):
+                raise TimeoutError("No log arrived in the spool")
+            return self._pop()
+
+    def get_nowait(self) -> tuple[float, dict] | None:
+        """Oldest log, or None if the spool is empty."""
+        with self._cond:
+            return self._pop() if len(self) else None
+
+    def __len__(self) -> int:
+        return len(self._memory) + self._spilled
+
+    def close(self) -> None:
+        with self._cond:
+            if self._writer is not None:
+                self._writer.close()
+                self._reader.close()
+                os.unlink(self._spill_path)
+                self._writer = self._reader = self._spill_path = None
+            self._memory.clear()
+            self._spilled = 0
@@ -1,91 +1,356 @@
+import dataclasses
+import logging
 import math
-import threading
-from collections import defaultdict
-from typing import Dict, List
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List
 
+import numpy as np
 from web3 import Web3
 
-from app.config import AppConfig
+from app.config import AppConfig, PoolConfig
 from app.protocols.pancake_v3 import PancakeV3Adapter
 from app.protocols.uniswap_v3 import UniswapV3Adapter
-from app.protocols.uniswap_v4 import UniswapV4Adapter
-from app.pricing import tick_to_price
-from app.types import AdaptiveScale, AggregatedDepth, LiquidityDeltaEvent, PriceState, Snapshot, TickLiquidity
+from app.protocols.uniswap_v4 import DEFAULT_TICK_SPACINGS, UniswapV4Adapter
+from app.depth import DepthEngine
+from app.journal import ReorgJournal
+from app.liquidity import LiquidityProfile
+from app.metrics import STATE_LOCK_HOLD_SECONDS, TimedLock
+from app.snapshot_store import SnapshotStore
+from app.types import AdaptiveScale, AggregatedDepth, DepthView, LiquidityDeltaEvent, PriceState, Snapshot, SwapEvent
+
+# 增减抵消后残留的浮点误差，低于该值的 bucket 不展示
+_MIN_BUCKET_DEPTH = 1e-9
+# 缓存热启动时每批回放的事件数
+_CATCH_UP_BATCH_SIZE = 5000
+
+
+def build_adapter(web3: Web3, config: AppConfig, abis: dict):
+    """Protocol adapter for ``config.pool``; cheap, makes no RPC calls until a snapshot is fetched."""
+    pool = config.pool
+    protocol = pool.protocol
+    if protocol == "uniswap_v3":
+        return UniswapV3Adapter(
+            web3,
+            pool.pool_address,
+            abis["uniswap_v3_pool"],
+            config.chain.wss_url,
+            abis["multicall"],
+            pool.token0_decimals,
+            pool.token1_decimals,
+            bitmap_batch_size=config.snapshot.bitmap_batch_size,
+            tick_batch_size=config.snapshot.tick_batch_size,
+        )
+    if protocol == "uniswap_v4":
+        return UniswapV4Adapter(
+            web3,
+            pool.pool_address,
+            pool.pool_id or "0x",
+            abis["uniswap_v4_pool_manager"],
+            config.chain.wss_url,
+            abis["multicall"],
+            pool.token0_decimals,
+            pool.token1_decimals,
+            _v4_tick_spacing(pool),
+            bitmap_batch_size=config.snapshot.bitmap_batch_size,
+            tick_batch_size=config.snapshot.tick_batch_size,
+        )
+    return PancakeV3Adapter(
+        web3,
+        pool.pool_address,
+        abis["pancake_tick_lens"],
+        pool.tick_lens_address or abis["pancake_tick_lens_address"],
+        abis["pancake_pool"],
+        config.chain.wss_url,
+        abis["multicall"],
+        pool.token0_decimals,
+        pool.token1_decimals,
+        bitmap_batch_size=config.snapshot.bitmap_batch_size,
+        lens_batch_size=config.snapshot.lens_batch_size,
+    )
+
+
+def _v4_tick_spacing(pool: PoolConfig) -> int:
+    if pool.tick_spacing:
+        return pool.tick_spacing
+    if pool.fee in DEFAULT_TICK_SPACINGS:
+        return DEFAULT_TICK_SPACINGS[pool.fee]
+    raise ValueError("POOL_TICK_SPACING is required for Uniswap V4 pools with a non-standard fee")
 
 
 class LiquidityStateMachine:
-    def __init__(self, web3: Web3, config: AppConfig, abis: dict):
+    def __init__(self, web3: Web3, config: AppConfig, abis: dict, adapter=None):
         self.web3 = web3
         self.config = config
-        self.lock = threading.Lock()
+        self.lock = TimedLock(STATE_LOCK_HOLD_SECONDS)
         self.token0_decimals = config.pool.token0_decimals
         self.token1_decimals = config.pool.token1_decimals
-        self.adapter = self._build_adapter(abis)
-        self.snapshot = self.adapter.fetch_snapshot()
-
-    def _build_adapter(self, abis: dict):
-        protocol = self.config.pool.protocol
-        if protocol == "uniswap_v3":
-            return UniswapV3Adapter(
-                self.web3,
-                self.config.pool.pool_address,
-                abis["uniswap_v3_pool"],
-                self.config.chain.wss_url,
-                abis["multicall"],
-                self.token0_decimals,
-                self.token1_decimals,
-            )
-        if protocol == "uniswap_v4":
-            return UniswapV4Adapter(
-                self.web3,
-                self.config.pool.pool_address,
-                self.config.pool.pool_id or "0x",
-                abis["uniswap_v4_pool_manager"],
-                self.config.chain.wss_url,
-                abis["multicall"],
-                self.token0_decimals,
-                self.token1_decimals,
-            )
-        return PancakeV3Adapter(
-            self.web3,
-            self.config.pool.pool_address,
-            abis["pancake_tick_lens"],
-            abis["pancake_tick_lens_address"],
-            abis["pancake_pool"],
-            self.config.chain.wss_url,
-            abis["multicall"],
+        self.adapter = adapter if adapter is not None else build_adapter(web3, config, abis)
+        self.journal = ReorgJournal(config.chain.finality_depth)
+        self.store = self._build_store()
+        # 已应用到状态中的最新区块，以及该区块内已应用的 logIndex (None 表示整个区块已包含)
+        self._applied_block = 0
+        self._applied_indices: set[int] | None = None
+        self._pending_catch_up: int | None = None
+        self.snapshot = self._load_snapshot()
+        self.profile = LiquidityProfile(self.snapshot.ticks, self.snapshot.tick_spacing or 1)
+        self.depth_engine = DepthEngine(
+            self.snapshot.tick_spacing or 1,
             self.token0_decimals,
             self.token1_decimals,
+            config.pool.quote_is_token0,
         )
+        # 增量维护的 bucket 深度；价格变化后置为 stale，下次读取时重建
+        self._buckets: np.ndarray | None = None
+        self._bucket_labels: List[str] = []
+        self._depth_scale: AdaptiveScale | None = None
+        # 当前刻度下 bucket 边界对应的 tick，重建时计算一次，增量更新直接复用
+        self._edge_ticks: np.ndarray | None = None
+        self._depth_range = (0, 0)
+        self._depth_stale = True
+        self._depth_dirty = False
+        # 写线程每批结束后发布的不可变视图；读取方无锁直接取这个引用 (read-copy-update)
+        self._published = DepthView(scale=self._adaptive_scale(), rows=())
+        # 从缓存启动时，补齐缓存区块到链头之间的日志
+        self.catch_up()
+        # 启动时状态所在的区块 (快照区块或缓存补齐到的链头)；不晚于它的日志已包含在状态中
+        self.start_block = self._applied_block
+        with self.lock:
+            self._publish()
+
+    def _pool_key(self) -> str:
+        if self.config.pool.protocol == "uniswap_v4":
+            return f"{self.config.pool.pool_address}/{self.config.pool.pool_id}"
+        return self.config.pool.pool_address
+
+    def _build_store(self) -> SnapshotStore | None:
+        cache_dir = self.config.snapshot.cache_dir
+        if not cache_dir:
+            return None
+        pool = (self.config.pool.pool_id or self.config.pool.pool_address).lower()
+        return SnapshotStore(Path(cache_dir) / f"{self.config.chain.name}-{self.config.pool.protocol}-{pool}.bin")
+
+    def _load_snapshot(self) -> Snapshot:
+        """Warm start from the on-disk cache plus eth_getLogs catch-up, else a full snapshot."""
+        cached = None
+        if self.store is not None:
+            cached = self.store.load(
+                self.config.pool.protocol,
+                self.adapter.pool_address,
+                self._pool_key(),
+            )
+        if cached is not None:
+            head = self.web3.eth.block_number
+            behind = head - cached.snapshot.block_number
+            if behind <= self.config.snapshot.max_catch_up_blocks:
+                self._applied_block = cached.snapshot.block_number
+                self._applied_indices = set(cached.head_log_indices)
+                self._pending_catch_up = head
+                logging.info(f"Loaded cached snapshot at block {cached.snapshot.block_number} ({behind} blocks behind)")
+                return cached.snapshot
+            logging.info(f"Cached snapshot is {behind} blocks behind, fetching a full snapshot")
+        snapshot = self.adapter.fetch_snapshot()
+        self._applied_block = snapshot.block_number or 0
+        return snapshot
+
+    def catch_up(self) -> int:
+        """Replay logs from a cached snapshot's block to head; returns the number of events replayed.
+
+        A no-op after a full snapshot. Afterwards the live stream resumes from head + 1.
+        """
+        head = self._pending_catch_up
+        if head is None:
+            return 0
+        self._pending_catch_up = None
+        count = 0
+        batch: List[LiquidityDeltaEvent | SwapEvent] = []
+        for event in self.adapter.replay_events(self._applied_block, head):
+            batch.append(event)
+            if len(batch) >= _CATCH_UP_BATCH_SIZE:
+                # 补齐期间没有读取方，只在结束时发布一次
+                self.apply_events(batch, publish=False)
+                count += len(batch)
+                batch = []
+        self.apply_events(batch)
+        count += len(batch)
+        self.adapter.stream.last_complete_block = head
+        logging.info(f"Caught up to block {head} with {count} events")
+        return count
+
+    def save_snapshot(self) -> None:
+        """Write the current tick map and price to the snapshot cache (if enabled)."""
+        if self.store is None:
+            return
+        with self.lock:
+            snapshot = dataclasses.replace(
+                self.snapshot,
+                ticks=self.profile.ticks.copy(),
+                block_number=self._applied_block,
+                phases=[],
+            )
+            head_log_indices = sorted(self._applied_indices or ())
+        self.store.save(snapshot, self._pool_key(), head_log_indices)
 
     def apply_event(self, event: LiquidityDeltaEvent) -> None:
+        self.apply_events((event,))
+
+    def apply_events(
+        self, events: Iterable[LiquidityDeltaEvent | SwapEvent], publish: bool = True
+    ) -> List[LiquidityDeltaEvent]:
+        """Apply one block / network frame of events under a single lock acquisition.
+
+        Deltas on the same (lower, upper) range are merged before touching the
+        liquidity profile, and the incremental depth buckets get one update for the
+        whole batch. Swaps set the latest price, and the price from before each
+        block's first swap is journaled so a reorg of that block restores it. With
+        ``publish`` a new depth view is published when the batch changed it.
+
+        Returns the liquidity events that changed the state, in order: new deltas
+        and ``removed`` logs that undid one. Duplicates are left out.
+        """
+        applied: List[LiquidityDeltaEvent] = []
         with self.lock:
-            bucket = self.snapshot.ticks.get(event.lower_tick)
-            if bucket is None:
-                price_lower = tick_to_price(event.lower_tick, self.token0_decimals, self.token1_decimals)
-                price_upper = tick_to_price(event.upper_tick, self.token0_decimals, self.token1_decimals)
-                bucket = TickLiquidity(
-                    lower_tick=event.lower_tick,
-                    upper_tick=event.upper_tick,
-                    liquidity=0,
-                    token0_reserves=price_lower,
-                    token1_reserves=price_upper,
-                )
-                self.snapshot.ticks[event.lower_tick] = bucket
-            bucket.liquidity += event.liquidity_delta
+            merged: Dict[tuple[int, int], int] = {}
+            price_state: PriceState | None = None
+            for event in events:
+                if not event.removed and self.journal.is_fork(event.block_number, event.block_hash):
+                    # 回滚按日志顺序发生：先落地本批已合并的 delta 和价格
+                    self._apply_merged(merged)
+                    if price_state is not None:
+                        self._set_price(price_state)
+                        price_state = None
+                    self._rollback_from(event.block_number)
+                if isinstance(event, SwapEvent):
+                    if event.removed:
+                        # 撤销被移除区块的 Swap：回到该区块第一笔 Swap 之前的价格
+                        price_before = self.journal.unwind_swaps(event.block_number, event.block_hash)
+                        if price_before is not None:
+                            price_state = price_before
+                        continue
+                    self.journal.record_swap(
+                        event.block_number, event.block_hash, price_state or self.snapshot.price_state
+                    )
+                    price_state = PriceState(sqrt_price_x96=event.sqrt_price_x96, tick=event.tick)
+                    continue
+                if event.removed:
+                    # 节点推送的 removed 日志：撤销之前应用过的同一条 delta
+                    entry = self.journal.pop(event.block_hash, event.log_index)
+                    if entry is not None:
+                        key = (entry.lower_tick, entry.upper_tick)
+                        merged[key] = merged.get(key, 0) - entry.liquidity_delta
+                        applied.append(event)
+                    if event.block_number <= self._applied_block:
+                        # 该区块已被替换：水位退回到它之前，替换区块的日志 (任意 logIndex) 才能重新进入
+                        self._applied_block = event.block_number - 1
+                        self._applied_indices = None
+                    continue
+                if not self._mark_applied(event):
+                    continue
+                self.journal.record(event)
+                key = (event.lower_tick, event.upper_tick)
+                merged[key] = merged.get(key, 0) + event.liquidity_delta
+                applied.append(event)
+            self._apply_merged(merged)
+            if price_state is not None:
+                self._set_price(price_state)
+            if publish:
+                self._publish()
+        return applied
+
+    def _mark_applied(self, event: LiquidityDeltaEvent) -> bool:
+        """Advance the applied-log watermark; False if the log is already part of the state."""
+        if event.block_number > self._applied_block:
+            self._applied_block = event.block_number
+            self._applied_indices = {event.log_index}
+            return True
+        if event.block_number < self._applied_block or self._applied_indices is None:
+            return False
+        if event.log_index in self._applied_indices:
+            return False
+        self._applied_indices.add(event.log_index)
+        return True
+
+    def rollback_to(self, block_number: int) -> None:
+        """Undo every journaled delta from blocks >= ``block_number`` (e.g. on a parent-hash mismatch)."""
+        with self.lock:
+            self._rollback_from(block_number)
+            self._publish()
+
+    def check_canonical(self, canonical_hash: Callable[[int], str | None]) -> int | None:
+        """Roll back journaled blocks that are no longer on the canonical chain.
+
+        ``canonical_hash(n)`` returns the chain's current hash of block ``n`` (None if
+        the chain has no such block). Catches reorgs that never deliver a ``removed``
+        log, e.g. a replacement block without liquidity logs seen only through an
+        eth_getLogs backfill. Every journaled block is compared, since a stale block
+        can sit below a canonical one. Returns the first rolled-back block, or None.
+        """
+        with self.lock:
+            journaled = self.journal.block_hashes()
+        # RPC 在锁外进行，不阻塞读取方和写线程
+        stale = [
+            block_number
+            for block_number, block_hash in journaled
+            if (canonical_hash(block_number) or "").lower() != block_hash.lower()
+        ]
+        if not stale:
+            return None
+        fork = min(stale)
+        self.rollback_to(fork)
+        return fork
+
+    def _rollback_from(self, block_number: int) -> None:
+        price_before = self.journal.unwind_swaps(block_number)
+        undone = self.journal.rollback_from(block_number)
+        if self._applied_block >= block_number:
+            # 被回滚区块之前的状态是完整的，重组后的日志会重新推进水位
+            self._applied_block = block_number - 1
+            self._applied_indices = None
+        merged: Dict[tuple[int, int], int] = {}
+        for entry in undone:
+            key = (entry.lower_tick, entry.upper_tick)
+            merged[key] = merged.get(key, 0) - entry.liquidity_delta
+        self._apply_merged(merged)
+        if price_before is not None:
+            self._set_price(price_before)
+        if undone:
+            logging.warning(f"Reorg at block {block_number}: rolled back {len(undone)} liquidity events")
+
+    def _apply_merged(self, merged: Dict[tuple[int, int], int]) -> None:
+        """Apply net deltas per (lower, upper) range to the profile, then one depth update; clears ``merged``."""
+        changes = [(lower, upper, delta) for (lower, upper), delta in merged.items() if delta]
+        merged.clear()
+        if not changes:
+            return
+        for lower_tick, upper_tick, liquidity_delta in changes:
+            self.profile.apply(lower_tick, upper_tick, liquidity_delta)
+        if not self._depth_stale:
+            self._apply_depth_deltas(changes)
 
     def update_price(self, price_state: PriceState) -> None:
+        """Record the latest pool price; depth is recomputed lazily on the next read."""
         with self.lock:
-            self.snapshot.price_state = price_state
+            self._set_price(price_state)
+            self._publish()
 
-    def _tick_price(self, tick: int) -> float:
-        return tick_to_price(tick, self.token0_decimals, self.token1_decimals)
+    def _set_price(self, price_state: PriceState) -> None:
+        previous = self.snapshot.price_state
+        self.snapshot.price_state = price_state
+        if (previous.tick, previous.sqrt_price_x96) != (price_state.tick, price_state.sqrt_price_x96):
+            self._depth_stale = True
 
     def _current_price(self) -> float:
         tick = self.snapshot.price_state.tick
         if tick is None:
             return 0.0
-        return self._tick_price(tick)
+        return self.depth_engine.price(tick)
+
+    def _current_sqrt_price(self) -> float | None:
+        price_state = self.snapshot.price_state
+        if price_state.sqrt_price_x96:
+            return price_state.sqrt_price_x96 / (1 << 96)
+        if price_state.tick is not None:
+            return math.pow(1.0001, price_state.tick / 2)
+        return None
 
     def _adaptive_scale(self) -> AdaptiveScale:
         price = self._current_price()
@@ -99,36 +364,87 @@ class LiquidityStateMachine:
     def _bucket_label(self, price: float) -> str:
         return f"{price:,.6f}"
 
-    def buy_wall_depth(self) -> List[AggregatedDepth]:
+    def _rebuild_depth(self) -> None:
         scale = self._adaptive_scale()
-        with self.lock:
-            price_state = scale.current_price
-            buckets: Dict[str, float] = defaultdict(float)
-            for tick_liquidity in self.snapshot.ticks.values():
-                price_lower = self._tick_price(tick_liquidity.lower_tick)
-                price_upper = self._tick_price(tick_liquidity.upper_tick)
-                if tick_liquidity.liquidity <= 0:
-                    continue
-                if price_state == 0:
-                    is_below = True
-                else:
-                    is_below = price_upper < price_state
-                contains_price = price_lower <= price_state <= price_upper if price_state else False
-                if not is_below and not contains_price:
-                    continue
-                quote_value = tick_liquidity.liquidity
-                if contains_price and price_state:
-                    span = price_upper - price_lower
-                    quote_value = tick_liquidity.liquidity * max(price_state - price_lower, 0) / span if span else tick_liquidity.liquidity
-                bucket_index = int((price_upper - scale.min_price) // scale.step)
-                bucket_price = scale.min_price + bucket_index * scale.step
-                label = self._bucket_label(bucket_price)
-                buckets[label] += quote_value
-            depths = [AggregatedDepth(bucket_label=k, usdt_depth=v) for k, v in sorted(buckets.items(), key=lambda x: float(x[0].replace(',', '')))]
-        return depths
+        lower_tick, upper_tick = self.depth_engine.visible_tick_range(
+            self.snapshot.price_state.tick, scale.min_price, scale.max_price
+        )
+        self._depth_scale = scale
+        self._edge_ticks = self.depth_engine.edge_ticks(scale)
+        self._depth_range = (lower_tick, upper_tick)
+        self._buckets = np.zeros(self.depth_engine.bucket_count(scale), dtype=np.float64)
+        self._bucket_labels = [
+            self._bucket_label(scale.min_price + i * scale.step) for i in range(len(self._buckets))
+        ]
+        # 价格未定义 (pre-TGE) 时，整个可视区间都视为低于价格
+        self._add_to_buckets(self.profile.segments(lower_tick, upper_tick))
+        self._depth_stale = False
+        self._depth_dirty = True
+
+    def _apply_depth_deltas(self, changes: List[tuple[int, int, int]]) -> None:
+        # 深度对流动性是线性的：只把变化落在可视区间内的部分加到受影响的 bucket。
+        # 重叠的区间先扫描成互不重叠的分段，整批只计算一次
+        visible_lower, visible_upper = self._depth_range
+        boundaries: Dict[int, int] = {}
+        for lower_tick, upper_tick, liquidity_delta in changes:
+            lower, upper = max(lower_tick, visible_lower), min(upper_tick, visible_upper)
+            if lower < upper:
+                boundaries[lower] = boundaries.get(lower, 0) + liquidity_delta
+                boundaries[upper] = boundaries.get(upper, 0) - liquidity_delta
+        segments = []
+        running = 0
+        previous = None
+        for tick in sorted(boundaries):
+            if running and previous is not None:
+                segments.append((previous, tick, running))
+            running += boundaries[tick]
+            previous = tick
+        if segments and self.depth_engine.add_segment_depth(
+            self._buckets, segments, self._current_sqrt_price(), self._edge_ticks
+        ):
+            self._depth_dirty = True
+
+    def _add_to_buckets(self, segments) -> None:
+        indices, depths = self.depth_engine.bucket_depth(segments, self._current_sqrt_price(), self._edge_ticks)
+        in_range = (indices >= 0) & (indices < len(self._buckets))
+        if in_range.any():
+            np.add.at(self._buckets, indices[in_range], depths[in_range])
+            self._depth_dirty = True
+
+    def _publish(self) -> None:
+        """Publish a new immutable depth view if this batch changed it (writer side, lock held)."""
+        if self._depth_stale:
+            self._rebuild_depth()
+        if not self._depth_dirty:
+            return
+        filled = np.flatnonzero(self._buckets > _MIN_BUCKET_DEPTH)
+        self._published = DepthView(
+            scale=self._depth_scale,
+            rows=tuple(
+                AggregatedDepth(bucket_label=self._bucket_labels[i], usdt_depth=depth)
+                for i, depth in zip(filled.tolist(), self._buckets[filled].tolist())
+            ),
+            version=self._published.version + 1,
+        )
+        self._depth_dirty = False
+
+    def depth_view(self) -> DepthView:
+        """Latest published buy-wall rows; lock-free, never waits for the writer."""
+        return self._published
+
+    @property
+    def version(self) -> int:
+        return self._published.version
+
+    def changed_since(self, version: int) -> bool:
+        """True if a newer depth view than ``version`` has been published."""
+        return self._published.version != version
+
+    def buy_wall_depth(self) -> List[AggregatedDepth]:
+        return list(self.depth_view().rows)
 
     def adaptive_scale(self) -> AdaptiveScale:
-        return self._adaptive_scale()
+        return self._published.scale
 
     def latest_price(self) -> float:
-        return self._current_price()
+        return self._published.scale.current_price
@@ -0,0 +1,273 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from collections.abc import ItemsView, Mapping, MutableMapping
+from typing import Iterable, Iterator, List
+
+import numpy as np
+
+from app.protocols.bitmap import MAX_TICK, MIN_TICK
+from app.types import TickLiquidity
+
+# 每页覆盖 2**_PAGE_BITS 个 tick 槽位 (4 个 tickBitmap word)；稀疏池子的页对象开销摊到更多 tick 上
+_PAGE_BITS = 10
+# liquidityGross (uint128) / liquidityNet (int128) 按链上宽度各占 16 字节，一行 32 字节
+_WIDTH = 16
+_ROW = 2 * _WIDTH
+# 少于该行数时逐行解码比 NumPy 求和更快
+_VECTOR_SUM_ROWS = 32
+
+
+def _row(gross: int, net: int) -> bytes:
+    return gross.to_bytes(_WIDTH, "big") + net.to_bytes(_WIDTH, "big", signed=True)
+
+
+class _TickItemsView(ItemsView):
+    def __iter__(self) -> Iterator[tuple[int, TickLiquidity]]:
+        store = self._mapping
+        spacing = store.tick_spacing
+        for page in store._pages:
+            if page is not None:
+                for i, tick in enumerate(page.ticks):
+                    yield tick, TickLiquidity(tick, tick + spacing, page.gross(i), page.net(i))
+
+
+class _TickPage:
+    """Initialized ticks of one page: a sorted tick column plus one fixed-width (gross, net) row per tick."""
+
+    __slots__ = ("ticks", "rows")
+
+    def __init__(self):
+        self.ticks = array("i")
+        self.rows = bytearray()
+
+    def gross(self, i: int) -> int:
+        offset = i * _ROW
+        return int.from_bytes(self.rows[offset : offset + _WIDTH], "big")
+
+    def net(self, i: int) -> int:
+        offset = i * _ROW + _WIDTH
+        return int.from_bytes(self.rows[offset : offset + _WIDTH], "big", signed=True)
+
+    def nets(self, start: int = 0, end: int | None = None) -> Iterator[int]:
+        rows = self.rows
+        stop = (len(self.ticks) if end is None else end) * _ROW
+        for offset in range(start * _ROW + _WIDTH, stop, _ROW):
+            yield int.from_bytes(rows[offset : offset + _WIDTH], "big", signed=True)
+
+    def net_sum(self, start: int = 0, end: int | None = None) -> int:
+        """Exact sum of liquidityNet over rows [start, end)."""
+        end = len(self.ticks) if end is None else end
+        if end - start < _VECTOR_SUM_ROWS:
+            return sum(self.nets(start, end))
+        # int128 拆成 4 个大端 32 位 limb (最高位有符号)，逐列求和不会溢出 int64，再按位权合并
+        limbs = np.frombuffer(self.rows, dtype=">u4").reshape(-1, 8)[start:end, 4:]
+        top = int(limbs[:, 0].view(">i4").sum(dtype=np.int64))
+        high, middle, low = limbs[:, 1:].sum(axis=0, dtype=np.uint64).tolist()
+        return (top << 96) + (high << 64) + (middle << 32) + low
+
+    def set(self, i: int, gross: int, net: int) -> None:
+        self.rows[i * _ROW : (i + 1) * _ROW] = _row(gross, net)
+
+    def insert(self, i: int, tick: int, gross: int, net: int) -> None:
+        self.ticks.insert(i, tick)
+        self.rows[i * _ROW : i * _ROW] = _row(gross, net)
+
+    def delete(self, i: int) -> None:
+        del self.ticks[i]
+        del self.rows[i * _ROW : (i + 1) * _ROW]
+
+
+class TickStore(MutableMapping):
+    """Columnar map of initialized ticks, paged by groups of tickBitmap words.
+
+    Each page covers ``2**10`` compressed tick slots (``(tick // tick_spacing) >> 10``,
+    four bitmap words) and holds a sorted ``array('i')`` of ticks plus a bytearray
+    of fixed-width rows: liquidityGross as uint128 and liquidityNet as int128, 16
+    bytes each, so a tick costs 36 bytes with no per-value int objects. An insert
+    is a binary search plus a memmove inside one page, independent of the pool size.
+
+    It behaves like ``Dict[int, TickLiquidity]``, but values are built on access,
+    so mutating a returned TickLiquidity does not write back. Use ``add`` or item
+    assignment.
+    """
+
+    def __init__(self, tick_spacing: int):
+        self.tick_spacing = tick_spacing
+        self._first_page = (MIN_TICK // tick_spacing) >> _PAGE_BITS
+        self._pages: List[_TickPage | None] = [None] * (
+            ((MAX_TICK // tick_spacing) >> _PAGE_BITS) - self._first_page + 1
+        )
+        self._len = 0
+
+    @classmethod
+    def from_columns(
+        cls, tick_spacing: int, ticks: Iterable[int], gross: Iterable[int], net: Iterable[int]
+    ) -> "TickStore":
+        """Build from parallel columns (any order; duplicate ticks keep the last row)."""
+        rows = dict(zip(ticks, zip(gross, net)))
+        store = cls(tick_spacing)
+        for tick in sorted(rows):
+            page = store._page(tick, create=True)
+            page.ticks.append(tick)
+            page.rows += _row(*rows[tick])
+        store._len = len(rows)
+        return store
+
+    @classmethod
+    def from_mapping(cls, tick_spacing: int, ticks: Mapping[int, TickLiquidity]) -> "TickStore":
+        if isinstance(ticks, TickStore):
+            return ticks.copy()
+        return cls.from_columns(
+            tick_spacing,
+            ticks.keys(),
+            (entry.liquidity for entry in ticks.values()),
+            (entry.liquidity_net or 0 for entry in ticks.values()),
+        )
+
+    def copy(self) -> "TickStore":
+        store = TickStore(self.tick_spacing)
+        for index, page in enumerate(self._pages):
+            if page is not None:
+                clone = store._pages[index] = _TickPage()
+                clone.ticks = array("i", page.ticks)
+                clone.rows = bytearray(page.rows)
+        store._len = self._len
+        return store
+
+    @property
+    def page_count(self) -> int:
+        return len(self._pages)
+
+    def page_index(self, tick: int) -> int:
+        """Page of ``tick``; pages are ordered like ticks."""
+        index = ((tick // self.tick_spacing) >> _PAGE_BITS) - self._first_page
+        if not 0 <= index < len(self._pages):
+            raise ValueError(f"Tick {tick} is outside [{MIN_TICK}, {MAX_TICK}]")
+        return index
+
+    def _page(self, tick: int, create: bool = False) -> _TickPage | None:
+        index = self.page_index(tick)
+        page = self._pages[index]
+        if page is None and create:
+            page = self._pages[index] = _TickPage()
+        return page
+
+    def add(self, tick: int, gross_delta: int, net_delta: int) -> tuple[int, int]:
+        """Add to a tick's gross / net liquidity, inserting or dropping the tick as needed.
+
+        Returns (page index, change of the page's liquidityNet sum). A tick whose
+        gross liquidity reaches zero is removed together with its remaining net.
+        """
+        index = self.page_index(tick)
+        page = self._pages[index]
+        if page is None:
+            if gross_delta <= 0:
+                return index, 0
+            page = self._pages[index] = _TickPage()
+        ticks = page.ticks
+        i = bisect_left(ticks, tick)
+        if i < len(ticks) and ticks[i] == tick:
+            gross = page.gross(i) + gross_delta
+            net = page.net(i)
+            if gross <= 0:
+                # tick 不再被任何头寸引用，从列中移除
+                page.delete(i)
+                self._len -= 1
+                if not ticks:
+                    self._pages[index] = None
+                return index, -net
+            page.set(i, gross, net + net_delta)
+            return index, net_delta
+        if gross_delta <= 0:
+            return index, 0
+        page.insert(i, tick, gross_delta, net_delta)
+        self._len += 1
+        return index, net_delta
+
+    def page_net_sums(self) -> Iterator[tuple[int, int]]:
+        """(page index, sum of liquidityNet) for every non-empty page, in tick order."""
+        for index, page in enumerate(self._pages):
+            if page is not None:
+                yield index, page.net_sum()
+
+    def page_net_through(self, tick: int) -> int:
+        """Sum of liquidityNet of the ticks <= ``tick`` on ``tick``'s page."""
+        page = self._page(tick)
+        if page is None:
+            return 0
+        return page.net_sum(0, bisect_right(page.ticks, tick))
+
+    def net_between(self, lower_tick: int, upper_tick: int) -> Iterator[tuple[int, int]]:
+        """(tick, liquidityNet) of the initialized ticks with ``lower_tick < tick < upper_tick``, in order."""
+        if upper_tick - lower_tick < 2:
+            return
+        first = self.page_index(max(lower_tick + 1, MIN_TICK))
+        last = self.page_index(min(upper_tick - 1, MAX_TICK))
+        for page in self._pages[first : last + 1]:
+            if page is None:
+                continue
+            start = bisect_right(page.ticks, lower_tick)
+            end = bisect_left(page.ticks, upper_tick)
+            yield from zip(page.ticks[start:end], page.nets(start, end))
+
+    def columns(self) -> tuple[array, List[int], List[int]]:
+        """Flat sorted (ticks, gross, net) columns, for serialization."""
+        ticks, gross, net = array("i"), [], []
+        for page in self._pages:
+            if page is not None:
+                ticks.extend(page.ticks)
+                gross.extend(page.gross(i) for i in range(len(page.ticks)))
+                net.extend(page.nets())
+        return ticks, gross, net
+
+    def _locate(self, tick: int) -> tuple[_TickPage | None, int]:
+        if not MIN_TICK <= tick <= MAX_TICK:
+            return None, -1
+        page = self._page(tick)
+        if page is None:
+            return None, -1
+        i = bisect_left(page.ticks, tick)
+        if i < len(page.ticks) and page.ticks[i] == tick:
+            return page, i
+        return page, -1
+
+    def __getitem__(self, tick: int) -> TickLiquidity:
+        page, i = self._locate(tick)
+        if i < 0:
+            raise KeyError(tick)
+        return TickLiquidity(tick, tick + self.tick_spacing, page.gross(i), page.net(i))
+
+    def __setitem__(self, tick: int, entry: TickLiquidity) -> None:
+        page = self._page(tick, create=True)
+        i = bisect_left(page.ticks, tick)
+        if i < len(page.ticks) and page.ticks[i] == tick:
+            page.set(i, entry.liquidity, entry.liquidity_net or 0)
+            return
+        page.insert(i, tick, entry.liquidity, entry.liquidity_net or 0)
+        self._len += 1
+
+    def __delitem__(self, tick: int) -> None:
+        page, i = self._locate(tick)
+        if i < 0:
+            raise KeyError(tick)
+        page.delete(i)
+        self._len -= 1
+        if not page.ticks:
+            self._pages[self.page_index(tick)] = None
+
+    def __contains__(self, tick: object) -> bool:
+        return isinstance(tick, int) and self._locate(tick)[1] >= 0
+
+    def __iter__(self) -> Iterator[int]:
+        for page in self._pages:
+            if page is not None:
+                yield from page.ticks
+
+    def __len__(self) -> int:
+        return self._len
+
+    def items(self) -> _TickItemsView:
+        return _TickItemsView(self)
+
+    def __repr__(self) -> str:
+        return f"TickStore(tick_spacing={self.tick_spacing}, ticks={len(self)})"
@@ -1,15 +1,16 @@
-from dataclasses import dataclass
-from typing import Dict, List, Optional
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, List, Optional, Tuple
 
+if TYPE_CHECKING:
+    from app.tick_store import TickStore
 
-@dataclass
+
+@dataclass(slots=True)
 class TickLiquidity:
     lower_tick: int
     upper_tick: int
-    liquidity: int
+    liquidity: int  # liquidityGross
     liquidity_net: int | None = None
-    token0_reserves: float
-    token1_reserves: float
 
     @property
     def width(self) -> int:
@@ -25,6 +26,23 @@ class LiquidityDeltaEvent:
     block_number: int
     timestamp: int
     event_type: str
+    block_hash: str | None = None
+    log_index: int = 0
+    removed: bool = False  # set by the node on logs undone by a reorg
+
+
+@dataclass
+class SwapEvent:
+    tx_hash: str
+    sqrt_price_x96: int
+    tick: int
+    liquidity: int
+    block_number: int
+    timestamp: int
+    event_type: str = "Swap"
+    block_hash: str | None = None
+    log_index: int = 0
+    removed: bool = False
 
 
 @dataclass
@@ -33,18 +51,28 @@ class PriceState:
     tick: Optional[int]
 
 
-@dataclass
+@dataclass(frozen=True)
 class AggregatedDepth:
     bucket_label: str
     usdt_depth: float
 
 
+@dataclass
+class SnapshotPhase:
+    name: str
+    round_trips: int
+    wall_time: float
+
+
 @dataclass
 class Snapshot:
-    ticks: Dict[int, TickLiquidity]
+    ticks: "TickStore"
     price_state: PriceState
     protocol: str
     pool_address: str
+    block_number: int | None = None
+    tick_spacing: int | None = None
+    phases: List[SnapshotPhase] = field(default_factory=list)
 
 
 @dataclass
@@ -60,9 +88,18 @@ class DepthTable:
     as_of: int
 
 
-@dataclass
+@dataclass(frozen=True)
 class AdaptiveScale:
     current_price: float
     step: float
     min_price: float
     max_price: float
+
+
+@dataclass(frozen=True)
+class DepthView:
+    """Read-only buy-wall rows for one scale; shared between readers until the depth changes."""
+
+    scale: AdaptiveScale
+    rows: Tuple[AggregatedDepth, ...]
+    version: int = 0  # bumped on every publish; unchanged version means unchanged rows
@@ -1,38 +1,57 @@
+import logging
 import queue
+import sys
 import threading
 import time
 from collections import deque
-from typing import Deque
+from typing import Callable, Deque, Dict, Hashable, Sequence
 
+from rich.columns import Columns
 from rich.console import Group
 from rich.live import Live
 from rich.panel import Panel
 from rich.table import Table
 
-from app.state_machine import LiquidityStateMachine
-from app.types import AggregatedDepth, LiquidityDeltaEvent
+from app.config import UIConfig
+from app.metrics import RENDER_SECONDS
+from app.registry import PoolRegistry
+from app.types import AggregatedDepth, DepthView, LiquidityDeltaEvent
+
+MAX_EVENTS = 20
+
 
 def _clear_screen() -> None:
     print("\n" * 3 + "=" * 60 + "\n")
 
 
-def _format_event(event: LiquidityDeltaEvent) -> str:
+def format_event(pool: str, event: LiquidityDeltaEvent) -> str:
     return (
-        f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(event.timestamp))} "
+        f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(event.timestamp))} {pool} "
         f"[{event.event_type}] tick {event.lower_tick}-{event.upper_tick} Δ{event.liquidity_delta} tx={event.tx_hash}"
     )
 
 
-def _build_depth_table(depths: list[AggregatedDepth], current_price: float, step: float) -> Table:
-    table = Table(title="Depth Chart (Buy Wall)", expand=True)
+def _depth_cells(depth: AggregatedDepth) -> tuple[str, str, str]:
+    bar_length = int(depth.usdt_depth // 1_000) + 1
+    return depth.bucket_label, f"{depth.usdt_depth:,.2f}", "▮" * min(bar_length, 60)
+
+
+def _build_depth_table(
+    depths: Sequence[AggregatedDepth],
+    current_price: float,
+    step: float,
+    title: str = "Depth Chart (Buy Wall)",
+    cells: Callable[[AggregatedDepth], tuple[str, str, str]] = _depth_cells,
+) -> Table:
+    table = Table(title=title, expand=True)
     table.add_column("Bucket")
     table.add_column("USDT Depth", justify="right")
     table.add_column("Step", justify="right")
     table.add_column("Bar")
+    step_text = f"{step:,.6f}"
     for depth in depths:
-        bar_length = int(depth.usdt_depth // 1_000) + 1
-        bar = "▮" * min(bar_length, 60)
-        table.add_row(depth.bucket_label, f"{depth.usdt_depth:,.2f}", f"{step:,.6f}", bar)
+        label, amount, bar = cells(depth)
+        table.add_row(label, amount, step_text, bar)
     table.caption = f"Current Price: {current_price:,.6f}"
     return table
 
@@ -42,32 +61,139 @@ def _build_event_panel(events: Deque[str]) -> Panel:
 
 
 class EventRecorder(threading.Thread):
-    def __init__(self, sink: queue.Queue, buffer: Deque[str]):
+    def __init__(self, sink: queue.Queue, buffer: Deque[str], on_change: Callable[[], None] | None = None):
         super().__init__(daemon=True)
         self.sink = sink
         self.buffer = buffer
+        self.on_change = on_change
 
     def run(self) -> None:
         while True:
             try:
-                event = self.sink.get()
-                formatted = _format_event(event)
+                pool, event = self.sink.get()
+                formatted = format_event(pool, event)
                 logging.info(formatted)
                 self.buffer.append(formatted)
+                if self.on_change is not None:
+                    self.on_change()
             except Exception:
                 continue
 
 
-def start_ui(state: LiquidityStateMachine, event_queue: queue.Queue) -> None:
+class PoolSwitcher(threading.Thread):
+    """Reads commands from stdin: ``n`` / ``p`` next / previous pool, a number jumps to that pool, ``g`` toggles the grid."""
+
+    def __init__(self, pool_count: int, layout: str, on_change: Callable[[], None] | None = None):
+        super().__init__(daemon=True)
+        self.pool_count = pool_count
+        self.index = 0
+        self.grid = layout == "grid"
+        self.on_change = on_change
+
+    def run(self) -> None:
+        for line in sys.stdin:
+            self.handle(line)
+
+    def handle(self, line: str) -> None:
+        command = line.strip().lower()
+        if command == "n":
+            self.index = (self.index + 1) % self.pool_count
+        elif command == "p":
+            self.index = (self.index - 1) % self.pool_count
+        elif command == "g":
+            self.grid = not self.grid
+        elif command.isdigit() and 0 < int(command) <= self.pool_count:
+            self.index = int(command) - 1
+        else:
+            return
+        if self.on_change is not None:
+            self.on_change()
+
+
+class FrameRenderer:
+    """Builds UI frames only when something visible changed.
+
+    A frame is keyed by the published depth-view version of each shown pool, the
+    pool selection and the event feed. An unchanged key returns None so the
+    caller can skip the redraw. Cell text is cached per bucket and reused while
+    the bucket's depth stays the same.
+    """
+
+    def __init__(self, registry: PoolRegistry, switcher: PoolSwitcher, event_buffer: Deque[str]):
+        self.registry = registry
+        self.switcher = switcher
+        self.event_buffer = event_buffer
+        self._last_key: Hashable = None
+        # pool -> {bucket_label: (usdt_depth, cells)}，只保留上一帧出现过的桶
+        self._cells: Dict[str, Dict[str, tuple[float, tuple[str, str, str]]]] = {}
+
+    def _shown(self) -> list[str]:
+        labels = list(self.registry.machines)
+        return labels if self.switcher.grid else [labels[self.switcher.index]]
+
+    def _pool_table(self, label: str, view: DepthView) -> Table:
+        previous = self._cells.get(label, {})
+        current: Dict[str, tuple[float, tuple[str, str, str]]] = {}
+
+        def cells(depth: AggregatedDepth) -> tuple[str, str, str]:
+            cached = previous.get(depth.bucket_label)
+            if cached is None or cached[0] != depth.usdt_depth:
+                cached = (depth.usdt_depth, _depth_cells(depth))
+            current[depth.bucket_label] = cached
+            return cached[1]
+
+        table = _build_depth_table(
+            view.rows, view.scale.current_price, view.scale.step, title=f"{label} Buy Wall", cells=cells
+        )
+        self._cells[label] = current
+        return table
+
+    def render(self) -> Group | None:
+        """The next frame, or None if nothing shown has changed since the last one."""
+        shown = self._shown()
+        views = [self.registry.machines[label].depth_view() for label in shown]
+        key = (
+            self.switcher.grid,
+            self.switcher.index,
+            tuple(view.version for view in views),
+            self.event_buffer[-1] if self.event_buffer else None,
+            len(self.event_buffer),
+        )
+        if key == self._last_key:
+            return None
+        self._last_key = key
+        tables = [self._pool_table(label, view) for label, view in zip(shown, views)]
+        if self.switcher.grid:
+            # 所有池子并排显示
+            depth = Columns(tables, equal=True, expand=True)
+        else:
+            depth = tables[0]
+            if len(self.registry) > 1:
+                depth.caption += f"  [{self.switcher.index + 1}/{len(self.registry)}] n/p/<number>/g + Enter"
+        return Group(depth, _build_event_panel(self.event_buffer))
+
+
+def start_ui(registry: PoolRegistry, event_queue: queue.Queue, config: UIConfig, changed: threading.Event) -> None:
+    """Redraw when ``changed`` is set (state applied, new feed line, pool switch), at most once per frame budget."""
     event_buffer: Deque[str] = deque(maxlen=MAX_EVENTS)
-    recorder = EventRecorder(event_queue, event_buffer)
+    recorder = EventRecorder(event_queue, event_buffer, on_change=changed.set)
     recorder.start()
+    switcher = PoolSwitcher(len(registry), config.layout, on_change=changed.set)
+    switcher.start()
+    renderer = FrameRenderer(registry, switcher, event_buffer)
+
+    render_seconds = RENDER_SECONDS.labels(mode="console")
 
-    with Live(refresh_per_second=2, screen=False) as live:
+    # auto_refresh=False：没有后台刷新线程，空闲时不重绘
+    with Live(renderer.render(), auto_refresh=False, screen=False) as live:
+        live.refresh()
         while True:
-            scale = state.adaptive_scale()
-            depths = state.buy_wall_depth()
-            depth_table = _build_depth_table(depths, scale.current_price, scale.step)
-            events_panel = _build_event_panel(event_buffer)
-            live.update(Group(depth_table, events_panel))
-            time.sleep(1)
+            changed.wait()
+            changed.clear()
+            start = time.perf_counter()
+            frame = renderer.render()
+            if frame is not None:
+                live.update(frame, refresh=True)
+                render_seconds.observe(time.perf_counter() - start)
+            # 帧预算内到达的更新合并到下一帧
+            time.sleep(config.frame_budget)
@@ -1,45 +1,263 @@
+import asyncio
 import json
+import logging
+import random
+import threading
 import time
-from typing import Iterable, List
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Set
 import websockets
+import websockets.asyncio.client
 from websockets.sync.client import ClientConnection
+from web3 import AsyncWeb3, Web3
+
+from app.decoding import log_block_number, log_index
+from app.logs import async_get_logs_chunked, get_logs_chunked
 
 
 class WebsocketLogStream:
-    def __init__(self, wss_url: str, address: str, topics: List[str]):
+    def __init__(
+        self,
+        wss_url: str,
+        address: str | List[str],
+        topics: List[str],
+        web3: Web3 | None = None,
+        backfill_chunk_size: int = 2000,
+        backoff_base: float = 0.5,
+        backoff_max: float = 30.0,
+        dedupe_depth: int = 32,
+    ):
         self.wss_url = wss_url
         self.address = address
         self.topics = topics
         self.subscription_id: str | None = None
+        # HTTP 连接用于断线后 eth_getLogs 补齐缺口；为 None 时不补齐
+        self.web3 = web3
+        self.backfill_chunk_size = backfill_chunk_size
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        # 去重表保留水位之前的区块数：补齐期间缓冲的实时日志晚于补齐到达，仍要能识别
+        self.dedupe_depth = dedupe_depth
+        # 已完整投递的最高区块；断线重连时从下一个区块开始补齐
+        self.last_complete_block: int | None = None
+        # 订阅成功后置位；启动流程据此确认订阅已生效再开始拉取快照
+        self.subscribed = threading.Event()
+        # 重连补齐前调用：回滚已不在主链上的区块，返回最早被回滚的区块 (None 表示没有)
+        self.reorg_check: Callable[[], int | None] | None = None
+        # 区块号 -> blockHash -> 已投递的 logIndex
+        self._seen: Dict[int, Dict[str, Set[int]]] = {}
 
-    def _subscribe(self, ws: ClientConnection) -> str:
+    def _subscribe_payload(self) -> str:
         payload = {
             "id": 1,
             "method": "eth_subscribe",
-            "params": ["logs", {"address": self.address, "topics": self.topics}],
+            # topics 作为 topic0 的 OR 条件传入
+            "params": ["logs", {"address": self.address, "topics": [self.topics]}],
         }
-        ws.send(json.dumps(payload))
-        response = json.loads(ws.recv())
+        return json.dumps(payload)
+
+    def _subscription_result(self, raw_response: str | bytes) -> str:
+        response = json.loads(raw_response)
         if "error" in response:
             raise RuntimeError(response["error"])
         self.subscription_id = response["result"]
         return self.subscription_id
 
-    def stream(self) -> Iterable[dict]:
+    def _subscription_log(self, raw_message: str | bytes, sub_id: str) -> dict | None:
+        """The log carried by one subscription message, or None for anything else / duplicates."""
+        message = json.loads(raw_message)
+        if message.get("method") != "eth_subscription":
+            return None
+        params = message.get("params", {})
+        if params.get("subscription") != sub_id:
+            return None
+        result = params.get("result")
+        if result is not None and self._accept(result):
+            return result
+        return None
+
+    def _subscribe(self, ws: ClientConnection) -> str:
+        ws.send(self._subscribe_payload())
+        return self._subscription_result(ws.recv())
+
+    def _accept(self, raw_log: dict, backfilled: bool = False) -> bool:
+        """Deduplicate by (blockHash, logIndex) and advance the completed-block watermark.
+
+        A live log from a block already delivered under another hash is dropped
+        unless ``removed`` logs retracted that hash first: it is a replay of an
+        orphaned fork buffered while the backfill fetched the canonical one.
+        """
+        block_number = log_block_number(raw_log)
+        # 带上 blockHash：断线期间区块被替换时，补齐拿到的同位置新日志不能当成重复丢掉
+        block_hash = str(raw_log.get("blockHash", "")).lower()
+        index = log_index(raw_log)
+        seen = self._seen.setdefault(block_number, {})
+        if raw_log.get("removed"):
+            # 被 reorg 撤销的日志总是放行
+            indices = seen.get(block_hash)
+            if indices is not None:
+                indices.discard(index)
+                if not indices:
+                    del seen[block_hash]
+            return True
+        indices = seen.get(block_hash)
+        if indices is None:
+            if seen and not backfilled:
+                return False
+            indices = seen[block_hash] = set()
+        elif index in indices:
+            return False
+        indices.add(index)
+        if self.last_complete_block is None or block_number - 1 > self.last_complete_block:
+            self.last_complete_block = block_number - 1
+            for stale in [b for b in self._seen if b <= self.last_complete_block - self.dedupe_depth]:
+                del self._seen[stale]
+        return True
+
+    def _resume_block(self) -> int:
+        """First block to backfill after a (re)connect: after the watermark, or the fork found by ``reorg_check``."""
+        if self.reorg_check is None:
+            return self.last_complete_block + 1
+        try:
+            fork = self.reorg_check()
+        except Exception as e:
+            logging.warning(f"Reorg check failed ({e}), backfilling from block {self.last_complete_block + 1}")
+            fork = None
+        return self._resume_from(fork)
+
+    def _resume_from(self, fork: int | None) -> int:
+        """Backfill start after the consumer rolled back from ``fork`` (None: nothing rolled back)."""
+        from_block = self.last_complete_block + 1
+        if fork is None:
+            return from_block
+        # 回滚区块上已投递过的日志要随补齐重新投递
+        for block in [b for b in self._seen if b >= fork]:
+            del self._seen[block]
+        return min(from_block, fork)
+
+    def _backfill(self, from_block: int) -> Iterable[dict]:
+        head = self.web3.eth.block_number
+        if from_block > head:
+            return
+        logging.info(f"Backfilling logs for blocks {from_block}-{head}")
+        for raw_log in get_logs_chunked(
+            self.web3, self.address, self.topics, from_block, head, self.backfill_chunk_size
+        ):
+            if self._accept(raw_log, backfilled=True):
+                yield raw_log
+
+    def _backoff_delay(self, attempt: int) -> float:
+        # 指数退避 + full jitter，避免所有实例同时重连
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def stream(self, from_block: int | None = None) -> Iterable[dict]:
+        """Yield raw logs forever, backfilling any gap left by a disconnect.
+
+        ``from_block`` (optional) backfills from that block on the first connect too.
+        """
+        if from_block is not None and self.last_complete_block is None:
+            self.last_complete_block = from_block - 1
+        attempt = 0
         while True:
             try:
                 with websockets.sync.client.connect(self.wss_url, ping_interval=20, ping_timeout=20) as ws:
+                    # 先订阅再补齐：补齐期间到达的实时日志留在 socket 缓冲区，随后去重投递
                     sub_id = self._subscribe(ws)
+                    self.subscribed.set()
+                    attempt = 0
+                    if self.web3 is not None and self.last_complete_block is not None:
+                        yield from self._backfill(self._resume_block())
                     for raw in ws:
-                        message = json.loads(raw)
-                        if message.get("method") != "eth_subscription":
-                            continue
-                        params = message.get("params", {})
-                        if params.get("subscription") != sub_id:
-                            continue
-                        result = params.get("result")
+                        result = self._subscription_log(raw, sub_id)
                         if result is not None:
                             yield result
-            except Exception:
-                time.sleep(3)
+            except Exception as e:
+                delay = self._backoff_delay(attempt)
+                attempt += 1
+                logging.warning(f"WebSocket stream error ({e}), reconnecting in {delay:.1f}s")
+                time.sleep(delay)
                 continue
+
+
+class AsyncWebsocketLogStream(WebsocketLogStream):
+    """asyncio variant of :class:`WebsocketLogStream` (websockets.asyncio + AsyncWeb3 backfill).
+
+    Subscription format, deduplication, the completed-block watermark and backoff
+    are shared with the thread-based stream. ``reorg_check`` is a coroutine
+    function here, so the consumer can run it in order with the logs it has
+    already been handed.
+    """
+
+    def __init__(self, wss_url: str, address: str | List[str], topics: List[str], web3: AsyncWeb3 | None = None, **kwargs):
+        super().__init__(wss_url, address, topics, **kwargs)
+        self.web3 = web3
+        self.reorg_check: Callable[[], Awaitable[int | None]] | None = None
+
+    @classmethod
+    def from_stream(cls, stream: WebsocketLogStream, web3: AsyncWeb3 | None) -> "AsyncWebsocketLogStream":
+        """Same subscription as ``stream``, resuming from its watermark and dedupe set.
+
+        ``reorg_check`` is not carried over: the caller sets a coroutine function.
+        """
+        async_stream = cls(
+            stream.wss_url,
+            stream.address,
+            stream.topics,
+            web3=web3,
+            backfill_chunk_size=stream.backfill_chunk_size,
+            backoff_base=stream.backoff_base,
+            backoff_max=stream.backoff_max,
+            dedupe_depth=stream.dedupe_depth,
+        )
+        async_stream.last_complete_block = stream.last_complete_block
+        async_stream._seen = {
+            block: {block_hash: set(indices) for block_hash, indices in seen.items()}
+            for block, seen in stream._seen.items()
+        }
+        return async_stream
+
+    async def _resume_block_async(self) -> int:
+        if self.reorg_check is None:
+            return self.last_complete_block + 1
+        try:
+            fork = await self.reorg_check()
+        except Exception as e:
+            logging.warning(f"Reorg check failed ({e}), backfilling from block {self.last_complete_block + 1}")
+            fork = None
+        return self._resume_from(fork)
+
+    async def _backfill_async(self, from_block: int) -> AsyncIterator[dict]:
+        head = await self.web3.eth.block_number
+        if from_block > head:
+            return
+        logging.info(f"Backfilling logs for blocks {from_block}-{head}")
+        async for raw_log in async_get_logs_chunked(
+            self.web3, self.address, self.topics, from_block, head, self.backfill_chunk_size
+        ):
+            if self._accept(raw_log, backfilled=True):
+                yield raw_log
+
+    async def stream(self, from_block: int | None = None) -> AsyncIterator[dict]:
+        if from_block is not None and self.last_complete_block is None:
+            self.last_complete_block = from_block - 1
+        attempt = 0
+        while True:
+            try:
+                async with websockets.asyncio.client.connect(self.wss_url, ping_interval=20, ping_timeout=20) as ws:
+                    await ws.send(self._subscribe_payload())
+                    sub_id = self._subscription_result(await ws.recv())
+                    attempt = 0
+                    if self.web3 is not None and self.last_complete_block is not None:
+                        from_block = await self._resume_block_async()
+                        async for raw_log in self._backfill_async(from_block):
+                            yield raw_log
+                    async for raw in ws:
+                        result = self._subscription_log(raw, sub_id)
+                        if result is not None:
+                            yield result
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                delay = self._backoff_delay(attempt)
+                attempt += 1
+                logging.warning(f"WebSocket stream error ({e}), reconnecting in {delay:.1f}s")
+                await asyncio.sleep(delay)
@@ -0,0 +1,114 @@
+"""Decoder throughput: fixed-layout memoryview decoding vs eth_abi.decode.
+
+Usage: python -m benchmarks.bench_decoder [--events 200000]
+"""
+
+import argparse
+import random
+import time
+
+from eth_abi import decode, encode
+
+from app.decoding import (
+    V3_BURN_TOPIC,
+    V3_LIQUIDITY_DECODERS,
+    V3_MINT_TOPIC,
+    V4_LIQUIDITY_DECODERS,
+    V4_MODIFY_LIQUIDITY_TOPIC,
+    V3_SWAP_TOPIC,
+)
+from app.protocols.base import ProtocolAdapter
+
+
+def _topic(value: int) -> str:
+    return "0x" + (value % (1 << 256)).to_bytes(32, "big").hex()
+
+
+def make_logs(count: int, seed: int = 7) -> list[dict]:
+    """Synthetic Mint / Burn / ModifyLiquidity logs laid out exactly as on-chain."""
+    rng = random.Random(seed)
+    logs = []
+    for i in range(count):
+        lower = rng.randrange(-887_000, 887_000, 60)
+        upper = lower + rng.randrange(60, 60_000, 60)
+        amount = rng.randrange(1, 1 << 120)
+        kind = i % 3
+        if kind == 0:
+            topics = [V3_MINT_TOPIC, _topic(0xAA), _topic(lower), _topic(upper)]
+            data = encode(["address", "uint128", "uint256", "uint256"], ["0x" + "11" * 20, amount, 1, 2])
+        elif kind == 1:
+            topics = [V3_BURN_TOPIC, _topic(0xAA), _topic(lower), _topic(upper)]
+            data = encode(["uint128", "uint256", "uint256"], [amount, 1, 2])
+        else:
+            topics = [V4_MODIFY_LIQUIDITY_TOPIC, _topic(0xBB), _topic(0xAA)]
+            data = encode(["int24", "int24", "int256", "bytes32"], [lower, upper, -amount, b"\x00" * 32])
+        logs.append(
+            {
+                "address": "0x" + "22" * 20,
+                "topics": topics,
+                "data": "0x" + data.hex(),
+                "blockNumber": hex(1_000 + i // 10),
+                "blockHash": "0x" + "33" * 32,
+                "logIndex": hex(i % 10),
+                "transactionHash": "0x" + "44" * 32,
+            }
+        )
+    return logs
+
+
+def decode_eth_abi(raw_log: dict) -> tuple[int, int, int]:
+    """Previous approach: eth_abi over the whole payload, then pick fields."""
+    topics = raw_log["topics"]
+    payload = bytes.fromhex(raw_log["data"][2:])
+    if topics[0] == V3_MINT_TOPIC:
+        decoded = decode(["address", "uint128", "uint256", "uint256"], payload)
+        return decode(["int24"], bytes.fromhex(topics[2][2:]))[0], decode(["int24"], bytes.fromhex(topics[3][2:]))[0], decoded[1]
+    if topics[0] == V3_BURN_TOPIC:
+        decoded = decode(["uint128", "uint256", "uint256"], payload)
+        return decode(["int24"], bytes.fromhex(topics[2][2:]))[0], decode(["int24"], bytes.fromhex(topics[3][2:]))[0], -decoded[0]
+    decoded = decode(["int24", "int24", "int256", "bytes32"], payload)
+    return decoded[0], decoded[1], decoded[2]
+
+
+class _BenchAdapter(ProtocolAdapter):
+    def __init__(self):
+        self.swap_topic = V3_SWAP_TOPIC
+        self.liquidity_decoders = {**V3_LIQUIDITY_DECODERS, **V4_LIQUIDITY_DECODERS}
+
+    def fetch_snapshot(self):
+        raise NotImplementedError
+
+
+def _time(label: str, fn, logs: list[dict]) -> float:
+    start = time.perf_counter()
+    for raw_log in logs:
+        fn(raw_log)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {len(logs) / elapsed:>12,.0f} logs/s  ({elapsed * 1e6 / len(logs):.2f} us/log)")
+    return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=200_000)
+    args = parser.parse_args()
+
+    logs = make_logs(args.events)
+    adapter = _BenchAdapter()
+    for raw_log in logs[:3000]:
+        event = adapter.decode_log(raw_log)
+        assert (event.lower_tick, event.upper_tick, event.liquidity_delta) == decode_eth_abi(raw_log)
+
+    def fast_fields(raw_log: dict) -> tuple[int, int, int]:
+        topics = raw_log["topics"]
+        _, decoder = adapter.liquidity_decoders[topics[0]]
+        return decoder(topics, memoryview(bytes.fromhex(raw_log["data"][2:])))
+
+    baseline = _time("eth_abi.decode", decode_eth_abi, logs)
+    fast = _time("fixed-layout decoder", fast_fields, logs)
+    _time("adapter decode_log (event)", adapter.decode_log, logs)
+    print(f"speedup (fields only): {baseline / fast:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""Snapshot, ingestion and depth benchmarks on synthetic pools, reported as JSON.
+
+Usage: python -m benchmarks.bench_suite [--ticks 1000 10000 100000] [--events 50000] [--output results.json]
+
+Per pool size it measures:
+- snapshot: UniswapV3Adapter.fetch_snapshot against a mocked MulticallClient
+  (the real call encoding and output decoding, no network), best of --repeats
+- apply: events/s through LiquidityStateMachine.apply_event, and through
+  apply_events in blocks of the stream
+- depth: latency percentiles of a depth read, and of a price move that forces
+  the buy-wall to be rebuilt and republished
+- memory: tracemalloc peak while building the state machine from a snapshot
+"""
+
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from itertools import groupby
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import numpy as np
+from web3 import Web3
+
+from app.abi_loader import _load_single_abi
+from app.config import AppConfig, ChainConfig, PoolConfig, SnapshotConfig
+from app.protocols.uniswap_v3 import UniswapV3Adapter
+from app.state_machine import LiquidityStateMachine
+from app.types import PriceState
+from benchmarks.synthetic import StaticBlockProvider, SyntheticMulticall, SyntheticPool
+
+_POOL_ABI = _load_single_abi(Path(__file__).parents[1] / "app" / "abis", "uniswap_v3_pool")
+
+
+def _percentiles(samples: List[float]) -> Dict[str, float]:
+    values = np.array(samples) * 1e6
+    return {
+        "p50_us": round(float(np.percentile(values, 50)), 2),
+        "p90_us": round(float(np.percentile(values, 90)), 2),
+        "p99_us": round(float(np.percentile(values, 99)), 2),
+        "max_us": round(float(values.max()), 2),
+    }
+
+
+def _config(pool: SyntheticPool) -> AppConfig:
+    pool_config = PoolConfig(
+        pool_address=pool.address,
+        protocol="uniswap_v3",
+        token0="USDT",
+        token1="TOKEN",
+        fee=500,
+        token0_decimals=18,
+        token1_decimals=18,
+    )
+    return AppConfig(
+        chain=ChainConfig(name="bench", rpc_url="", wss_url="", explorer=""),
+        pool=pool_config,
+        pools=[pool_config],
+        snapshot=SnapshotConfig(cache_dir=None),
+    )
+
+
+def _adapter(pool: SyntheticPool) -> UniswapV3Adapter:
+    web3 = Web3(StaticBlockProvider(pool.block_number))
+    return UniswapV3Adapter(web3, pool.address, _POOL_ABI, "", SyntheticMulticall(web3, pool), 18, 18)
+
+
+def bench_snapshot(pool: SyntheticPool, repeats: int) -> dict:
+    adapter = _adapter(pool)
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        snapshot = adapter.fetch_snapshot()
+        timings.append(time.perf_counter() - start)
+    assert len(snapshot.ticks) == len(pool.gross)
+    return {
+        "seconds": round(min(timings), 4),
+        "round_trips": sum(phase.round_trips for phase in snapshot.phases),
+        "phases": {phase.name: round(phase.wall_time, 4) for phase in snapshot.phases},
+    }
+
+
+def _machine(pool: SyntheticPool) -> LiquidityStateMachine:
+    adapter = _adapter(pool)
+    return LiquidityStateMachine(adapter.web3, _config(pool), {}, adapter)
+
+
+def bench_memory(pool: SyntheticPool) -> dict:
+    tracemalloc.start()
+    _machine(pool)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"peak_mb": round(peak / 2**20, 2), "bytes_per_tick": round(peak / max(1, len(pool.gross)), 1)}
+
+
+def _timed(fn: Callable[[], None]) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def bench_apply(pool: SyntheticPool, event_count: int) -> dict:
+    # 两个状态机从同一个快照出发，分别逐条 apply_event 与按区块 apply_events 同一条事件流
+    single_machine, batch_machine = _machine(pool), _machine(pool)
+    events = [single_machine.adapter.decode_log(raw_log) for raw_log in pool.events(event_count)]
+    blocks = [list(block) for _, block in groupby(events, key=lambda event: event.block_number)]
+    single = _timed(lambda: [single_machine.apply_event(event) for event in events])
+    batched = _timed(lambda: [batch_machine.apply_events(block) for block in blocks])
+    # tick 状态必须完全一致；深度是浮点增量累加，合并顺序不同只允许舍入误差
+    assert single_machine.profile.ticks.columns() == batch_machine.profile.ticks.columns()
+    single_rows, batch_rows = single_machine.buy_wall_depth(), batch_machine.buy_wall_depth()
+    assert [row.bucket_label for row in single_rows] == [row.bucket_label for row in batch_rows]
+    assert np.allclose(
+        [row.usdt_depth for row in single_rows], [row.usdt_depth for row in batch_rows], rtol=1e-9, atol=0
+    )
+    return {
+        "events": len(events),
+        "apply_event_per_s": round(len(events) / single),
+        "apply_events_per_s": round(len(events) / batched),
+        "events_per_block": round(len(events) / len(blocks), 1),
+    }
+
+
+def bench_depth(machine: LiquidityStateMachine, samples: int) -> dict:
+    reads = [_timed(machine.buy_wall_depth) for _ in range(samples)]
+    price = machine.snapshot.price_state
+    rebuilds = []
+    for i in range(min(samples, 500)):
+        tick = (price.tick or 0) + (i % 2 * 2 - 1) * 25
+        state = PriceState(sqrt_price_x96=None, tick=tick)
+        rebuilds.append(_timed(lambda: machine.update_price(state)))
+    return {
+        "read": _percentiles(reads),
+        "price_move_rebuild": _percentiles(rebuilds),
+        "buckets": len(machine.buy_wall_depth()),
+    }
+
+
+def run(tick_counts: List[int], event_count: int, repeats: int, samples: int) -> dict:
+    results = []
+    for tick_count in tick_counts:
+        pool = SyntheticPool(tick_count)
+        result = {"ticks": len(pool.gross)}
+        result["snapshot"] = bench_snapshot(pool, repeats)
+        result["memory"] = bench_memory(pool)
+        machine = _machine(pool)
+        result["depth"] = bench_depth(machine, samples)
+        # 最后运行：事件流会改变池子状态
+        result["apply"] = bench_apply(pool, event_count)
+        results.append(result)
+        print(f"{tick_count:>8} ticks done", file=sys.stderr)
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "timestamp": int(time.time()),
+        },
+        "results": results,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ticks", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--events", type=int, default=50_000)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--samples", type=int, default=2_000)
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    report = run(args.ticks, args.events, args.repeats, args.samples)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Memory and scan time: columnar TickStore vs the former dict of TickLiquidity dataclasses.
+
+Usage: python -m benchmarks.bench_tick_store [--ticks 200000]
+"""
+
+import argparse
+import random
+import time
+import tracemalloc
+from dataclasses import dataclass
+from itertools import accumulate
+
+from app.protocols.bitmap import MAX_TICK, MIN_TICK
+from app.tick_store import TickStore
+
+
+@dataclass
+class _LegacyTickLiquidity:
+    """Layout of TickLiquidity before the columnar store (no slots, price floats as "reserves")."""
+
+    lower_tick: int
+    upper_tick: int
+    liquidity: int
+    token0_reserves: float
+    token1_reserves: float
+    liquidity_net: int | None = None
+
+
+def _rows(count: int, spacing: int, seed: int = 11) -> list[tuple[int, int, int]]:
+    rng = random.Random(seed)
+    ticks = rng.sample(range(-887_272 // spacing, 887_272 // spacing), count)
+    return [(tick * spacing, rng.randrange(1, 1 << 100), rng.randrange(-(1 << 99), 1 << 99)) for tick in ticks]
+
+
+def _measure(build):
+    # 行数据 (含 gross / net int 对象) 在计时内生成：结构保留的 int 计入，编码后丢弃的不计
+    tracemalloc.start()
+    value = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return value, size
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ticks", type=int, default=200_000)
+    args = parser.parse_args()
+    spacing = 1
+    count = args.ticks
+
+    legacy, legacy_bytes = _measure(
+        lambda: {
+            tick: _LegacyTickLiquidity(tick, tick + spacing, gross, 1.0001**tick, 1.0001 ** (tick + spacing), net)
+            for tick, gross, net in _rows(count, spacing)
+        }
+    )
+    store, store_bytes = _measure(lambda: TickStore.from_columns(spacing, *zip(*_rows(count, spacing))))
+    print(f"legacy dict       {legacy_bytes / count:8.1f} bytes/tick")
+    print(f"TickStore         {store_bytes / count:8.1f} bytes/tick  ({legacy_bytes / store_bytes:.1f}x smaller)")
+
+    # 扫描：按 tick 顺序累加 liquidityNet (LiquidityProfile.segments 的工作量)；
+    # 旧结构的 tick 顺序在计时外排好，两边都只计遍历和累加
+    order = sorted(legacy)
+    start = time.perf_counter()
+    legacy_prefix = list(accumulate(legacy[tick].liquidity_net or 0 for tick in order))
+    legacy_scan = time.perf_counter() - start
+    start = time.perf_counter()
+    store_prefix = list(accumulate(net for _, net in store.net_between(MIN_TICK - 1, MAX_TICK + 1)))
+    store_scan = time.perf_counter() - start
+    assert store_prefix == legacy_prefix
+    print(f"legacy scan       {legacy_scan * 1e3:8.1f} ms")
+    print(f"TickStore scan    {store_scan * 1e3:8.1f} ms  ({legacy_scan / store_scan:.2f}x the legacy speed)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,530 @@
+"""Local JSON-RPC + WebSocket stand-in node backed by a SyntheticPool, for deterministic load tests.
+
+Usage: python -m benchmarks.fake_node [--protocol uniswap_v3] [--ticks 10000] [--rate 1000]
+           [--block-time 1.0] [--reorg-every N] [--disconnect-every S] [--latency SECONDS]
+
+HTTP serves eth_blockNumber, eth_chainId, net_version, web3_clientVersion, eth_getBlockByNumber,
+eth_getLogs and eth_call
+(Multicall3 aggregate3 / aggregate around the pool, TickLens and PoolManager
+view functions the adapters use). Calls pinned to a recent block are answered
+from that block's state; older blocks fail like a pruned node. The WebSocket
+port serves eth_subscribe("logs") and pushes every new block's logs.
+
+Fault injection:
+- ``--latency`` / ``--jitter``: delay every HTTP response
+- ``--disconnect-every S``: drop every WebSocket connection every S seconds
+- ``--reorg-every N``: every N blocks, replace the head block; subscribers get
+  its logs again with ``removed: true``, then the new block's logs
+- ``--max-logs``: eth_getLogs ranges with more results fail, like public RPCs
+- ``--max-backlog``: subscribers that fall this many messages behind are cut off
+
+The same seed produces the same pool and event stream. Startup prints the
+environment for ``main.py`` to connect to this node.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Deque, Dict, List
+
+import websockets
+from eth_abi import decode, encode
+from eth_utils import function_abi_to_4byte_selector
+from eth_utils.abi import get_abi_input_types, get_abi_output_types
+from websockets.asyncio.server import ServerConnection, serve
+
+from app.abi_loader import _load_single_abi
+from app.multicall import MULTICALL3_ABI
+from benchmarks.synthetic import MULTICALL_ADDRESS, POOL_ADDRESS, POOL_ID, PoolView, SyntheticPool
+
+TICK_LENS_ADDRESS = "0x" + "33" * 20
+POOL_MANAGER_ADDRESS = "0x" + "44" * 20
+
+_ABI_DIR = Path(__file__).parents[1] / "app" / "abis"
+# 按目标合约区分的 ABI：池子 (V3 / PancakeSwap)、TickLens、PoolManager
+_TARGET_ABIS = {
+    "pool": ["uniswap_v3_pool", "pancake_pool"],
+    "tick_lens": ["pancake_tick_lens"],
+    "pool_manager": ["uniswap_v4_pool_manager"],
+}
+
+
+class RPCError(Exception):
+    def __init__(self, code: int, message: str):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+def _view_functions(names: List[str]) -> Dict[bytes, dict]:
+    """4-byte selector -> function ABI for the view functions PoolView answers."""
+    functions = {}
+    for name in names:
+        for entry in _load_single_abi(_ABI_DIR, name):
+            if entry.get("type") != "function" or entry.get("stateMutability") not in ("view", "pure"):
+                continue
+            # extsload 只支持单槽位重载
+            if entry["name"] == "extsload" and get_abi_input_types(entry) != ["bytes32"]:
+                continue
+            functions[function_abi_to_4byte_selector(entry)] = entry
+    return functions
+
+
+_MULTICALL_FUNCTIONS = {function_abi_to_4byte_selector(entry): entry for entry in MULTICALL3_ABI}
+
+
+def _block_param(value: Any, head: int) -> int:
+    if value in (None, "latest", "pending", "safe", "finalized"):
+        return head
+    if value == "earliest":
+        return 0
+    if isinstance(value, dict):
+        value = value.get("blockNumber")
+    return int(value, 16) if isinstance(value, str) else int(value)
+
+
+def _address_filter(address: Any) -> set | None:
+    if not address:
+        return None
+    addresses = address if isinstance(address, list) else [address]
+    return {item.lower() for item in addresses}
+
+
+def _log_matches(raw_log: dict, addresses: set | None, topics: List[Any]) -> bool:
+    """eth_getLogs / eth_subscribe filter semantics: address OR-list, per-position topic OR-lists."""
+    if addresses is not None and raw_log["address"].lower() not in addresses:
+        return False
+    log_topics = raw_log["topics"]
+    for position, wanted in enumerate(topics or []):
+        if wanted is None:
+            continue
+        if position >= len(log_topics):
+            return False
+        options = wanted if isinstance(wanted, list) else [wanted]
+        if log_topics[position].lower() not in {option.lower() for option in options}:
+            return False
+    return True
+
+
+class FakeNode:
+    """JSON-RPC state for one synthetic pool: pool state for the last ``state_blocks`` blocks, logs for ``history_blocks``.
+
+    ``handle`` is thread-safe; the HTTP server threads and the asyncio block
+    producer share one lock around the pool model.
+    """
+
+    def __init__(
+        self,
+        pool: SyntheticPool,
+        multicall_address: str = MULTICALL_ADDRESS,
+        tick_lens_address: str = TICK_LENS_ADDRESS,
+        chain_id: int = 31337,
+        state_blocks: int = 16,
+        history_blocks: int = 1024,
+        max_logs: int = 10_000,
+        logs_per_block: int = 100,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+    ):
+        self.pool = pool
+        self.multicall_address = multicall_address.lower()
+        self.tick_lens_address = tick_lens_address.lower()
+        self.chain_id = chain_id
+        self.state_blocks = state_blocks
+        self.history_blocks = history_blocks
+        self.max_logs = max_logs
+        self.logs_per_block = logs_per_block
+        self.latency = latency
+        self.jitter = jitter
+        self.lock = threading.Lock()
+        # 目标地址 -> 该合约可调用的 selector 表
+        target_kind = "pool_manager" if pool.protocol == "uniswap_v4" else "pool"
+        self.targets = {
+            pool.address.lower(): _view_functions(_TARGET_ABIS[target_kind]),
+            self.tick_lens_address: _view_functions(_TARGET_ABIS["tick_lens"]),
+        }
+        self.views: "OrderedDict[int, PoolView]" = OrderedDict()
+        self.block_logs: "OrderedDict[int, List[dict]]" = OrderedDict()
+        # 区块号 -> (blockHash, timestamp)，供 eth_getBlockByNumber 核对重组
+        self.headers: "OrderedDict[int, tuple[str, int]]" = OrderedDict()
+        self._seal()
+
+    @property
+    def head(self) -> int:
+        return self.pool.block_number
+
+    def _seal(self) -> None:
+        """Record the pool's current block as head: its state for eth_call and its logs for eth_getLogs."""
+        self.views[self.head] = self.pool.freeze()
+        self.block_logs[self.head] = self.pool.block_logs
+        self.headers[self.head] = (self.pool.block_hash, self.pool.block_timestamp)
+        while len(self.views) > self.state_blocks:
+            self.views.popitem(last=False)
+        while len(self.block_logs) > self.history_blocks:
+            self.block_logs.popitem(last=False)
+        while len(self.headers) > self.history_blocks:
+            self.headers.popitem(last=False)
+
+    def produce_block(self, reorg: bool = False) -> List[dict]:
+        """Mine the next block (or replace the head with ``reorg``); returns the logs to push to subscribers."""
+        with self.lock:
+            if reorg:
+                pushed = self.pool.reorg_block()
+            else:
+                self.pool.new_block()
+                pushed = []
+            # 与新版 geth / reth 一样在日志中带上 blockTimestamp，供区块到接收的滞后指标使用
+            self.pool.block_timestamp = int(time.time())
+            for log_index in range(self.logs_per_block):
+                pushed.append(self.pool.random_log(log_index))
+            self._seal()
+        return pushed
+
+    def handle(self, request: dict) -> dict:
+        response: Dict[str, Any] = {"jsonrpc": "2.0", "id": request.get("id")}
+        try:
+            method = request.get("method")
+            handler = getattr(self, "_rpc_" + str(method), None)
+            if handler is None:
+                raise RPCError(-32601, f"the method {method} does not exist/is not available")
+            with self.lock:
+                response["result"] = handler(*request.get("params", []))
+        except RPCError as e:
+            response["error"] = {"code": e.code, "message": e.message}
+        except Exception as e:
+            response["error"] = {"code": -32602, "message": f"invalid params: {e}"}
+        return response
+
+    def _rpc_eth_blockNumber(self) -> str:
+        return hex(self.head)
+
+    def _rpc_eth_chainId(self) -> str:
+        return hex(self.chain_id)
+
+    def _rpc_web3_clientVersion(self) -> str:
+        return "FakeNode/synthetic"
+
+    def _rpc_net_version(self) -> str:
+        return str(self.chain_id)
+
+    def _rpc_eth_getBlockByNumber(self, block: Any, full_transactions: bool = False) -> dict | None:
+        block_number = _block_param(block, self.head)
+        header = self.headers.get(block_number)
+        if header is None:
+            return None
+        parent = self.headers.get(block_number - 1)
+        return {
+            "number": hex(block_number),
+            "hash": header[0],
+            "parentHash": parent[0] if parent is not None else "0x" + "00" * 32,
+            "timestamp": hex(header[1]),
+            "transactions": [],
+        }
+
+    def _rpc_eth_getLogs(self, params: dict) -> List[dict]:
+        from_block = _block_param(params.get("fromBlock"), self.head)
+        to_block = min(_block_param(params.get("toBlock"), self.head), self.head)
+        oldest = next(iter(self.block_logs))
+        if from_block < oldest:
+            raise RPCError(-32000, f"history before block {oldest} is not available")
+        addresses = _address_filter(params.get("address"))
+        topics = params.get("topics") or []
+        result = []
+        for block_number in range(from_block, to_block + 1):
+            for raw_log in self.block_logs.get(block_number, ()):
+                if _log_matches(raw_log, addresses, topics):
+                    result.append(raw_log)
+            if len(result) > self.max_logs:
+                raise RPCError(-32005, f"query returned more than {self.max_logs} results")
+        return result
+
+    def _rpc_eth_call(self, transaction: dict, block: Any = "latest") -> str:
+        block_number = _block_param(block, self.head)
+        if block_number > self.head:
+            raise RPCError(-32000, "header not found")
+        view = self.views.get(block_number)
+        if view is None:
+            raise RPCError(-32000, f"missing trie node (block {block_number} is pruned)")
+        target = transaction["to"].lower()
+        data = bytes.fromhex(transaction["data"][2:])
+        if target == self.multicall_address:
+            return "0x" + self._multicall(view, data, block_number).hex()
+        return "0x" + self._call(view, target, data).hex()
+
+    def _call(self, view: PoolView, target: str, data: bytes) -> bytes:
+        fn = self.targets.get(target, {}).get(data[:4])
+        if fn is None:
+            raise RPCError(3, "execution reverted")
+        args = decode(get_abi_input_types(fn), data[4:])
+        return encode(get_abi_output_types(fn), list(view.call(fn["name"], args)))
+
+    def _multicall(self, view: PoolView, data: bytes, block_number: int) -> bytes:
+        fn = _MULTICALL_FUNCTIONS.get(data[:4])
+        if fn is None:
+            raise RPCError(3, "execution reverted")
+        (calls,) = decode(get_abi_input_types(fn), data[4:])
+        if fn["name"] == "aggregate3":
+            results = []
+            for target, allow_failure, call_data in calls:
+                try:
+                    results.append((True, self._call(view, target.lower(), call_data)))
+                except RPCError:
+                    if not allow_failure:
+                        raise RPCError(3, "execution reverted: Multicall3: call failed")
+                    results.append((False, b""))
+            return encode(get_abi_output_types(fn), [results])
+        # Multicall2 aggregate：任一调用失败整体 revert
+        return_data = [self._call(view, target.lower(), call_data) for target, call_data in calls]
+        return encode(get_abi_output_types(fn), [block_number, return_data])
+
+    def delay(self) -> None:
+        if self.latency or self.jitter:
+            time.sleep(self.latency + random.uniform(0, self.jitter))
+
+
+class _RPCHandler(BaseHTTPRequestHandler):
+    node: FakeNode
+
+    def do_POST(self) -> None:
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        request = json.loads(body)
+        self.node.delay()
+        if isinstance(request, list):
+            response: Any = [self.node.handle(item) for item in request]
+        else:
+            response = self.node.handle(request)
+        payload = json.dumps(response).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+def start_http(node: FakeNode, host: str, port: int) -> ThreadingHTTPServer:
+    """Serve JSON-RPC over HTTP in a daemon thread; ``port=0`` picks a free port (see ``server_address``)."""
+    handler = type("RPCHandler", (_RPCHandler,), {"node": node})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True, name="fake-node-http").start()
+    return server
+
+
+class _Client:
+    """One WebSocket connection: its log filters and the messages not yet written to it."""
+
+    def __init__(self, ws: ServerConnection):
+        self.ws = ws
+        self.subscriptions: Dict[str, tuple[set | None, List[Any]]] = {}
+        self.outbox: Deque[str] = deque()
+        self.ready = asyncio.Event()
+
+    def enqueue(self, message: str) -> None:
+        self.outbox.append(message)
+        self.ready.set()
+
+    async def send_loop(self) -> None:
+        while True:
+            if not self.outbox:
+                self.ready.clear()
+                await self.ready.wait()
+            await self.ws.send(self.outbox.popleft())
+
+
+class Subscriptions:
+    """WebSocket side: eth_subscribe("logs") filters per connection, block pushes and dropped connections.
+
+    Pushes go into a per-connection outbox drained by its own task, so a slow
+    subscriber never delays block production; one more than ``max_backlog``
+    messages behind is disconnected, as nodes do with stalled subscriptions.
+    """
+
+    def __init__(self, node: FakeNode, max_backlog: int = 100_000):
+        self.node = node
+        self.max_backlog = max_backlog
+        self.clients: Dict[ServerConnection, _Client] = {}
+        self._next_id = 0
+        self.pushed = 0
+
+    async def handler(self, ws: ServerConnection) -> None:
+        client = self.clients[ws] = _Client(ws)
+        sender = asyncio.create_task(client.send_loop())
+        try:
+            async for raw in ws:
+                request = json.loads(raw)
+                response: Dict[str, Any] = {"jsonrpc": "2.0", "id": request.get("id")}
+                method = request.get("method")
+                params = request.get("params", [])
+                if method == "eth_subscribe":
+                    if params[0] != "logs":
+                        response["error"] = {"code": -32602, "message": f"unsupported subscription {params[0]}"}
+                    else:
+                        self._next_id += 1
+                        sub_id = hex(self._next_id)
+                        log_filter = params[1] if len(params) > 1 else {}
+                        client.subscriptions[sub_id] = (_address_filter(log_filter.get("address")), log_filter.get("topics") or [])
+                        response["result"] = sub_id
+                elif method == "eth_unsubscribe":
+                    response["result"] = client.subscriptions.pop(params[0], None) is not None
+                else:
+                    response = self.node.handle(request)
+                client.enqueue(json.dumps(response))
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            sender.cancel()
+            self.clients.pop(ws, None)
+
+    def push(self, raw_logs: List[dict]) -> None:
+        # 每条日志只序列化一次，各订阅只拼接外层消息
+        encoded = [json.dumps(raw_log) for raw_log in raw_logs]
+        for client in list(self.clients.values()):
+            for sub_id, (addresses, topics) in client.subscriptions.items():
+                prefix = '{"jsonrpc":"2.0","method":"eth_subscription","params":{"subscription":"%s","result":' % sub_id
+                for raw_log, text in zip(raw_logs, encoded):
+                    if _log_matches(raw_log, addresses, topics):
+                        client.enqueue(prefix + text + "}}")
+                        self.pushed += 1
+            if len(client.outbox) > self.max_backlog:
+                logging.warning(f"Dropping a subscriber {len(client.outbox)} messages behind")
+                self._drop(client)
+
+    def _drop(self, client: _Client) -> None:
+        client.ws.transport.abort()
+        self.clients.pop(client.ws, None)
+
+    def drop_all(self) -> int:
+        """Abort every connection without a close handshake, like a node restart or network cut."""
+        clients = list(self.clients.values())
+        for client in clients:
+            self._drop(client)
+        return len(clients)
+
+
+async def run(
+    node: FakeNode,
+    host: str,
+    http_port: int,
+    ws_port: int,
+    block_time: float,
+    reorg_every: int = 0,
+    disconnect_every: float = 0.0,
+    blocks: int = 0,
+    max_backlog: int = 100_000,
+) -> Subscriptions:
+    """Serve HTTP and WebSocket and mine a block every ``block_time`` seconds.
+
+    ``blocks=0`` runs forever; otherwise it stops after ``blocks`` blocks, once
+    every connected subscriber has been sent everything.
+    """
+    http_server = start_http(node, host, http_port)
+    subscriptions = Subscriptions(node, max_backlog)
+    async with serve(subscriptions.handler, host, ws_port, max_queue=None) as ws_server:
+        http_address = http_server.server_address
+        ws_address = ws_server.sockets[0].getsockname()
+        logging.info(f"Fake node: http://{http_address[0]}:{http_address[1]} ws://{ws_address[0]}:{ws_address[1]}")
+        mined = 0
+        next_block = next_drop = time.monotonic()
+        next_drop += disconnect_every
+        try:
+            while not blocks or mined < blocks:
+                next_block += block_time
+                await asyncio.sleep(max(0.0, next_block - time.monotonic()))
+                if disconnect_every and time.monotonic() >= next_drop:
+                    next_drop += disconnect_every
+                    dropped = subscriptions.drop_all()
+                    if dropped:
+                        logging.info(f"Dropped {dropped} WebSocket connections at block {node.head}")
+                reorg = bool(reorg_every) and mined > 0 and mined % reorg_every == 0
+                subscriptions.push(node.produce_block(reorg=reorg))
+                mined += 1
+            while any(client.outbox for client in subscriptions.clients.values()):
+                await asyncio.sleep(0.05)
+        finally:
+            http_server.shutdown()
+    return subscriptions
+
+
+def _environment(node: FakeNode, host: str, http_port: int, ws_port: int) -> Dict[str, str]:
+    pool = node.pool
+    environment = {
+        "RPC_URL": f"http://{host}:{http_port}",
+        "WSS_URL": f"ws://{host}:{ws_port}",
+        "POOL_ADDRESS": pool.address,
+        "POOL_PROTOCOL": pool.protocol,
+        "POOL_TICK_SPACING": str(pool.tick_spacing),
+        "MULTICALL_ADDRESS": node.multicall_address,
+        "SNAPSHOT_CACHE_DIR": "",
+    }
+    if pool.protocol == "pancake_v3":
+        environment["TICK_LENS_ADDRESS"] = node.tick_lens_address
+    if pool.protocol == "uniswap_v4":
+        environment["POOL_ID"] = pool.pool_id
+    return environment
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--protocol", choices=["uniswap_v3", "pancake_v3", "uniswap_v4"], default="uniswap_v3")
+    parser.add_argument("--ticks", type=int, default=10_000)
+    parser.add_argument("--tick-spacing", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--http-port", type=int, default=8545)
+    parser.add_argument("--ws-port", type=int, default=8546)
+    parser.add_argument("--rate", type=float, default=1_000.0, help="logs per second")
+    parser.add_argument("--block-time", type=float, default=1.0)
+    parser.add_argument("--reorg-every", type=int, default=0, help="replace the head block every N blocks, 0 = never")
+    parser.add_argument("--disconnect-every", type=float, default=0.0, help="drop WebSocket connections every S seconds")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every HTTP response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra uniform random delay, seconds")
+    parser.add_argument("--state-blocks", type=int, default=16, help="recent blocks eth_call can be pinned to")
+    parser.add_argument("--history", type=int, default=1024, help="blocks of logs kept for eth_getLogs")
+    parser.add_argument("--max-logs", type=int, default=10_000, help="eth_getLogs result limit")
+    parser.add_argument("--max-backlog", type=int, default=100_000, help="disconnect subscribers this many messages behind")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    address = POOL_MANAGER_ADDRESS if args.protocol == "uniswap_v4" else POOL_ADDRESS
+    pool = SyntheticPool(args.ticks, args.tick_spacing, args.seed, protocol=args.protocol, address=address, pool_id=POOL_ID)
+    node = FakeNode(
+        pool,
+        state_blocks=args.state_blocks,
+        history_blocks=args.history,
+        max_logs=args.max_logs,
+        logs_per_block=max(1, round(args.rate * args.block_time)),
+        latency=args.latency,
+        jitter=args.jitter,
+    )
+    for key, value in _environment(node, args.host, args.http_port, args.ws_port).items():
+        print(f"export {key}={value}", file=sys.stderr)
+    try:
+        asyncio.run(
+            run(
+                node,
+                args.host,
+                args.http_port,
+                args.ws_port,
+                args.block_time,
+                args.reorg_every,
+                args.disconnect_every,
+                max_backlog=args.max_backlog,
+            )
+        )
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,341 @@
+"""Synthetic pools for benchmarks and the fake node: positions, ticks, bitmap and event streams.
+
+The model keeps liquidityGross / liquidityNet per tick like the pool contract,
+answers the view calls the adapters make (slot0, tickSpacing, tickBitmap, ticks,
+TickLens getPopulatedTicksInWord, PoolManager extsload), and emits Mint / Burn /
+Swap logs laid out exactly as on-chain for Uniswap V3, PancakeSwap V3 or
+Uniswap V4, updating its own state as it goes.
+"""
+
+import math
+import random
+from typing import Any, Callable, Dict, Iterator, List, Sequence
+
+from eth_abi import encode
+from eth_utils import keccak
+from web3 import Web3
+from web3.providers.base import BaseProvider
+
+from app.decoding import (
+    PANCAKE_SWAP_TOPIC,
+    V3_BURN_TOPIC,
+    V3_MINT_TOPIC,
+    V3_SWAP_TOPIC,
+    V4_MODIFY_LIQUIDITY_TOPIC,
+    V4_SWAP_TOPIC,
+)
+from app.multicall import MulticallClient
+from app.protocols.bitmap import MAX_TICK, MIN_TICK
+from app.protocols.uniswap_v4 import POOLS_SLOT, TICK_BITMAP_OFFSET, TICKS_OFFSET, _mapping_slot
+
+POOL_ADDRESS = "0x" + "22" * 20
+POOL_ID = "0x" + "bb" * 32
+MULTICALL_ADDRESS = "0xcA11bde05977b3631167028862bE2a173976CA11"
+_OWNER = "0x" + "11" * 20
+
+
+def _topic(value: int) -> str:
+    return "0x" + (value % (1 << 256)).to_bytes(32, "big").hex()
+
+
+def _address_topic(address: str) -> str:
+    return "0x" + "00" * 12 + address[2:].lower()
+
+
+def _words(*values: int) -> bytes:
+    """Log data made of static 32-byte words (two's complement), without going through eth_abi."""
+    return b"".join((value % (1 << 256)).to_bytes(32, "big") for value in values)
+
+
+class PoolView:
+    """Read-only pool state that answers view calls; SyntheticPool.freeze() pins one per block."""
+
+    def __init__(self, tick_spacing: int, tick: int, gross: Dict[int, int], net: Dict[int, int], pool_id: str = POOL_ID):
+        self.tick_spacing = tick_spacing
+        self.tick = tick
+        self.gross = gross
+        self.net = net
+        self.pool_id = pool_id
+        self._words: Dict[int, int] | None = None
+        self._storage: Dict[bytes, int] | None = None
+
+    @property
+    def sqrt_price_x96(self) -> int:
+        return int(math.sqrt(1.0001**self.tick) * (1 << 96))
+
+    def bitmap_words(self) -> Dict[int, int]:
+        """Non-empty tickBitmap words (word position -> bitmap)."""
+        if self._words is None:
+            words: Dict[int, int] = {}
+            for tick in self.gross:
+                compressed = tick // self.tick_spacing
+                words[compressed >> 8] = words.get(compressed >> 8, 0) | (1 << (compressed & 0xFF))
+            self._words = words
+        return self._words
+
+    def populated_ticks_in_word(self, word: int) -> List[tuple[int, int, int]]:
+        """TickLens rows (tick, liquidityNet, liquidityGross), descending by tick like the contract."""
+        bitmap = self.bitmap_words().get(word, 0)
+        ticks = [(word * 256 + bit) * self.tick_spacing for bit in range(255, -1, -1) if bitmap >> bit & 1]
+        return [(tick, self.net[tick], self.gross[tick]) for tick in ticks]
+
+    def _state_slot(self) -> int:
+        pool_id = bytes.fromhex(self.pool_id[2:])
+        return int.from_bytes(keccak(pool_id + POOLS_SLOT.to_bytes(32, "big")), "big")
+
+    def storage(self, slot: bytes) -> int:
+        """PoolManager storage word at ``slot`` for this pool (StateLibrary layout), 0 elsewhere."""
+        if self._storage is None:
+            state_slot = self._state_slot()
+            storage = {state_slot.to_bytes(32, "big"): self.sqrt_price_x96 | (self.tick % (1 << 24)) << 160}
+            for word, bitmap in self.bitmap_words().items():
+                storage[_mapping_slot(word, state_slot + TICK_BITMAP_OFFSET)] = bitmap
+            for tick, gross in self.gross.items():
+                storage[_mapping_slot(tick, state_slot + TICKS_OFFSET)] = gross | (self.net[tick] % (1 << 128)) << 128
+            self._storage = storage
+        return self._storage.get(bytes(slot), 0)
+
+    def call(self, fn_name: str, args: Sequence[Any]) -> tuple:
+        """Decoded outputs of a view call, as the contract would return them."""
+        if fn_name == "slot0":
+            return (self.sqrt_price_x96, self.tick, 0, 1, 1, 0, True)
+        if fn_name == "tickSpacing":
+            return (self.tick_spacing,)
+        if fn_name == "tickBitmap":
+            return (self.bitmap_words().get(args[0], 0),)
+        if fn_name == "ticks":
+            gross = self.gross.get(args[0], 0)
+            return (gross, self.net.get(args[0], 0), 0, 0, 0, 0, 0, gross > 0)
+        if fn_name == "getPopulatedTicksInWord":
+            return (self.populated_ticks_in_word(args[1]),)
+        if fn_name == "extsload":
+            return (self.storage(args[0]).to_bytes(32, "big"),)
+        raise ValueError(f"Synthetic pool does not implement {fn_name}")
+
+
+class SyntheticPool(PoolView):
+    """A pool with ``tick_count`` initialized ticks around tick 0, built from random positions.
+
+    ``protocol`` (uniswap_v3, pancake_v3, uniswap_v4) selects the log layout;
+    for V4, ``address`` is the PoolManager and logs carry ``pool_id``.
+    """
+
+    def __init__(
+        self,
+        tick_count: int,
+        tick_spacing: int = 10,
+        seed: int = 7,
+        start_block: int = 1_000,
+        protocol: str = "uniswap_v3",
+        address: str = POOL_ADDRESS,
+        pool_id: str = POOL_ID,
+    ):
+        super().__init__(tick_spacing, 0, {}, {}, pool_id)
+        self.rng = random.Random(seed)
+        self.protocol = protocol
+        self.address = address
+        self.block_number = start_block
+        self.fork = 0  # bumped on every reorg so the replacement block gets a new hash
+        self.block_timestamp = 0  # set by the fake node; logs carry blockTimestamp only when non-zero
+        self.positions: List[tuple[int, int, int]] = []
+        self.revision = 0  # bumped on every state change
+        self.block_logs: List[dict] = []
+        self._undo: List[Callable[[], None]] = []
+        slots = range(MIN_TICK // tick_spacing + 1, MAX_TICK // tick_spacing)
+        if tick_count > len(slots):
+            raise ValueError(f"{tick_count} ticks do not fit tick spacing {tick_spacing}")
+        # 两两配对成头寸：每个头寸初始化两个不同的 tick
+        ticks = sorted(tick * tick_spacing for tick in self.rng.sample(slots, tick_count - tick_count % 2))
+        self.rng.shuffle(ticks)
+        for lower, upper in zip(ticks[::2], ticks[1::2]):
+            self._add_position((min(lower, upper), max(lower, upper), self.rng.randrange(1 << 60, 1 << 90)))
+
+    @property
+    def block_hash(self) -> str:
+        return "0x" + (self.block_number << 32 | self.fork).to_bytes(32, "big").hex()
+
+    def _changed(self) -> None:
+        self.revision += 1
+        self._words = None
+        self._storage = None
+
+    def _modify(self, lower: int, upper: int, delta: int) -> None:
+        self._changed()
+        for tick, net_delta in ((lower, delta), (upper, -delta)):
+            gross = self.gross.get(tick, 0) + delta
+            if gross:
+                self.gross[tick] = gross
+                self.net[tick] = self.net.get(tick, 0) + net_delta
+            else:
+                self.gross.pop(tick, None)
+                self.net.pop(tick, None)
+
+    def _add_position(self, position: tuple[int, int, int]) -> None:
+        self.positions.append(position)
+        self._modify(*position)
+
+    def _remove_position(self, position: tuple[int, int, int]) -> None:
+        # 与末尾交换后弹出；撤销 mint 时要删的头寸通常就在末尾
+        index = len(self.positions) - 1 if self.positions[-1] == position else self.positions.index(position)
+        self.positions[index] = self.positions[-1]
+        self.positions.pop()
+        lower, upper, amount = position
+        self._modify(lower, upper, -amount)
+
+    def freeze(self) -> PoolView:
+        """Copy of the current state, for answering calls pinned to this block."""
+        return PoolView(self.tick_spacing, self.tick, dict(self.gross), dict(self.net), self.pool_id)
+
+    def _log(self, topics: List[str], data: bytes, log_index: int) -> dict:
+        raw_log = {
+            "address": self.address,
+            "topics": topics,
+            "data": "0x" + data.hex(),
+            "blockNumber": hex(self.block_number),
+            "blockHash": self.block_hash,
+            "logIndex": hex(log_index),
+            "transactionHash": _topic(self.rng.getrandbits(256)),
+            "removed": False,
+        }
+        if self.block_timestamp:
+            raw_log["blockTimestamp"] = hex(self.block_timestamp)
+        self.block_logs.append(raw_log)
+        return raw_log
+
+    def _liquidity_log(self, lower: int, upper: int, delta: int, log_index: int) -> dict:
+        if self.protocol == "uniswap_v4":
+            data = _words(lower, upper, delta, 0)
+            return self._log([V4_MODIFY_LIQUIDITY_TOPIC, self.pool_id, _address_topic(_OWNER)], data, log_index)
+        if delta > 0:
+            data = _words(int(_OWNER, 16), delta, 1, 1)
+            topic0 = V3_MINT_TOPIC
+        else:
+            data = _words(-delta, 1, 1)
+            topic0 = V3_BURN_TOPIC
+        return self._log([topic0, _address_topic(_OWNER), _topic(lower), _topic(upper)], data, log_index)
+
+    def mint_log(self, log_index: int) -> dict:
+        # 新头寸集中在当前价格附近
+        width = self.rng.randrange(1, 200) * self.tick_spacing
+        center = (self.tick + int(self.rng.gauss(0, 2_000))) // self.tick_spacing * self.tick_spacing
+        lower = max(center - width, MIN_TICK // self.tick_spacing * self.tick_spacing + self.tick_spacing)
+        upper = min(center + width, MAX_TICK // self.tick_spacing * self.tick_spacing)
+        amount = self.rng.randrange(1 << 50, 1 << 80)
+        self._add_position((lower, upper, amount))
+        self._undo.append(lambda: self._remove_position((lower, upper, amount)))
+        return self._liquidity_log(lower, upper, amount, log_index)
+
+    def burn_log(self, log_index: int) -> dict:
+        index = self.rng.randrange(len(self.positions))
+        lower, upper, amount = position = self.positions[index]
+        # 先换到末尾，删除时不用线性查找
+        self.positions[index], self.positions[-1] = self.positions[-1], position
+        self._remove_position(position)
+        self._undo.append(lambda: self._add_position(position))
+        return self._liquidity_log(lower, upper, -amount, log_index)
+
+    def swap_log(self, log_index: int) -> dict:
+        # 价格随机游走
+        previous = self.tick
+        self.tick = max(MIN_TICK + 1, min(MAX_TICK - 1, self.tick + int(self.rng.gauss(0, 20))))
+        self._changed()
+        self._undo.append(lambda: self._set_tick(previous))
+        amounts = [10**18, -(10**18), self.sqrt_price_x96, 1 << 80, self.tick]
+        if self.protocol == "uniswap_v4":
+            data = _words(*amounts, 500)
+            return self._log([V4_SWAP_TOPIC, self.pool_id, _address_topic(_OWNER)], data, log_index)
+        if self.protocol == "pancake_v3":
+            data = _words(*amounts, 0, 0)
+            topic0 = PANCAKE_SWAP_TOPIC
+        else:
+            data = _words(*amounts)
+            topic0 = V3_SWAP_TOPIC
+        return self._log([topic0, _address_topic(_OWNER), _address_topic(_OWNER)], data, log_index)
+
+    def _set_tick(self, tick: int) -> None:
+        self.tick = tick
+        self._changed()
+
+    def random_log(self, log_index: int, mix: tuple[float, float] = (0.3, 0.2)) -> dict:
+        """A Mint / Burn with probabilities ``mix``, otherwise a Swap."""
+        mint_share, burn_share = mix
+        roll = self.rng.random()
+        if roll < mint_share or not self.positions:
+            return self.mint_log(log_index)
+        if roll < mint_share + burn_share:
+            return self.burn_log(log_index)
+        return self.swap_log(log_index)
+
+    def new_block(self) -> None:
+        self.block_number += 1
+        self.block_logs = []
+        self._undo.clear()
+
+    def reorg_block(self) -> List[dict]:
+        """Undo the current block and give it a new hash; returns its logs marked ``removed``."""
+        for undo in reversed(self._undo):
+            undo()
+        self._undo.clear()
+        removed = [{**raw_log, "removed": True} for raw_log in self.block_logs]
+        self.block_logs = []
+        self.fork += 1
+        return removed
+
+    def events(self, count: int, logs_per_block: int = 20, mix: tuple[float, float] = (0.3, 0.2)) -> Iterator[dict]:
+        """``count`` raw logs; blocks advance every ``logs_per_block``."""
+        for i in range(count):
+            log_index = i % logs_per_block
+            if log_index == 0:
+                self.new_block()
+            yield self.random_log(log_index, mix)
+
+
+class StaticBlockProvider(BaseProvider):
+    """Answers eth_blockNumber / eth_chainId only, so adapters can pin a block without a node."""
+
+    def __init__(self, block_number: int):
+        super().__init__()
+        self.block_number = block_number
+
+    def make_request(self, method, params):
+        if method == "eth_blockNumber":
+            return {"jsonrpc": "2.0", "id": 1, "result": hex(self.block_number)}
+        if method == "eth_chainId":
+            return {"jsonrpc": "2.0", "id": 1, "result": "0x1"}
+        raise NotImplementedError(f"StaticBlockProvider does not serve {method}")
+
+    def is_connected(self, show_traceback: bool = False) -> bool:
+        return True
+
+
+class SyntheticMulticall(MulticallClient):
+    """MulticallClient that answers aggregate3 from a SyntheticPool instead of a node.
+
+    Return data is ABI-encoded per call and cached until the pool changes, so
+    ``call_functions`` still does the real output decoding, and round trips are
+    counted as usual.
+    """
+
+    def __init__(self, web3: Web3, pool: SyntheticPool, max_in_flight: int = 1):
+        super().__init__(web3, MULTICALL_ADDRESS, max_in_flight=max_in_flight)
+        self.pool = pool
+        self._encoded: Dict[tuple, bytes] = {}
+        self._revision = pool.revision
+
+    def _answer(self, fn) -> bytes:
+        if self._revision != self.pool.revision:
+            self._encoded.clear()
+            self._revision = self.pool.revision
+        key = (fn.fn_name, tuple(fn.args))
+        raw = self._encoded.get(key)
+        if raw is None:
+            output_types = [output["type"] for output in fn.abi["outputs"]]
+            raw = self._encoded[key] = encode(output_types, list(self.pool.call(fn.fn_name, fn.args)))
+        return raw
+
+    def aggregate3(self, functions, block_identifier=None) -> List[tuple[bool, bytes]]:
+        if not functions:
+            return []
+        with self._counter_lock:
+            self.round_trips += 1
+        return [(True, self._answer(fn)) for fn in functions]
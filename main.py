@@ -1,14 +1,16 @@
+import asyncio
 import logging
 import queue
 import threading
+import time
 
-from web3 import Web3
+from web3 import AsyncHTTPProvider, AsyncWeb3, Web3
 
 from app.abi_loader import load_all_abis
 from app.config import DEFAULT_CONFIG
-from app.multicall import MulticallClient
-from app.state_machine import LiquidityStateMachine
-from app.ui import start_ui
+from app.metrics import QUEUE_DEPTH, logs_applied, start_metrics
+from app.multicall import MulticallClient, make_http_provider
+from app.registry import PoolRegistry
 
 def setup_logging():
     logging.basicConfig(
@@ -24,12 +26,43 @@ def setup_logging():
     logging.getLogger("urllib3").setLevel(logging.WARNING)
 
 
-def start_event_loop(state: LiquidityStateMachine, sink: queue.Queue) -> None:
+# 每批最多应用的日志数
+APPLY_BATCH_LIMIT = 1024
+
+
+def start_event_loop(registry: PoolRegistry, sink: queue.Queue, changed: threading.Event) -> None:
+    # 启动时已订阅 (所有池子共用一个订阅，按地址 / poolId 分发)，快照期间的日志已在 spool 中
+    spool = registry.spool
+    QUEUE_DEPTH.labels(queue="ingest").set_function(spool.__len__)
+    QUEUE_DEPTH.labels(queue="display").set_function(sink.qsize)
+
+    def _apply() -> None:
+        while True:
+            # 阻塞等待第一条日志，然后取走已到达的全部日志，每个网络帧 / 区块只加一次锁
+            batch = [spool.get()]
+            while len(batch) < APPLY_BATCH_LIMIT:
+                item = spool.get_nowait()
+                if item is None:
+                    break
+                batch.append(item)
+            started = time.time()
+            received, raw_logs = zip(*batch)
+            applied = registry.process_batch(raw_logs)
+            logs_applied(received, started)
+            for item in applied:
+                sink.put(item)
+            # 唤醒 UI 重绘
+            changed.set()
+
+    threading.Thread(target=_apply, daemon=True).start()
+
+
+def start_snapshot_saver(registry: PoolRegistry, interval: float) -> None:
     def _loop() -> None:
-        # 在独立线程中处理 WebSocket 事件流
-        for event in state.adapter.stream_events():
-            state.apply_event(event)
-            sink.put(event)
+        # 定期落盘，崩溃或重新部署后可以从缓存热启动
+        while True:
+            time.sleep(interval)
+            registry.save_snapshots()
 
     thread = threading.Thread(target=_loop, daemon=True)
     thread.start()
@@ -38,11 +71,15 @@ def start_event_loop(state: LiquidityStateMachine, sink: queue.Queue) -> None:
 def main() -> None:
     setup_logging()
     config = DEFAULT_CONFIG
+    start_metrics(config.metrics)
+    if not config.pools:
+        raise ValueError("POOL_ADDRESS (or a pools list in config.json) must be provided via environment variables or config.json")
     
-    logging.info(f"Starting Auditor for {config.pool.protocol} on {config.chain.name}")
+    logging.info(f"Starting Auditor for {len(config.pools)} pool(s) on {config.chain.name}")
 
     # 1. 初始化 Web3 连接
-    provider = Web3(Web3.HTTPProvider(config.chain.rpc_url))
+    # 连接池大小与并发批次数一致，避免请求排队等待空闲连接
+    provider = Web3(make_http_provider(config.chain.rpc_url, config.chain.rpc_max_in_flight))
     if not provider.is_connected():
         raise ConnectionError("Failed to connect to RPC")
 
@@ -52,17 +89,64 @@ def main() -> None:
         
     # 直接使用 abi_loader 模块，无需本地重复定义
     abis = load_all_abis(config)
-    abis["multicall"] = MulticallClient(provider, config.chain.multicall_address)
+    abis["multicall"] = MulticallClient(
+        provider,
+        config.chain.multicall_address,
+        max_in_flight=config.chain.rpc_max_in_flight,
+        target_latency=config.chain.rpc_target_latency,
+        use_aggregate3=config.chain.multicall_aggregate3,
+    )
 
-    # 3. 初始化核心状态机 (自动拉取 Snapshot)
-    logging.info("Initializing State Machine...")
-    state = LiquidityStateMachine(provider, config, abis)
-    logging.info("Snapshot fetched successfully.")
+    # 3. 初始化每个池子的状态机 (优先从本地缓存热启动，否则拉取完整 Snapshot)
+    logging.info("Initializing State Machines...")
+    registry = PoolRegistry(provider, config, abis)
+    logging.info("Snapshots ready.")
+    registry.save_snapshots()
 
     # 4. 启动事件循环和 UI
+    if config.output.mode == "headless":
+        # 无 UI：增量深度和流动性事件写到 stdout / Unix socket / 文件，供下游系统消费 (不加载 rich)
+        from app.headless import start_headless
+
+        event_queue: queue.Queue = queue.Queue()
+        changed = threading.Event()
+        start_event_loop(registry, event_queue, changed)
+        start_snapshot_saver(registry, config.snapshot.save_interval)
+        try:
+            start_headless(registry, event_queue, config.output, changed)
+        finally:
+            registry.save_snapshots()
+            registry.close()
+        return
+
+    from app.runtime import AsyncRuntime
+    from app.ui import start_ui
+
+    if config.runtime.mode == "asyncio":
+        # 采集、状态更新和渲染都在同一个事件循环里 (快照阶段仍用同步的并发 multicall)
+        runtime = AsyncRuntime(
+            registry,
+            AsyncWeb3(AsyncHTTPProvider(config.chain.rpc_url)),
+            config.runtime,
+            config.ui,
+            save_interval=config.snapshot.save_interval,
+        )
+        try:
+            asyncio.run(runtime.run())
+        finally:
+            registry.save_snapshots()
+            registry.close()
+        return
+
     event_queue: queue.Queue = queue.Queue()
-    start_event_loop(state, event_queue)
-    start_ui(state, event_queue)
+    changed = threading.Event()
+    start_event_loop(registry, event_queue, changed)
+    start_snapshot_saver(registry, config.snapshot.save_interval)
+    try:
+        start_ui(registry, event_queue, config.ui, changed)
+    finally:
+        registry.save_snapshots()
+        registry.close()
 
 
 if __name__ == "__main__":
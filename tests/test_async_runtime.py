@@ -0,0 +1,154 @@
+import asyncio
+import threading
+import time
+
+from web3 import AsyncHTTPProvider, AsyncWeb3, Web3
+
+from app.abi_loader import load_all_abis
+from app.config import AppConfig, ChainConfig, PoolConfig, SnapshotConfig
+from app.multicall import MulticallClient
+from app.registry import PoolRegistry
+from app.runtime import AsyncRuntime
+from benchmarks.fake_node import POOL_ADDRESS, FakeNode, Subscriptions, serve, start_http
+from benchmarks.synthetic import SyntheticPool
+
+HOST = "127.0.0.1"
+
+
+def _start_loop() -> tuple[asyncio.AbstractEventLoop, threading.Thread]:
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    return loop, thread
+
+
+def _stop_loop(loop: asyncio.AbstractEventLoop, thread: threading.Thread, future) -> None:
+    future.cancel()
+    # 等取消传播完 (服务端关闭连接) 再停循环
+    time.sleep(0.2)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(5)
+
+
+class _Node:
+    """Fake node (HTTP + WebSocket on free ports) served from its own event loop thread."""
+
+    def __init__(self, node: FakeNode):
+        self.node = node
+        self.http = start_http(node, HOST, 0)
+        self.subscriptions = Subscriptions(node)
+        self.loop, self._thread = _start_loop()
+        started = threading.Event()
+
+        async def _serve() -> None:
+            async with serve(self.subscriptions.handler, HOST, 0, max_queue=None) as server:
+                self.ws_port = server.sockets[0].getsockname()[1]
+                started.set()
+                await asyncio.Future()
+
+        self._server = asyncio.run_coroutine_threadsafe(_serve(), self.loop)
+        assert started.wait(5)
+
+    def call(self, function, *args):
+        async def _call():
+            return function(*args)
+
+        return asyncio.run_coroutine_threadsafe(_call(), self.loop).result()
+
+    def mine(self, reorg: bool = False) -> None:
+        self.call(lambda: self.subscriptions.push(self.node.produce_block(reorg=reorg)))
+
+    def silent_reorg(self) -> None:
+        # 断线期间用没有池子日志的区块替换链头，节点不会推送 removed 日志
+        def _replace():
+            self.subscriptions.drop_all()
+            with self.node.lock:
+                self.node.pool.reorg_block()
+                self.node._seal()
+
+        self.call(_replace)
+
+    def config(self) -> AppConfig:
+        pool = PoolConfig(
+            pool_address=POOL_ADDRESS,
+            protocol=self.node.pool.protocol,
+            token0="USDT",
+            token1="TOKEN",
+            fee=500,
+            token0_decimals=18,
+            token1_decimals=18,
+            tick_spacing=self.node.pool.tick_spacing,
+        )
+        chain = ChainConfig(
+            name="fake",
+            rpc_url=f"http://{HOST}:{self.http.server_address[1]}",
+            wss_url=f"ws://{HOST}:{self.ws_port}",
+            explorer="",
+            multicall_address=self.node.multicall_address,
+        )
+        return AppConfig(chain=chain, pool=pool, pools=[pool], snapshot=SnapshotConfig(cache_dir=None))
+
+    def close(self) -> None:
+        self.http.shutdown()
+        _stop_loop(self.loop, self._thread, self._server)
+
+
+def test_asyncio_runtime_follows_chain_through_reorgs_and_disconnects():
+    fake = _Node(FakeNode(SyntheticPool(2000, 10, 7, address=POOL_ADDRESS), logs_per_block=20))
+    try:
+        config = fake.config()
+        w3 = Web3(Web3.HTTPProvider(config.chain.rpc_url))
+        abis = load_all_abis(config)
+        abis["multicall"] = MulticallClient(w3, config.chain.multicall_address)
+        registry = PoolRegistry(w3, config, abis)
+        runtime = AsyncRuntime(registry, AsyncWeb3(AsyncHTTPProvider(config.chain.rpc_url)), config.runtime, config.ui)
+        process_batch = registry.process_batch
+        get_block = w3.eth.get_block
+
+        def slow_process_batch(raw_logs):
+            # 放慢应用：重连时队列里还积压着旧连接的日志 (含刚发生的重组)
+            raw_logs = list(raw_logs)
+            time.sleep(0.002 * len(raw_logs))
+            return process_batch(raw_logs)
+
+        def slow_get_block(*args, **kwargs):
+            # 放慢主链核对：核对进行期间应用侧若仍在消费队列，就会与回滚交错
+            time.sleep(0.02)
+            return get_block(*args, **kwargs)
+
+        registry.process_batch = slow_process_batch
+        w3.eth.get_block = slow_get_block
+        loop, thread = _start_loop()
+
+        async def _run() -> None:
+            await asyncio.gather(runtime._ingest(), runtime._apply())
+
+        running = asyncio.run_coroutine_threadsafe(_run(), loop)
+
+        for _ in range(6):
+            # 链头重组后紧接着出块，随即断线：removed 日志、替换区块和后续区块都还在队列里
+            for i in range(8):
+                fake.mine(reorg=i == 3)
+            fake.call(fake.subscriptions.drop_all)
+            time.sleep(1.0)
+        fake.silent_reorg()
+        time.sleep(1.0)
+        for _ in range(3):
+            fake.mine()
+            time.sleep(0.05)
+
+        (machine,) = registry.machines.values()
+        pool = fake.node.pool
+        deadline = time.time() + 15
+        while True:
+            with machine.lock:
+                ticks = {tick: (entry.liquidity, entry.liquidity_net) for tick, entry in machine.profile.ticks.items()}
+            expected = {tick: (gross, pool.net[tick]) for tick, gross in pool.gross.items()}
+            if ticks == expected or time.time() > deadline:
+                break
+            time.sleep(0.2)
+        _stop_loop(loop, thread, running)
+        registry.close()
+        assert ticks == expected
+    finally:
+        fake.close()
@@ -0,0 +1,156 @@
+from pathlib import Path
+
+import pytest
+from eth_abi import encode
+from hexbytes import HexBytes
+from web3 import Web3
+
+import app.decoding
+from app.abi_loader import _load_single_abi
+from app.decoding import (
+    PANCAKE_SWAP_TOPIC,
+    V3_BURN_TOPIC,
+    V3_MINT_TOPIC,
+    V3_SWAP_TOPIC,
+    V4_MODIFY_LIQUIDITY_TOPIC,
+    V4_SWAP_TOPIC,
+    decode_swap,
+    decode_v3_burn,
+    decode_v3_mint,
+    decode_v4_modify_liquidity,
+    log_data,
+    topic_int24,
+)
+
+ABI_DIR = Path(app.decoding.__file__).with_name("abis")
+OWNER = "0x" + "22" * 20
+POOL_ID = b"\x33" * 32
+MAX_UINT128 = 2**128 - 1
+# 负 tick、跨越 0 的区间和全区间端点
+TICK_RANGES = [(-887272, 887272), (-887220, -887160), (-60, -1), (-1, 0), (0, 60), (-200, 100)]
+
+_w3 = Web3()
+
+
+def _event(abi_name: str, name: str):
+    return _w3.eth.contract(abi=_load_single_abi(ABI_DIR, abi_name)).events[name]()
+
+
+def _raw_log(event, **args) -> dict:
+    """ABI-encode ``args`` into a JSON-RPC style log (hex strings) for ``event``."""
+    inputs = event.abi["inputs"]
+    signature = f"{event.abi['name']}({','.join(item['type'] for item in inputs)})"
+    topics = [Web3.keccak(text=signature)]
+    topics += [encode([item["type"]], [args[item["name"]]]) for item in inputs if item["indexed"]]
+    plain = [item for item in inputs if not item["indexed"]]
+    return {
+        "address": "0x" + "11" * 20,
+        "topics": [Web3.to_hex(topic) for topic in topics],
+        "data": Web3.to_hex(encode([item["type"] for item in plain], [args[item["name"]] for item in plain])),
+        "blockNumber": "0x10",
+        "blockHash": "0x" + "44" * 32,
+        "transactionHash": "0x" + "55" * 32,
+        "transactionIndex": "0x0",
+        "logIndex": "0x3",
+        "removed": False,
+    }
+
+
+def _web3_args(event, raw_log: dict) -> dict:
+    """Reference decoding of ``raw_log`` through web3's contract event ABI."""
+    log = dict(
+        raw_log,
+        topics=[HexBytes(topic) for topic in raw_log["topics"]],
+        data=HexBytes(raw_log["data"]),
+        blockNumber=int(raw_log["blockNumber"], 16),
+        blockHash=HexBytes(raw_log["blockHash"]),
+        transactionHash=HexBytes(raw_log["transactionHash"]),
+        transactionIndex=int(raw_log["transactionIndex"], 16),
+        logIndex=int(raw_log["logIndex"], 16),
+    )
+    return event.process_log(log)["args"]
+
+
+@pytest.mark.parametrize(
+    "abi_name, name, topic",
+    [
+        ("uniswap_v3_pool", "Mint", V3_MINT_TOPIC),
+        ("uniswap_v3_pool", "Burn", V3_BURN_TOPIC),
+        ("uniswap_v3_pool", "Swap", V3_SWAP_TOPIC),
+        ("pancake_pool", "Mint", V3_MINT_TOPIC),
+        ("pancake_pool", "Burn", V3_BURN_TOPIC),
+        ("pancake_pool", "Swap", PANCAKE_SWAP_TOPIC),
+        ("uniswap_v4_pool_manager", "ModifyLiquidity", V4_MODIFY_LIQUIDITY_TOPIC),
+        ("uniswap_v4_pool_manager", "Swap", V4_SWAP_TOPIC),
+    ],
+)
+def test_topics_match_abi_signatures(abi_name, name, topic):
+    event = _event(abi_name, name)
+    signature = f"{event.abi['name']}({','.join(item['type'] for item in event.abi['inputs'])})"
+    assert topic == Web3.to_hex(Web3.keccak(text=signature))
+
+
+@pytest.mark.parametrize("lower, upper", TICK_RANGES)
+@pytest.mark.parametrize("amount", [1, 10**18, MAX_UINT128])
+def test_v3_mint_and_burn_match_web3(lower, upper, amount):
+    mint = _event("uniswap_v3_pool", "Mint")
+    raw_log = _raw_log(
+        mint, sender=OWNER, owner=OWNER, tickLower=lower, tickUpper=upper, amount=amount, amount0=7, amount1=2**255
+    )
+    args = _web3_args(mint, raw_log)
+    expected = (args["tickLower"], args["tickUpper"], args["amount"])
+    assert decode_v3_mint(raw_log["topics"], log_data(raw_log)) == expected == (lower, upper, amount)
+
+    burn = _event("uniswap_v3_pool", "Burn")
+    raw_log = _raw_log(
+        burn, owner=OWNER, tickLower=lower, tickUpper=upper, amount=amount, amount0=2**256 - 1, amount1=0
+    )
+    args = _web3_args(burn, raw_log)
+    expected = (args["tickLower"], args["tickUpper"], -args["amount"])
+    assert decode_v3_burn(raw_log["topics"], log_data(raw_log)) == expected == (lower, upper, -amount)
+
+
+@pytest.mark.parametrize("lower, upper", TICK_RANGES)
+@pytest.mark.parametrize("delta", [1, -1, 10**18, -(10**18), 2**127 - 1, -(2**127)])
+def test_v4_modify_liquidity_matches_web3(lower, upper, delta):
+    event = _event("uniswap_v4_pool_manager", "ModifyLiquidity")
+    raw_log = _raw_log(
+        event, id=POOL_ID, sender=OWNER, tickLower=lower, tickUpper=upper, liquidityDelta=delta, salt=b"\xff" * 32
+    )
+    args = _web3_args(event, raw_log)
+    decoded = decode_v4_modify_liquidity(raw_log["topics"], log_data(raw_log))
+    assert decoded == (args["tickLower"], args["tickUpper"], args["liquidityDelta"]) == (lower, upper, delta)
+
+
+@pytest.mark.parametrize("tick", [-887272, -887271, -1, 0, 1, 887271])
+def test_swap_layouts_match_web3(tick):
+    sqrt_price = 2**160 - 1 if tick > 0 else 4295128739
+    common = dict(sqrtPriceX96=sqrt_price, liquidity=MAX_UINT128 - tick % 7, tick=tick)
+    cases = [
+        (_event("uniswap_v3_pool", "Swap"), dict(sender=OWNER, recipient=OWNER, amount0=-(2**255), amount1=2**255 - 1)),
+        (
+            _event("pancake_pool", "Swap"),
+            dict(
+                sender=OWNER,
+                recipient=OWNER,
+                amount0=-5,
+                amount1=5,
+                protocolFeesToken0=MAX_UINT128,
+                protocolFeesToken1=1,
+            ),
+        ),
+        (
+            _event("uniswap_v4_pool_manager", "Swap"),
+            dict(id=POOL_ID, sender=OWNER, amount0=-(2**127), amount1=2**127 - 1, fee=2**24 - 1),
+        ),
+    ]
+    for event, extra in cases:
+        raw_log = _raw_log(event, **common, **extra)
+        args = _web3_args(event, raw_log)
+        assert decode_swap(log_data(raw_log)) == (args["sqrtPriceX96"], args["liquidity"], args["tick"])
+
+
+@pytest.mark.parametrize("tick", [-887272, -8388608, -1, 0, 1, 8388607])
+def test_topic_int24_accepts_hex_and_bytes(tick):
+    topic = encode(["int24"], [tick])
+    assert topic_int24(Web3.to_hex(topic)) == topic_int24(topic) == topic_int24(HexBytes(topic)) == tick
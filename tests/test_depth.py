@@ -0,0 +1,131 @@
+import math
+import random
+
+import numpy as np
+import pytest
+
+from app.config import AppConfig, ChainConfig, PoolConfig, SnapshotConfig
+from app.depth import DepthEngine
+from app.state_machine import LiquidityStateMachine
+from app.tick_store import TickStore
+from app.types import AdaptiveScale, LiquidityDeltaEvent, PriceState, Snapshot, SwapEvent
+
+SPACING = 10
+
+
+def _brute_force(engine: DepthEngine, segments, sqrt_price: float | None, edges: np.ndarray) -> dict[int, float]:
+    """Per-tick reference: quote amount of every [tick, tick + spacing) slice, bucketed by the edges below it."""
+    depths: dict[int, float] = {}
+    edges = edges.tolist()
+    for lower, upper, liquidity in segments:
+        for tick in range(lower, upper, SPACING):
+            sqrt_lower = math.pow(1.0001, tick / 2)
+            sqrt_upper = math.pow(1.0001, (tick + SPACING) / 2)
+            if engine.quote_is_token0:
+                sqrt_current = sqrt_lower if sqrt_price is None else max(sqrt_lower, sqrt_price)
+                amount = liquidity * max(1 / sqrt_current - 1 / sqrt_upper, 0) / engine.table.token0_unit
+            else:
+                sqrt_current = sqrt_upper if sqrt_price is None else min(sqrt_upper, sqrt_price)
+                amount = liquidity * max(sqrt_current - sqrt_lower, 0) / engine.table.token1_unit
+            position = sum(edge <= tick for edge in edges) - 1
+            bucket = len(edges) - 2 - position if engine.quote_is_token0 else position
+            depths[bucket] = depths.get(bucket, 0.0) + amount
+    return depths
+
+
+def _segments(rng: random.Random, lower: int, upper: int, count: int) -> list[tuple[int, int, int]]:
+    ticks = sorted(rng.sample(range(lower // SPACING, upper // SPACING), count * 2))
+    return [
+        (ticks[2 * i] * SPACING, ticks[2 * i + 1] * SPACING, rng.randrange(1, 10**22)) for i in range(count)
+    ]
+
+
+@pytest.mark.parametrize("quote_is_token0", [True, False])
+@pytest.mark.parametrize("price_tick", [None, -3, 0, 1234])
+def test_bucket_depth_matches_per_tick_loop(quote_is_token0, price_tick):
+    rng = random.Random(7)
+    engine = DepthEngine(SPACING, 18, 18, quote_is_token0)
+    price = engine.price(0)
+    scale = AdaptiveScale(current_price=price, step=price * 0.02, min_price=price * 0.8, max_price=price * 1.2)
+    edges = engine.edge_ticks(scale)
+    sqrt_price = None if price_tick is None else math.pow(1.0001, price_tick / 2)
+    # 分段越过可视区间两端，检查界外部分按位置落到越界 bucket
+    segments = _segments(rng, edges[0] - 500, edges[-1] + 500, 12)
+
+    indices, depths = engine.bucket_depth(segments, sqrt_price, edges)
+    expected = _brute_force(engine, segments, sqrt_price, edges)
+    expected = {bucket: depth for bucket, depth in expected.items() if depth}
+    actual = {bucket: depth for bucket, depth in zip(indices.tolist(), depths.tolist()) if depth}
+    assert actual.keys() == expected.keys()
+    for bucket, depth in expected.items():
+        assert actual[bucket] == pytest.approx(depth, rel=1e-9)
+
+    # 增量路径与整批路径同样切分，只累加界内 bucket
+    buckets = np.zeros(engine.bucket_count(scale))
+    assert engine.add_segment_depth(buckets, segments, sqrt_price, edges)
+    in_range = (indices >= 0) & (indices < len(buckets))
+    reference = np.zeros(len(buckets))
+    reference[indices[in_range]] = depths[in_range]
+    np.testing.assert_allclose(buckets, reference, rtol=1e-9)
+
+
+class _SnapshotAdapter:
+    pool_address = "0x0000000000000000000000000000000000000001"
+
+    def fetch_snapshot(self) -> Snapshot:
+        return Snapshot(TickStore(SPACING), PriceState(None, 0), "uniswap_v3", self.pool_address, 99, SPACING)
+
+
+def _machine() -> LiquidityStateMachine:
+    pool = PoolConfig(
+        pool_address=_SnapshotAdapter.pool_address,
+        protocol="uniswap_v3",
+        token0="USDT",
+        token1="TOKEN",
+        fee=500,
+        token0_decimals=18,
+        token1_decimals=18,
+        tick_spacing=SPACING,
+    )
+    config = AppConfig(
+        chain=ChainConfig(name="test", rpc_url="", wss_url="", explorer=""),
+        pool=pool,
+        pools=[pool],
+        snapshot=SnapshotConfig(cache_dir=None),
+    )
+    return LiquidityStateMachine(None, config, {}, _SnapshotAdapter())
+
+
+def test_incremental_depth_matches_full_rebuild():
+    rng = random.Random(11)
+    machine = _machine()
+    block = 100
+    machine.apply_events([SwapEvent("0xswap", 1 << 96, 0, 0, block, 0, "Swap", hex(block))])
+    lower, upper = machine._depth_range
+    assert lower < upper
+    positions: list[tuple[int, int, int]] = []
+    for _ in range(60):
+        block += 1
+        events = []
+        for log_index in range(rng.randrange(1, 6)):
+            if positions and rng.random() < 0.4:
+                tick_lower, tick_upper, liquidity = positions.pop(rng.randrange(len(positions)))
+                delta, event_type = -liquidity, "Burn"
+            else:
+                # 区间可能部分或完全落在可视范围之外
+                ticks = sorted(rng.sample(range((lower - 2000) // SPACING, (upper + 2000) // SPACING), 2))
+                tick_lower, tick_upper = ticks[0] * SPACING, ticks[1] * SPACING
+                delta, event_type = rng.randrange(1, 10**21), "Mint"
+                positions.append((tick_lower, tick_upper, delta))
+            events.append(
+                LiquidityDeltaEvent(
+                    "0xowner", tick_lower, tick_upper, delta, block, 0, event_type, hex(block), log_index
+                )
+            )
+        machine.apply_events(events)
+        assert not machine._depth_stale
+        incremental = machine._buckets.copy()
+        machine._depth_stale = True
+        machine._publish()
+        # 增量累加与重建之间只有浮点舍入差
+        np.testing.assert_allclose(incremental, machine._buckets, rtol=1e-9, atol=1e-9 * machine._buckets.max())
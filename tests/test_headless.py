@@ -0,0 +1,94 @@
+import json
+
+import pytest
+
+from app.headless import DepthDeltaEncoder, _liquidity_message, encode_json, make_encoder
+from app.types import AdaptiveScale, AggregatedDepth, DepthView, LiquidityDeltaEvent
+
+SCALE = AdaptiveScale(current_price=1.0, step=0.02, min_price=0.8, max_price=1.2)
+
+
+def _view(version: int, rows: dict[str, float], scale: AdaptiveScale = SCALE) -> DepthView:
+    return DepthView(scale, tuple(AggregatedDepth(label, depth) for label, depth in rows.items()), version)
+
+
+# 依次覆盖：首帧全量、新增 / 变化 / 清空 bucket、版本未变、刻度变化后的全量重置
+FRAMES = [
+    _view(1, {"0.98": 10.0, "0.96": 5.5}),
+    _view(2, {"0.98": 10.0, "0.96": 7.25, "0.94": 1e-9}),
+    _view(2, {"0.98": 10.0, "0.96": 7.25, "0.94": 1e-9}),
+    _view(3, {"0.96": 7.25, "0.94": 3.0}),
+    _view(4, {"0.97": 4.0}, AdaptiveScale(current_price=0.99, step=0.01, min_price=0.89, max_price=1.09)),
+]
+
+
+def _apply(books: dict[str, dict[str, float]], message: dict) -> None:
+    """Downstream consumer: rebuild each pool's rows from depth deltas."""
+    book = books.setdefault(message["pool"], {})
+    if message.get("reset"):
+        book.clear()
+    book.update(message["set"])
+    for label in message.get("removed", ()):
+        del book[label]
+
+
+def test_deltas_carry_added_changed_and_removed_buckets():
+    encoder = DepthDeltaEncoder()
+    messages = [encoder.encode("A/B", view) for view in FRAMES]
+
+    assert messages[0]["reset"] and messages[0]["set"] == {"0.98": 10.0, "0.96": 5.5}
+    assert messages[1]["set"] == {"0.96": 7.25, "0.94": 1e-9}
+    assert "reset" not in messages[1] and "removed" not in messages[1]
+    assert messages[2] is None
+    assert messages[3]["set"] == {"0.94": 3.0}
+    assert messages[3]["removed"] == ["0.98"]
+    assert messages[4]["reset"] and messages[4]["set"] == {"0.97": 4.0} and messages[4]["step"] == 0.01
+
+    encoder.reset()
+    assert encoder.encode("A/B", FRAMES[-1])["reset"]
+
+
+def _round_trip(encode, decode_stream) -> None:
+    encoder = DepthDeltaEncoder()
+    stream = b""
+    expected: dict[str, dict[str, float]] = {}
+    for i, view in enumerate(FRAMES):
+        # 第二个池子落后一帧，两个池子的消息在流中交错
+        for pool, pool_view in (("A/B", view), ("C/D", FRAMES[max(i - 1, 0)])):
+            message = encoder.encode(pool, pool_view)
+            if message is not None:
+                stream += encode(message)
+            expected[pool] = {row.bucket_label: row.usdt_depth for row in pool_view.rows}
+
+    books: dict[str, dict[str, float]] = {}
+    for message in decode_stream(stream):
+        _apply(books, message)
+    assert books == expected
+
+
+def test_ndjson_round_trip():
+    def decode_stream(stream: bytes):
+        assert stream.endswith(b"\n")
+        return [json.loads(line) for line in stream.splitlines()]
+
+    assert make_encoder("json") is encode_json
+    _round_trip(encode_json, decode_stream)
+
+
+def test_msgpack_round_trip():
+    msgpack = pytest.importorskip("msgpack")
+
+    def decode_stream(stream: bytes):
+        unpacker = msgpack.Unpacker(raw=False)
+        unpacker.feed(stream)
+        return list(unpacker)
+
+    _round_trip(make_encoder("msgpack"), decode_stream)
+
+
+def test_liquidity_message_keeps_int128_exact():
+    event = LiquidityDeltaEvent("0xtx", -887272, 887272, -(2**127), 7, 0, "Burn", "0xblock", 3)
+    message = json.loads(encode_json(_liquidity_message("A/B", event)))
+
+    assert int(message["liquidity_delta"]) == -(2**127)
+    assert (message["lower_tick"], message["upper_tick"], message["log_index"]) == (-887272, 887272, 3)
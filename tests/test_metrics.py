@@ -0,0 +1,89 @@
+import pytest
+
+from app.metrics import Counter, Gauge, Histogram, MetricsRegistry, TimedLock, _Metric
+
+
+def test_metric_base_is_abstract():
+    with pytest.raises(TypeError):
+        _Metric("base", "Abstract.", registry=MetricsRegistry())
+
+    class Incomplete(_Metric):
+        kind = "untyped"
+
+    with pytest.raises(TypeError):
+        Incomplete("incomplete", "Missing _new_child.", registry=MetricsRegistry())
+
+
+def test_labelled_metrics_text_format():
+    registry = MetricsRegistry()
+    errors = Counter("rpc_errors_total", "Calls that raised.", ["method"], registry=registry)
+    depth = Gauge("queue_depth", "Queued items.", ["queue"], registry=registry)
+    latency = Histogram("round_trip_seconds", "Round trips.", ["method"], buckets=(0.1, 1.0), registry=registry)
+
+    errors.labels(method="eth_call").inc()
+    errors.labels(method="eth_call").inc(2)
+    errors.labels(method="eth_getLogs").inc()
+    depth.labels(queue="logs").set(7)
+    depth.labels(queue="display").set_function(lambda: 1.5)
+    depth.labels(queue="broken").set_function(lambda: 1 / 0)
+    for value in (0.05, 0.1, 0.5, 3.0):
+        latency.labels(method="eth_call").observe(value)
+
+    assert registry.expose() == "\n".join(
+        [
+            "# HELP rpc_errors_total Calls that raised.",
+            "# TYPE rpc_errors_total counter",
+            'rpc_errors_total{method="eth_call"} 3',
+            'rpc_errors_total{method="eth_getLogs"} 1',
+            "# HELP queue_depth Queued items.",
+            "# TYPE queue_depth gauge",
+            'queue_depth{queue="logs"} 7',
+            'queue_depth{queue="display"} 1.5',
+            'queue_depth{queue="broken"} NaN',
+            "# HELP round_trip_seconds Round trips.",
+            "# TYPE round_trip_seconds histogram",
+            'round_trip_seconds_bucket{method="eth_call",le="0.1"} 2',
+            'round_trip_seconds_bucket{method="eth_call",le="1"} 3',
+            'round_trip_seconds_bucket{method="eth_call",le="+Inf"} 4',
+            'round_trip_seconds_sum{method="eth_call"} 3.65',
+            'round_trip_seconds_count{method="eth_call"} 4',
+        ]
+    ) + "\n"
+
+
+def test_unlabelled_metrics_exposed_from_start():
+    registry = MetricsRegistry()
+    Counter("logs_total", "Logs.", registry=registry)
+    Histogram("apply_seconds", "Apply.", buckets=(1.0,), registry=registry)
+
+    assert registry.expose().splitlines()[2:] == [
+        "logs_total 0",
+        "# HELP apply_seconds Apply.",
+        "# TYPE apply_seconds histogram",
+        'apply_seconds_bucket{le="1"} 0',
+        'apply_seconds_bucket{le="+Inf"} 0',
+        "apply_seconds_sum 0",
+        "apply_seconds_count 0",
+    ]
+
+
+def test_timed_lock_records_hold_times():
+    registry = MetricsRegistry()
+    hold = Histogram("lock_hold_seconds", "Lock hold time.", buckets=(10.0,), registry=registry)
+    lock = TimedLock(hold)
+
+    for _ in range(3):
+        with lock:
+            assert lock._lock.locked()
+    assert not lock._lock.locked()
+    with pytest.raises(RuntimeError):
+        with lock:
+            raise RuntimeError("released on error")
+    assert not lock._lock.locked()
+
+    lines = registry.expose().splitlines()
+    assert 'lock_hold_seconds_bucket{le="10"} 4' in lines
+    assert "lock_hold_seconds_count 4" in lines
+    (held,) = [float(line.split()[1]) for line in lines if line.startswith("lock_hold_seconds_sum ")]
+    assert 0 <= held < 10
+
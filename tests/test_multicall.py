@@ -0,0 +1,64 @@
+import pytest
+import requests
+from web3 import Web3
+from web3.exceptions import ContractLogicError
+
+from app.multicall import MulticallClient
+
+MULTICALL = "0xcA11bde05977b3631167028862bE2a173976CA11"
+
+
+def _client(fail) -> tuple[MulticallClient, list]:
+    """Client whose batches return their inputs; ``fail(batch, attempt)`` may raise instead."""
+    client = MulticallClient(Web3(Web3.HTTPProvider("http://unused")), MULTICALL, retry_backoff=0.0)
+    calls = []
+
+    def call_functions(functions, block_identifier=None):
+        batch = tuple(functions)
+        calls.append(batch)
+        fail(batch, calls.count(batch))
+        return [(value,) for value in batch]
+
+    client.call_functions = call_functions
+    return client, calls
+
+
+def test_transport_error_retries_same_range():
+    def fail(batch, attempt):
+        if attempt == 1:
+            raise requests.ConnectionError("connection reset")
+
+    client, calls = _client(fail)
+    assert client.call_all(list(range(8)), batch_size=8) == [(i,) for i in range(8)]
+    assert calls == [tuple(range(8))] * 2
+
+
+def test_transport_error_raised_after_max_retries():
+    def fail(batch, attempt):
+        raise requests.ConnectionError("connection refused")
+
+    client, calls = _client(fail)
+    with pytest.raises(requests.ConnectionError):
+        client.call_all(list(range(4)), batch_size=4)
+    assert len(calls) == client.max_retries + 1
+
+
+def test_capacity_error_bisects():
+    def fail(batch, attempt):
+        if len(batch) > 2:
+            raise ValueError("response size exceeded")
+
+    client, calls = _client(fail)
+    assert client.call_all(list(range(8)), batch_size=8) == [(i,) for i in range(8)]
+    assert max(len(batch) for batch in calls[1:]) <= 4
+
+
+def test_revert_bisects_to_the_bad_call():
+    def fail(batch, attempt):
+        if 5 in batch:
+            raise ContractLogicError("execution reverted")
+
+    client, calls = _client(fail)
+    with pytest.raises(ContractLogicError):
+        client.call_all(list(range(8)), batch_size=8)
+    assert calls.count((5,)) == 1
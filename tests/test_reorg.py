@@ -0,0 +1,143 @@
+from app.config import AppConfig, ChainConfig, PoolConfig, SnapshotConfig
+from app.state_machine import LiquidityStateMachine
+from app.tick_store import TickStore
+from app.types import LiquidityDeltaEvent, PriceState, Snapshot, SwapEvent
+from app.wss import WebsocketLogStream
+
+SNAPSHOT_BLOCK = 99
+
+
+class _SnapshotAdapter:
+    pool_address = "0x0000000000000000000000000000000000000001"
+
+    def fetch_snapshot(self) -> Snapshot:
+        return Snapshot(
+            TickStore(10),
+            PriceState(None, 0),
+            "uniswap_v3",
+            self.pool_address,
+            block_number=SNAPSHOT_BLOCK,
+            tick_spacing=10,
+        )
+
+
+def _machine() -> LiquidityStateMachine:
+    pool = PoolConfig(
+        pool_address=_SnapshotAdapter.pool_address,
+        protocol="uniswap_v3",
+        token0="USDT",
+        token1="TOKEN",
+        fee=500,
+        token0_decimals=18,
+        token1_decimals=18,
+    )
+    config = AppConfig(
+        chain=ChainConfig(name="test", rpc_url="", wss_url="", explorer=""),
+        pool=pool,
+        pools=[pool],
+        snapshot=SnapshotConfig(cache_dir=None),
+    )
+    return LiquidityStateMachine(None, config, {}, _SnapshotAdapter())
+
+
+def _mint(liquidity: int, block_number: int, block_hash: str, log_index: int = 0, removed: bool = False):
+    return LiquidityDeltaEvent(
+        "0xowner", -100, 100, liquidity, block_number, 0, "Mint", block_hash, log_index, removed
+    )
+
+
+def test_removed_logs_across_blocks_let_replacements_apply():
+    machine = _machine()
+    machine.apply_events([_mint(1000, 100, "0xa")])
+    machine.apply_events([_mint(2000, 101, "0xb")])
+    machine.apply_events([_mint(2000, 101, "0xb", removed=True), _mint(1000, 100, "0xa", removed=True)])
+    machine.apply_events([_mint(500, 100, "0xa2")])
+    machine.apply_events([_mint(700, 101, "0xb2")])
+    assert machine.profile.active_liquidity(0) == 1200
+
+
+def _swap(tick: int, block_number: int, block_hash: str, log_index: int = 0, removed: bool = False):
+    return SwapEvent("0xswap", 1 << 96, tick, 0, block_number, 0, "Swap", block_hash, log_index, removed)
+
+
+def test_removed_swap_restores_price_before_its_block():
+    machine = _machine()
+    machine.apply_events([_swap(10, 100, "0xa")])
+    machine.apply_events([_swap(20, 101, "0xb"), _swap(30, 101, "0xb", log_index=1)])
+    machine.apply_events([_swap(30, 101, "0xb", log_index=1, removed=True), _swap(20, 101, "0xb", removed=True)])
+    assert machine.snapshot.price_state.tick == 10
+    # 另一分叉上的 removed Swap 不影响价格
+    machine.apply_events([_swap(10, 100, "0xa0", removed=True)])
+    assert machine.snapshot.price_state.tick == 10
+
+
+def test_rollback_restores_price_before_first_rolled_back_swap():
+    machine = _machine()
+    machine.apply_events([_swap(10, 100, "0xa")])
+    machine.apply_events([_mint(1000, 101, "0xb", log_index=1), _swap(20, 101, "0xb", log_index=2)])
+    machine.apply_events([_swap(30, 102, "0xc")])
+    assert machine.check_canonical({100: "0xa", 101: "0xb2", 102: "0xc2"}.get) == 101
+    assert machine.snapshot.price_state.tick == 10
+    assert machine.profile.active_liquidity(0) == 0
+    # 替换区块里的 Swap 经 is_fork 回滚后照常生效
+    machine.apply_events([_swap(40, 101, "0xb2")])
+    machine.apply_events([_swap(50, 101, "0xb3")])
+    assert machine.snapshot.price_state.tick == 50
+
+
+def test_fork_rolls_back_watermark_of_unjournaled_block():
+    machine = _machine()
+    machine.apply_events([_mint(1000, 100, "0xa"), _mint(2000, 101, "0xb", log_index=3)])
+    # 同高度不同 hash：回滚 100 及之后，替换区块里的同一 logIndex 仍要应用
+    machine.apply_events([_mint(500, 100, "0xa2"), _mint(700, 101, "0xb2", log_index=3)])
+    assert machine.profile.active_liquidity(0) == 1200
+
+
+def test_canonical_check_rolls_back_replaced_block_without_logs():
+    machine = _machine()
+    machine.apply_events([_mint(1000, 100, "0xa")])
+    machine.apply_events([_mint(2000, 101, "0xb")])
+    # 101 被一个没有池子日志的区块替换，节点不会推送 removed 日志
+    canonical = {100: "0xA", 101: "0xc"}
+    assert machine.check_canonical(canonical.get) == 101
+    assert machine.profile.active_liquidity(0) == 1000
+    assert machine.check_canonical(canonical.get) is None
+    machine.apply_events([_mint(300, 102, "0xd")])
+    assert machine.profile.active_liquidity(0) == 1300
+
+
+def test_resume_block_redelivers_rolled_back_blocks():
+    stream = WebsocketLogStream("ws://unused", [], [])
+    for block_number, block_hash in ((100, "0xa"), (101, "0xb"), (102, "0xc")):
+        assert stream._accept({"blockNumber": hex(block_number), "blockHash": block_hash, "logIndex": "0x0"})
+    stream.last_complete_block = 102
+    stream.reorg_check = lambda: 101
+    assert stream._resume_block() == 101
+    assert stream._accept({"blockNumber": hex(101), "blockHash": "0xb", "logIndex": "0x0"})
+    stream.reorg_check = lambda: None
+    assert stream._resume_block() == 103
+
+
+def test_apply_events_returns_only_applied_events():
+    machine = _machine()
+    first = _mint(1000, 100, "0xa")
+    assert machine.apply_events([first, _mint(1000, 100, "0xa")]) == [first]
+    assert machine.apply_events([_mint(1000, 100, "0xa")]) == []
+    removed = _mint(1000, 100, "0xa", removed=True)
+    assert machine.apply_events([removed, _mint(1000, 100, "0xa", removed=True)]) == [removed]
+
+
+def test_live_replay_of_orphaned_fork_after_backfill_is_dropped():
+    stream = WebsocketLogStream("ws://unused", [], [])
+
+    def log(block_hash: str, index: int = 0, removed: bool = False) -> dict:
+        return {"blockNumber": hex(100), "blockHash": block_hash, "logIndex": hex(index), "removed": removed}
+
+    # 补齐已给出主链上的 100 (0xb)，补齐期间缓冲的实时消息还在重放被替换的 0xa
+    assert stream._accept(log("0xb"), backfilled=True)
+    assert not stream._accept(log("0xa"))
+    assert stream._accept(log("0xa", removed=True))
+    assert not stream._accept(log("0xb"))
+    # 0xb 被 removed 撤销后，新的替换区块照常放行
+    assert stream._accept(log("0xb", removed=True))
+    assert stream._accept(log("0xc", index=1))
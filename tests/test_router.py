@@ -0,0 +1,95 @@
+from pathlib import Path
+
+from eth_abi import encode
+from web3 import Web3
+
+import app.registry
+from app.abi_loader import _load_single_abi
+from app.config import AppConfig, ChainConfig, PoolConfig, SnapshotConfig
+from app.decoding import V3_MINT_TOPIC
+from app.protocols.uniswap_v3 import UniswapV3Adapter
+from app.registry import PoolRouter
+from app.state_machine import LiquidityStateMachine
+from app.tick_store import TickStore
+from app.types import PriceState, Snapshot
+
+ABI_DIR = Path(app.registry.__file__).with_name("abis")
+POOL_A = "0x00000000000000000000000000000000000000aa"
+POOL_B = "0x00000000000000000000000000000000000000bb"
+OWNER = "0x" + "22" * 20
+
+
+class _SnapshotAdapter(UniswapV3Adapter):
+    """V3 adapter (real log decoding) whose snapshot is empty and taken at a fixed block."""
+
+    def __init__(self, pool_address: str, block_number: int):
+        abi = _load_single_abi(ABI_DIR, "uniswap_v3_pool")
+        super().__init__(Web3(), pool_address, abi, "ws://unused", None, 18, 18)
+        self.block_number = block_number
+
+    def fetch_snapshot(self) -> Snapshot:
+        return Snapshot(TickStore(10), PriceState(None, 0), "uniswap_v3", self.pool_address, self.block_number, 10)
+
+
+def _machine(pool_address: str, snapshot_block: int) -> LiquidityStateMachine:
+    pool = PoolConfig(
+        pool_address=pool_address,
+        protocol="uniswap_v3",
+        token0="USDT",
+        token1="TOKEN",
+        fee=500,
+        token0_decimals=18,
+        token1_decimals=18,
+    )
+    config = AppConfig(
+        chain=ChainConfig(name="test", rpc_url="", wss_url="", explorer=""),
+        pool=pool,
+        pools=[pool],
+        snapshot=SnapshotConfig(cache_dir=None),
+    )
+    return LiquidityStateMachine(None, config, {}, _SnapshotAdapter(pool_address, snapshot_block))
+
+
+def _mint_log(address: str, block_number: int, amount: int) -> dict:
+    return {
+        "address": Web3.to_checksum_address(address),
+        "topics": [
+            V3_MINT_TOPIC,
+            Web3.to_hex(encode(["address"], [OWNER])),
+            Web3.to_hex(encode(["int24"], [-100])),
+            Web3.to_hex(encode(["int24"], [100])),
+        ],
+        "data": Web3.to_hex(encode(["address", "uint128", "uint256", "uint256"], [OWNER, amount, 0, 0])),
+        "blockNumber": hex(block_number),
+        "blockHash": f"0x{block_number:064x}",
+        "logIndex": "0x0",
+        "removed": False,
+    }
+
+
+def test_logs_at_or_before_snapshot_block_are_dropped():
+    router = PoolRouter({"a": _machine(POOL_A, 100), "b": _machine(POOL_B, 105)})
+    # 快照期间 spool 中积压的日志：两个池子的快照区块不同，
+    # 各自只应用晚于自己快照区块的部分
+    spooled = [
+        _mint_log(POOL_A, 99, 1),
+        _mint_log(POOL_A, 100, 10),
+        _mint_log(POOL_B, 101, 100),
+        _mint_log(POOL_A, 101, 1000),
+        _mint_log(POOL_B, 105, 10000),
+        _mint_log(POOL_A, 106, 100000),
+        _mint_log(POOL_B, 106, 1000000),
+        _mint_log("0x" + "cc" * 20, 107, 7),
+    ]
+
+    applied = router.process_batch(spooled)
+
+    assert [(label, event.block_number, event.liquidity_delta) for label, event in applied] == [
+        ("a", 101, 1000),
+        ("a", 106, 100000),
+        ("b", 106, 1000000),
+    ]
+    assert router.machines["a"].profile.active_liquidity(0) == 101000
+    assert router.machines["b"].profile.active_liquidity(0) == 1000000
+    # 重复投递 (补齐与实时订阅重叠) 由状态机去重
+    assert router.process_batch(spooled[-3:]) == []
@@ -0,0 +1,151 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app.config import AppConfig, ChainConfig, PoolConfig, SnapshotConfig
+from app.snapshot_store import _HEADER, SnapshotStore
+from app.state_machine import LiquidityStateMachine
+from app.tick_store import TickStore
+from app.types import PriceState, Snapshot, TickLiquidity
+
+POOL = "0x00000000000000000000000000000000000000Aa"
+MAX_UINT160 = 2**160 - 1
+
+
+def _snapshot(block_number: int = 1234, price_state: PriceState | None = None) -> Snapshot:
+    ticks = TickStore.from_columns(
+        60,
+        [-887220, -60, 0, 60, 887220],
+        [2**128 - 1, 5, 1, 5, 2**128 - 1],
+        [-(2**127), 5, 0, -5, 2**127 - 1],
+    )
+    return Snapshot(
+        ticks,
+        price_state or PriceState(sqrt_price_x96=MAX_UINT160, tick=-887271),
+        "uniswap_v3",
+        POOL,
+        block_number=block_number,
+        tick_spacing=60,
+    )
+
+
+def _columns(snapshot: Snapshot):
+    return TickStore.from_mapping(snapshot.tick_spacing, snapshot.ticks).columns()
+
+
+@pytest.mark.parametrize(
+    "price_state", [PriceState(sqrt_price_x96=MAX_UINT160, tick=-887271), PriceState(None, 0), PriceState(None, None)]
+)
+def test_round_trip(tmp_path, price_state):
+    store = SnapshotStore(tmp_path / "cache" / "pool.bin")
+    snapshot = _snapshot(price_state=price_state)
+    store.save(snapshot, POOL, [0, 3, 2**32 - 1])
+
+    cached = store.load("uniswap_v3", POOL, POOL.lower())
+    assert cached.head_log_indices == [0, 3, 2**32 - 1]
+    assert cached.snapshot.block_number == 1234
+    assert cached.snapshot.tick_spacing == 60
+    assert cached.snapshot.price_state == PriceState(price_state.sqrt_price_x96 or None, price_state.tick)
+    assert _columns(cached.snapshot) == _columns(snapshot)
+    assert cached.snapshot.ticks[-60] == TickLiquidity(-60, 0, 5, 5)
+    assert not list(tmp_path.glob("cache/*.tmp"))
+
+
+def test_plain_dict_ticks_round_trip(tmp_path):
+    store = SnapshotStore(tmp_path / "pool.bin")
+    snapshot = _snapshot()
+    snapshot.ticks = {tick: entry for tick, entry in snapshot.ticks.items()}
+    store.save(snapshot, POOL, [])
+
+    assert _columns(store.load("uniswap_v3", POOL, POOL).snapshot) == _columns(_snapshot())
+
+
+@pytest.mark.parametrize(
+    "protocol, pool_key",
+    [("pancakeswap_v3", POOL), ("uniswap_v3", "0x" + "bb" * 20), ("uniswap_v4", f"{POOL}/0x{'11' * 32}")],
+)
+def test_cache_of_another_pool_is_rejected(tmp_path, protocol, pool_key):
+    store = SnapshotStore(tmp_path / "pool.bin")
+    store.save(_snapshot(), POOL, [])
+
+    assert store.load(protocol, POOL, pool_key) is None
+
+
+@pytest.mark.parametrize("damage", ["truncate", "magic", "version"])
+def test_unreadable_cache_is_rejected(tmp_path, damage):
+    path = tmp_path / "pool.bin"
+    SnapshotStore(path).save(_snapshot(), POOL, [1])
+    data = bytearray(path.read_bytes())
+    if damage == "truncate":
+        data = data[: _HEADER.size + 10]
+    elif damage == "magic":
+        data[:4] = b"XXXX"
+    else:
+        data[4] += 1
+    path.write_bytes(bytes(data))
+
+    assert SnapshotStore(path).load("uniswap_v3", POOL, POOL) is None
+    assert SnapshotStore(tmp_path / "missing.bin").load("uniswap_v3", POOL, POOL) is None
+
+
+class _Adapter:
+    pool_address = POOL
+
+    def __init__(self):
+        self.fetched = 0
+        self.replayed: list[tuple[int, int]] = []
+        self.stream = SimpleNamespace(last_complete_block=0)
+
+    def fetch_snapshot(self) -> Snapshot:
+        self.fetched += 1
+        return Snapshot(TickStore(60), PriceState(None, 0), "uniswap_v3", POOL, block_number=5000, tick_spacing=60)
+
+    def replay_events(self, from_block: int, to_block: int):
+        self.replayed.append((from_block, to_block))
+        return []
+
+
+def _machine(cache_dir, head: int) -> tuple[LiquidityStateMachine, _Adapter]:
+    pool = PoolConfig(
+        pool_address=POOL,
+        protocol="uniswap_v3",
+        token0="USDT",
+        token1="TOKEN",
+        fee=3000,
+        token0_decimals=18,
+        token1_decimals=18,
+        tick_spacing=60,
+    )
+    config = AppConfig(
+        chain=ChainConfig(name="test", rpc_url="", wss_url="", explorer=""),
+        pool=pool,
+        pools=[pool],
+        snapshot=SnapshotConfig(cache_dir=str(cache_dir), max_catch_up_blocks=100),
+    )
+    adapter = _Adapter()
+    web3 = SimpleNamespace(eth=SimpleNamespace(block_number=head))
+    return LiquidityStateMachine(web3, config, {}, adapter), adapter
+
+
+def test_machine_warm_starts_from_recent_cache(tmp_path):
+    machine, adapter = _machine(tmp_path, head=1234)
+    machine.store.save(_snapshot(), POOL, [7])
+
+    machine, adapter = _machine(tmp_path, head=1300)
+    assert adapter.fetched == 0
+    assert adapter.replayed == [(1234, 1300)]
+    # 补齐区间内没有事件：状态停在缓存区块，订阅从链头之后继续
+    assert machine.start_block == 1234
+    assert adapter.stream.last_complete_block == 1300
+    assert _columns(machine.snapshot) == _columns(_snapshot())
+
+
+def test_machine_rejects_cache_from_too_old_block(tmp_path):
+    machine, _ = _machine(tmp_path, head=1234)
+    machine.store.save(_snapshot(), POOL, [7])
+
+    machine, adapter = _machine(tmp_path, head=1234 + 101)
+    assert adapter.fetched == 1
+    assert adapter.replayed == []
+    assert machine.start_block == 5000
+    assert len(machine.profile.ticks) == 0
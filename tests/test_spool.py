@@ -0,0 +1,60 @@
+import threading
+
+from app.spool import LogSpool
+
+
+def _log(i: int) -> dict:
+    return {"blockNumber": hex(i), "logIndex": "0x0", "topics": [f"0x{i:064x}"]}
+
+
+def test_spill_keeps_fifo_order(tmp_path):
+    spool = LogSpool(memory_limit=3, spill_dir=str(tmp_path))
+    for i in range(5):
+        spool.put((float(i), _log(i)))
+    assert len(spool) == 5
+    assert spool.total_spilled == 2
+    assert len(list(tmp_path.iterdir())) == 1
+
+    received = [spool.get_nowait() for _ in range(2)]
+    # 内存有空位后，新日志仍排在已溢出的日志之后
+    for i in range(5, 8):
+        spool.put((float(i), _log(i)))
+    assert spool.total_spilled == 5
+    received += [spool.get(timeout=1) for _ in range(6)]
+    assert [received_at for received_at, _ in received] == list(range(8))
+    assert [raw_log for _, raw_log in received] == [_log(i) for i in range(8)]
+    assert spool.get_nowait() is None
+    assert not list(tmp_path.iterdir())
+
+    # 溢出文件读完后重新回到内存
+    spool.put((8.0, _log(8)))
+    assert spool.total_spilled == 5
+    assert spool.get_nowait() == (8.0, _log(8))
+
+
+def test_concurrent_producer_consumer_order(tmp_path):
+    spool = LogSpool(memory_limit=16, spill_dir=str(tmp_path))
+    count = 2000
+
+    def produce():
+        for i in range(count):
+            spool.put((float(i), _log(i)))
+
+    producer = threading.Thread(target=produce)
+    producer.start()
+    received = [spool.get(timeout=5)[0] for _ in range(count)]
+    producer.join()
+
+    assert received == list(range(count))
+    assert len(spool) == 0
+
+
+def test_close_removes_spill_file(tmp_path):
+    spool = LogSpool(memory_limit=1, spill_dir=str(tmp_path))
+    for i in range(3):
+        spool.put((float(i), _log(i)))
+    assert list(tmp_path.iterdir())
+
+    spool.close()
+    assert not list(tmp_path.iterdir())
+    assert len(spool) == 0
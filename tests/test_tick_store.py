@@ -0,0 +1,110 @@
+import random
+
+import pytest
+
+from app.protocols.bitmap import MAX_TICK, MIN_TICK
+from app.tick_store import _PAGE_BITS, TickStore
+from app.types import TickLiquidity
+
+SPACING = 10
+PAGE = SPACING << _PAGE_BITS
+MAX_UINT128 = 2**128 - 1
+MIN_INT128, MAX_INT128 = -(2**127), 2**127 - 1
+
+
+def test_add_returns_page_and_net_change():
+    store = TickStore(SPACING)
+    page = store.page_index(-20)
+
+    assert store.add(-20, 5, 5) == (page, 5)
+    assert store.add(-20, 3, -3) == (page, -3)
+    assert store[-20] == TickLiquidity(-20, -10, 8, 2)
+    # 没有已初始化的 tick 时，负的 gross 不会插入
+    assert store.add(-30, -1, 1) == (page, 0)
+    assert -30 not in store and len(store) == 1
+
+
+def test_tick_deleted_with_remaining_net_when_gross_reaches_zero():
+    store = TickStore(SPACING)
+    store.add(100, 7, 7)
+    store.add(100, 2, -2)
+    page = store.page_index(100)
+
+    assert store.add(100, -9, 123) == (page, -5)
+    assert 100 not in store and len(store) == 0
+    assert store._pages[page] is None
+    assert list(store.page_net_sums()) == []
+
+
+@pytest.mark.parametrize(
+    "below, above",
+    [
+        (PAGE - SPACING, PAGE),
+        (-SPACING, 0),
+        (-PAGE - SPACING, -PAGE),
+    ],
+)
+def test_page_boundaries(below, above):
+    store = TickStore(SPACING)
+    # 页边界两侧的 tick 落在相邻页 (负 tick 按向下取整压缩)
+    assert store.page_index(above) == store.page_index(below) + 1
+    store.add(below, 4, 4)
+    store.add(above, 4, -4)
+
+    assert list(store) == [below, above]
+    assert store.page_net_through(below) == 4
+    assert store.page_net_through(above) == -4
+    assert list(store.net_between(below - 1, above + 1)) == [(below, 4), (above, -4)]
+    assert list(store.net_between(below, above)) == []
+
+
+def test_out_of_range_tick():
+    store = TickStore(SPACING)
+    with pytest.raises(ValueError):
+        store.page_index(MAX_TICK + PAGE)
+    assert MIN_TICK - PAGE not in store
+
+
+@pytest.mark.parametrize("gross, net", [(MAX_UINT128, MIN_INT128), (MAX_UINT128, MAX_INT128), (1, -1), (1, 0)])
+def test_int128_round_trip(gross, net):
+    store = TickStore(SPACING)
+    store[-887270] = TickLiquidity(-887270, -887260, gross, net)
+
+    assert store[-887270].liquidity == gross
+    assert store[-887270].liquidity_net == net
+    assert store.columns()[1:] == ([gross], [net])
+
+
+def test_matches_dict_model_and_page_sums():
+    rng = random.Random(17)
+    store = TickStore(SPACING)
+    model: dict[int, list[int]] = {}
+    candidates = [tick * SPACING for tick in range(-3 << _PAGE_BITS, 3 << _PAGE_BITS, 7)]
+    for _ in range(4000):
+        tick = rng.choice(candidates)
+        # 大额 delta 让页内求和走 NumPy limb 路径并覆盖 int128 的高位
+        delta = rng.choice([1, 2**64, 2**100]) * rng.choice([1, -1])
+        net = delta * rng.choice([1, -1])
+        page, change = store.add(tick, delta, net)
+        entry = model.get(tick)
+        if entry is None:
+            assert change == (net if delta > 0 else 0)
+            if delta > 0:
+                model[tick] = [delta, net]
+        elif entry[0] + delta <= 0:
+            assert change == -entry[1]
+            del model[tick]
+        else:
+            assert change == net
+            entry[0] += delta
+            entry[1] += net
+        assert page == store.page_index(tick)
+
+    assert list(store) == sorted(model)
+    assert {tick: (entry.liquidity, entry.liquidity_net) for tick, entry in store.items()} == {
+        tick: tuple(entry) for tick, entry in model.items()
+    }
+    sums: dict[int, int] = {}
+    for tick, (_, net) in model.items():
+        sums[store.page_index(tick)] = sums.get(store.page_index(tick), 0) + net
+    assert dict(store.page_net_sums()) == sums